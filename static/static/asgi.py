@@ -4,4 +4,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'static.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Импорт после get_asgi_application(): ему нужны настроенные настройки и приложения.
+from users.events import EventStreamApp  # noqa: E402
+
+# /events/ - поток Server-Sent Events (users.events), остальное - Django.
+application = EventStreamApp(django_application, path='/events/')
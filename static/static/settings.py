@@ -14,6 +14,9 @@ DB_USER = os.environ.get('DB_USER', 'postgres')
 DB_PASSWORD = os.environ.get('DB_PASSWORD')
 DATABASE_HOST = os.environ.get('DATABASE_HOST', 'db')
 DATABASE_PORT = os.environ.get('DATABASE_PORT', 5432)
+CACHE_URL = os.environ.get('CACHE_URL', 'redis://redis:6379/1')
+QUERY_BUDGET_ENABLED = os.environ.get('QUERY_BUDGET_ENABLED', '').lower() in ('1', 'true', 'yes')
+DB_JSON_RENDERING = os.environ.get('DB_JSON_RENDERING', '').lower() in ('1', 'true', 'yes')
 
 
 DEBUG = True
@@ -29,6 +32,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_celery_beat',
 
     'users',
@@ -48,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'users.middleware.QueryBudgetMiddleware',
     'silk.middleware.SilkyMiddleware',
 
 ]
@@ -91,6 +96,17 @@ DATABASES = {
 }
 
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': CACHE_URL,
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        },
+    }
+}
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -168,7 +184,27 @@ CELERY_TIMEZONE = 'UTC'
 
 CELERY_BEAT_SCHEDULE = {
     'update-daily-stats-at-midnight': {
-        'task': 'stats.tasks.update_daily_stats',
+        'task': 'stats.tasks.update_daily_statistics',
         'schedule': crontab(hour=0, minute=0),  # Запуск в полночь каждый день
     },
+    'flush-stats-counters': {
+        'task': 'stats.tasks.flush_stats_counters',
+        'schedule': crontab(),  # Каждую минуту переносим счётчики из Redis в таблицы статистики
+    },
+    'close-funnel-day': {
+        'task': 'stats.tasks.close_funnel_day',
+        'schedule': crontab(hour=0, minute=10),  # Закрываем вчерашний день воронки
+    },
+    'reconcile-counters': {
+        'task': 'users.tasks.reconcile_counters',
+        'schedule': crontab(hour=3, minute=30),  # Сверяем proposal_count/appeal_count с таблицами
+    },
+    'prune-changelog': {
+        'task': 'users.tasks.prune_changelog',
+        'schedule': crontab(hour=3, minute=45),  # Удаляем из журнала /sync/ строки старше срока хранения
+    },
+    'relay-outbox': {
+        'task': 'users.tasks.relay_outbox',
+        'schedule': timedelta(seconds=2),  # Разбираем outbox: статистика и события SSE по заказам, откликам и работам
+    },
 }
\ No newline at end of file
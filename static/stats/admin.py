@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import UserStats, OrderStats, ProposalStats
+from .models import UserStats, OrderStats, ProposalStats, CategoryFunnelStats
 
 admin.site.register(UserStats)
 admin.site.register(OrderStats)
 admin.site.register(ProposalStats)
+admin.site.register(CategoryFunnelStats)
@@ -0,0 +1,237 @@
+from datetime import datetime, time, timedelta
+from django.db import connection as db_connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django_redis import get_redis_connection
+from users.models import OutboxEvent
+from .models import UserStats, OrderStats, ProposalStats, CategoryFunnelStats
+
+# Дневные счётчики копятся в Redis-хеше на каждый день и периодически
+# переносятся в таблицы статистики задачей flush_stats_counters.
+COUNTERS_KEY = 'stats:counters:{date}'
+PENDING_DATES_KEY = 'stats:counters:dates'
+FLUSH_LOCK_KEY = 'stats:counters:flush-lock'
+# Пересчёт по таблицам держит ту же блокировку, что и перенос, и дольше: диапазон может быть большим.
+REBUILD_LOCK_TIMEOUT = 3600
+REBUILD_LOCK_WAIT = 60
+# Версия данных статистики: меняется при каждом переносе/пересчёте и входит в ключи кэша и ETag API.
+STATS_VERSION_KEY = 'stats:version'
+
+COUNTER_MODELS = {
+    'registered_users': UserStats,
+    'created_orders': OrderStats,
+    'created_proposals': ProposalStats,
+}
+
+# Счётчики воронки хранятся в том же хеше под полями "funnel:<category_id>:<metric>".
+FUNNEL_PREFIX = 'funnel'
+FUNNEL_METRICS = (
+    'orders_created',
+    'orders_with_first_proposal',
+    'proposals_created',
+    'proposals_approved',
+    'jobs_created',
+    'jobs_completed',
+    'appeals_created',
+)
+
+
+def increment(field, amount=1, date=None):
+    date = date or timezone.now().date()
+    connection = get_redis_connection('default')
+    pipe = connection.pipeline(transaction=False)
+    pipe.hincrby(COUNTERS_KEY.format(date=date.isoformat()), field, amount)
+    pipe.sadd(PENDING_DATES_KEY, date.isoformat())
+    pipe.execute()
+
+
+# Отметка, что инкременты события outbox уже сделаны (или учтены пересчётом): повторная доставка
+# их не повторит. Срок - с запасом на события, которые долго не обрабатывались из-за ошибок.
+HANDLED_EVENT_KEY = 'stats:counters:event:{event}'
+HANDLED_EVENT_TIMEOUT = 14 * 24 * 60 * 60
+# Пока день пересчитывается по таблицам, инкременты событий outbox за него не принимаются.
+REBUILDING_KEY = 'stats:counters:rebuilding:{date}'
+# Отметка и инкременты - одним скриптом, чтобы сбой между ними не потерял и не задвоил счётчики.
+INCREMENT_ONCE_SCRIPT = """
+if redis.call('EXISTS', KEYS[4]) == 1 then
+    return -1
+end
+if not redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[1]) then
+    return 0
+end
+for i = 3, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[2], ARGV[i], ARGV[i + 1])
+end
+redis.call('SADD', KEYS[3], ARGV[2])
+return 1
+"""
+
+
+class DayRebuilding(Exception):
+    """
+    День события сейчас пересчитывается по таблицам. Обработчик outbox падает с этой ошибкой,
+    и событие обрабатывается следующим запуском relay.
+    """
+
+
+def event_token(event):
+    # id последовательности может начаться заново (пересозданная таблица), время создания - нет.
+    return f'{event.pk}:{event.created_at.timestamp()}'
+
+
+def increment_once(event, fields, date):
+    """
+    Увеличивает счётчики fields ({поле хеша: величина}) за день date один раз для события outbox.
+    Возвращает False, если инкременты этого события уже были сделаны или учтены пересчётом.
+    """
+    args = [HANDLED_EVENT_TIMEOUT, date.isoformat()]
+    for field, amount in fields.items():
+        args += [field, amount]
+    keys = [
+        HANDLED_EVENT_KEY.format(event=event_token(event)),
+        COUNTERS_KEY.format(date=date.isoformat()),
+        PENDING_DATES_KEY,
+        REBUILDING_KEY.format(date=date.isoformat()),
+    ]
+    result = get_redis_connection('default').eval(INCREMENT_ONCE_SCRIPT, len(keys), *keys, *args)
+    if result == -1:
+        raise DayRebuilding(date)
+    return bool(result)
+
+
+def increment_on_commit(field, amount=1):
+    # Счётчик увеличивается только после коммита; недоступный Redis не роняет запрос. Потерянные
+    # инкременты восстанавливает ночной update_daily_statistics: он пересчитывает по таблицам последние
+    # RECOMPUTE_DAYS дней (кроме appeals_created, у жалоб нет времени создания).
+    transaction.on_commit(lambda: increment(field, amount), robust=True)
+
+
+def funnel_field(category_id, metric):
+    return f'{FUNNEL_PREFIX}:{category_id}:{metric}'
+
+
+def increment_funnel_on_commit(category_id, metric, amount=1):
+    increment_on_commit(funnel_field(category_id, metric), amount)
+
+
+def counter_target(field):
+    """
+    Модель, lookup строки и колонка для поля хеша; None для неизвестных полей.
+    """
+    if field in COUNTER_MODELS:
+        return COUNTER_MODELS[field], {}, field
+    prefix, _, rest = field.partition(':')
+    category_id, _, metric = rest.partition(':')
+    if prefix == FUNNEL_PREFIX and category_id.isdigit() and metric in FUNNEL_METRICS:
+        return CategoryFunnelStats, {'category_id': int(category_id)}, metric
+    return None
+
+
+def get_version():
+    return int(get_redis_connection('default').get(STATS_VERSION_KEY) or 0)
+
+
+def bump_version():
+    return get_redis_connection('default').incr(STATS_VERSION_KEY)
+
+
+def flush():
+    connection = get_redis_connection('default')
+    lock = connection.lock(FLUSH_LOCK_KEY, timeout=300, blocking=False)
+    if not lock.acquire():
+        return 0
+    try:
+        return _flush(connection)
+    finally:
+        lock.release()
+
+
+def _flush(connection):
+    today = timezone.now().date().isoformat()
+    flushed = 0
+
+    for raw_date in sorted(connection.smembers(PENDING_DATES_KEY)):
+        date = raw_date.decode()
+        key = COUNTERS_KEY.format(date=date)
+        counters = {field.decode(): int(value) for field, value in connection.hgetall(key).items()}
+        counters = {field: value for field, value in counters.items() if value and counter_target(field)}
+
+        with transaction.atomic():
+            for field, amount in counters.items():
+                model, lookup, column = counter_target(field)
+                stats, created = model.objects.get_or_create(date=date, **lookup, defaults={column: amount})
+                if not created:
+                    model.objects.filter(pk=stats.pk).update(**{column: F(column) + amount})
+
+        # Вычитаем ровно перенесённое: инкременты, пришедшие во время переноса, остаются в хеше.
+        pipe = connection.pipeline(transaction=False)
+        for field, amount in counters.items():
+            pipe.hincrby(key, field, -amount)
+        pipe.execute()
+        flushed += sum(counters.values())
+
+        if date < today and not any(int(value) for value in connection.hvals(key)):
+            pipe = connection.pipeline(transaction=True)
+            pipe.delete(key)
+            pipe.srem(PENDING_DATES_KEY, raw_date)
+            pipe.execute()
+
+    if flushed:
+        bump_version()
+    return flushed
+
+
+def rebuild_days(dates, targets, rebuild):
+    """
+    Пересчитывает статистику за дни dates функцией rebuild() и убирает из Redis то, что пересчёт уже
+    учёл (targets - пары (модель, колонка), которые он перезаписывает), чтобы flush() не добавил это
+    сверху:
+
+    - инкременты в хешах этих дней. Они читаются после того, как дни закрыты для инкрементов outbox
+      (increment_once), и до пересчёта, поэтому все их строки попадут в пересчёт;
+    - события outbox за эти дни, ещё не обработанные relay. Они читаются в одном снимке БД с
+      таблицами: строки этих событий уже посчитаны, и событиям ставится отметка increment_once.
+      События транзакций, зафиксированных после снимка, посчитает relay, когда дни откроются.
+
+    Перенос на это время ждёт блокировку.
+    """
+    connection = get_redis_connection('default')
+    keys = [COUNTERS_KEY.format(date=date.isoformat()) for date in dates]
+    closed = [REBUILDING_KEY.format(date=date.isoformat()) for date in dates]
+    with connection.lock(FLUSH_LOCK_KEY, timeout=REBUILD_LOCK_TIMEOUT, blocking_timeout=REBUILD_LOCK_WAIT):
+        pipe = connection.pipeline(transaction=False)
+        for key in closed:
+            pipe.set(key, 1, ex=REBUILD_LOCK_TIMEOUT)
+        pipe.execute()
+        try:
+            pipe = connection.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(key)
+            pending = {}
+            for key, counters in zip(keys, pipe.execute()):
+                for field, value in counters.items():
+                    field, value = field.decode(), int(value)
+                    target = counter_target(field)
+                    if value and target and (target[0], target[2]) in targets:
+                        pending[key, field] = value
+
+            start_at = timezone.make_aware(datetime.combine(dates[0], time.min))
+            end_at = timezone.make_aware(datetime.combine(dates[-1] + timedelta(days=1), time.min))
+            nested = db_connection.in_atomic_block
+            with transaction.atomic():
+                if not nested:
+                    # Таблицы и очередь outbox - из одного снимка.
+                    with db_connection.cursor() as cursor:
+                        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                rebuild()
+                counted = list(OutboxEvent.objects.filter(created_at__gte=start_at, created_at__lt=end_at))
+
+            pipe = connection.pipeline(transaction=False)
+            for event in counted:
+                pipe.set(HANDLED_EVENT_KEY.format(event=event_token(event)), 1, nx=True, ex=HANDLED_EVENT_TIMEOUT)
+            for (key, field), value in pending.items():
+                pipe.hincrby(key, field, -value)
+            pipe.execute()
+        finally:
+            connection.delete(*closed)
+    bump_version()
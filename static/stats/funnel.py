@@ -0,0 +1,43 @@
+from datetime import datetime, time, timedelta
+from django.db.models import Aggregate, DurationField, F
+from django.utils import timezone
+from users.models import Order
+from .counters import flush, bump_version
+from .models import CategoryFunnelStats
+
+
+class Median(Aggregate):
+    function = 'PERCENTILE_CONT'
+    name = 'Median'
+    template = '%(function)s(0.5) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = DurationField()
+
+
+def close_day(date):
+    """
+    Закрывает день воронки: переносит накопленные счётчики и считает медиану времени
+    до первого отклика только по заказам, получившим первый отклик в этот день.
+    """
+    flush()
+
+    start_at = timezone.make_aware(datetime.combine(date, time.min))
+    end_at = start_at + timedelta(days=1)
+    medians = (
+        Order.objects
+        .filter(first_proposal_at__gte=start_at, first_proposal_at__lt=end_at)
+        .values('category_id')
+        .annotate(median=Median(F('first_proposal_at') - F('created_at')))
+        .order_by()
+    )
+    CategoryFunnelStats.objects.bulk_create(
+        [
+            CategoryFunnelStats(date=date, category_id=row['category_id'], median_time_to_first_proposal=row['median'], is_closed=True)
+            for row in medians
+        ],
+        update_conflicts=True,
+        unique_fields=['date', 'category'],
+        update_fields=['median_time_to_first_proposal', 'is_closed'],
+    )
+    closed = CategoryFunnelStats.objects.filter(date=date).update(is_closed=True)
+    bump_version()
+    return closed
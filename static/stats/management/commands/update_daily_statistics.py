@@ -1,25 +1,139 @@
 # your_app/management/commands/update_daily_statistics.py
 
-from django.core.management.base import BaseCommand
+from datetime import date, datetime, time, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Exists, Min, OuterRef, Q
+from django.db.models.functions import TruncDay
 from django.utils import timezone
-from stats.models import UserStats, OrderStats, ProposalStats
-from users.models import CustomUser, Order, Proposal
+from stats.counters import rebuild_days
+from stats.models import UserStats, OrderStats, ProposalStats, CategoryFunnelStats
+from users.models import CustomUser, Order, Proposal, Job, JobStatusEvent
+from users.status import JobStatusChoices
+
+# (модель статистики, поле счётчика, исходная модель, поле времени создания)
+DAILY_STATISTICS = [
+    (UserStats, 'registered_users', CustomUser, 'date_created'),
+    (OrderStats, 'created_orders', Order, 'created_at'),
+    (ProposalStats, 'created_proposals', Proposal, 'created_at'),
+]
+# Первые отклики на заказы. Считаются по откликам, а не по Order.first_proposal_at: его ставит
+# обработчик outbox, и для событий, которые relay ещё не разобрал, он пуст.
+FIRST_PROPOSALS = Proposal.objects.filter(~Exists(
+    Proposal.objects.filter(order=OuterRef('order')).filter(
+        Q(created_at__lt=OuterRef('created_at')) | Q(created_at=OuterRef('created_at'), pk__lt=OuterRef('pk'))
+    )
+))
+# (метрика воронки, исходная модель или queryset, поле времени, путь к категории, фильтр). appeals_created
+# не пересчитывается: у жалоб нет времени создания, она остаётся на живых счётчиках.
+FUNNEL_STATISTICS = [
+    ('orders_created', Order, 'created_at', 'category_id', {}),
+    ('orders_with_first_proposal', FIRST_PROPOSALS, 'created_at', 'order__category_id', {}),
+    ('proposals_created', Proposal, 'created_at', 'order__category_id', {}),
+    ('proposals_approved', Job, 'created_at', 'order__category_id', {}),
+    ('jobs_created', Job, 'created_at', 'order__category_id', {}),
+    ('jobs_completed', JobStatusEvent, 'created_at', 'job__order__category_id', {'to_status': JobStatusChoices.COMPLETED}),
+]
+# Без --start последние дни пересчитываются всегда, даже если строки статистики за них есть:
+# живые счётчики могли потерять инкременты (недоступный Redis) или посчитать событие дважды.
+RECOMPUTE_DAYS = 3
+
+
+def count_by_day(source, created_field, start_at, end_at, *group_by, **filters):
+    queryset = source.objects.all() if isinstance(source, type) else source.all()
+    # Полуоткрытый диапазон по самой колонке, чтобы работал индекс по времени создания.
+    return (
+        queryset
+        .filter(**{f'{created_field}__gte': start_at, f'{created_field}__lt': end_at}, **filters)
+        .annotate(day=TruncDay(created_field))
+        .values('day', *group_by)
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+
+
 class Command(BaseCommand):
-    help = "Update daily statistics"
+    help = ("Rebuild daily and funnel statistics for a date range (inclusive) from the tables. Without --start, "
+            "recomputes the last days and every earlier day missing in a stats table. Today is left to the live counters.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help="First day, YYYY-MM-DD")
+        parser.add_argument('--end', type=date.fromisoformat, help="Last day, YYYY-MM-DD (default: yesterday)")
+
+    def handle(self, *args, **options):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        end = min(options['end'] or yesterday, yesterday)
+        start = options['start'] or self.default_start(end)
+
+        if start is None:
+            self.stdout.write(self.style.SUCCESS('Daily statistics are already up to date.'))
+            return
+        if start > end:
+            raise CommandError(f"Nothing to rebuild: start {start} is after {end}.")
+
+        days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        targets = {(stats_model, counter) for stats_model, counter, _, _ in DAILY_STATISTICS}
+        targets |= {(CategoryFunnelStats, metric) for metric, *_ in FUNNEL_STATISTICS}
+        # Ожидающие переноса инкременты этих дней вычитаются в том же шаге, иначе flush() добавил бы их к пересчёту.
+        rebuild_days(days, targets, lambda: self.rebuild(days))
+        self.stdout.write(self.style.SUCCESS(f'Successfully updated daily statistics for {start} - {end} ({len(days)} days).'))
+
+    def rebuild(self, days):
+        start_at = timezone.make_aware(datetime.combine(days[0], time.min))
+        end_at = timezone.make_aware(datetime.combine(days[-1] + timedelta(days=1), time.min))
 
-    def handle(self, *args, **kwargs):
-        today = timezone.now().date()
+        with transaction.atomic():
+            for stats_model, counter, source_model, created_field in DAILY_STATISTICS:
+                totals = {row['day'].date(): row['total'] for row in count_by_day(source_model, created_field, start_at, end_at)}
+                stats_model.objects.bulk_create(
+                    [stats_model(date=day, **{counter: totals.get(day, 0)}) for day in days],
+                    update_conflicts=True,
+                    unique_fields=['date'],
+                    update_fields=[counter],
+                    batch_size=1000,
+                )
 
-        # Collect statistics for users registered
-        registered_users = CustomUser.objects.filter(date_created__date=today).count()
-        UserStats.objects.update_or_create(date=today, defaults={'registered_users': registered_users})
+            metrics = [metric for metric, *_ in FUNNEL_STATISTICS]
+            funnel = {}
+            for metric, source, created_field, category_path, filters in FUNNEL_STATISTICS:
+                for row in count_by_day(source, created_field, start_at, end_at, category_path, **filters):
+                    if row[category_path] is not None:
+                        funnel.setdefault((row['day'].date(), row[category_path]), {})[metric] = row['total']
+            # Строки воронки есть только у категорий с событиями: сначала обнуляем диапазон, потом пишем итоги.
+            CategoryFunnelStats.objects.filter(date__gte=days[0], date__lte=days[-1]).update(**{metric: 0 for metric in metrics})
+            CategoryFunnelStats.objects.bulk_create(
+                [
+                    CategoryFunnelStats(date=day, category_id=category_id, **{metric: totals.get(metric, 0) for metric in metrics})
+                    for (day, category_id), totals in funnel.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['date', 'category'],
+                update_fields=metrics,
+                batch_size=1000,
+            )
 
-        # Collect statistics for orders created
-        created_orders = Order.objects.filter(created_at__date=today).count()
-        OrderStats.objects.update_or_create(date=today, defaults={'created_orders': created_orders})
+    def default_start(self, end):
+        first_days = [
+            source_model.objects.aggregate(first=Min(created_field))['first']
+            for _, _, source_model, created_field in DAILY_STATISTICS
+        ]
+        first_days = [timezone.localtime(value).date() for value in first_days if value is not None]
+        if not first_days or min(first_days) > end:
+            return None
 
-        # Collect statistics for proposals created
-        created_proposals = Proposal.objects.filter(created_at__date=today).count()
-        ProposalStats.objects.update_or_create(date=today, defaults={'created_proposals': created_proposals})
+        first_day = min(first_days)
+        start = max(first_day, end - timedelta(days=RECOMPUTE_DAYS - 1))
+        missing = self.first_missing_day(first_day, end)
+        return min(start, missing) if missing else start
 
-        self.stdout.write(self.style.SUCCESS('Successfully updated daily statistics.'))
+    def first_missing_day(self, start, end):
+        expected = (end - start).days + 1
+        missing = []
+        for stats_model, _, _, _ in DAILY_STATISTICS:
+            present = set(stats_model.objects.filter(date__gte=start, date__lte=end).values_list('date', flat=True))
+            if len(present) < expected:
+                missing.append(next(
+                    start + timedelta(days=offset) for offset in range(expected)
+                    if start + timedelta(days=offset) not in present
+                ))
+        return min(missing) if missing else None
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0001_initial'),
+        ('users', '0030_order_first_proposal_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryFunnelStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders_created', models.IntegerField(default=0)),
+                ('orders_with_first_proposal', models.IntegerField(default=0)),
+                ('proposals_created', models.IntegerField(default=0)),
+                ('proposals_approved', models.IntegerField(default=0)),
+                ('jobs_created', models.IntegerField(default=0)),
+                ('jobs_completed', models.IntegerField(default=0)),
+                ('appeals_created', models.IntegerField(default=0)),
+                ('median_time_to_first_proposal', models.DurationField(blank=True, null=True)),
+                ('is_closed', models.BooleanField(default=False)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='funnel_stats', to='users.category')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='categoryfunnelstats',
+            constraint=models.UniqueConstraint(fields=('date', 'category'), name='stats_funnel_date_category_uniq'),
+        ),
+    ]
@@ -21,3 +21,40 @@ class ProposalStats(models.Model):
 
     def __str__(self):
         return f"Proposal Stats for {self.date} - Created Proposals: {self.created_proposals}"
+
+class CategoryFunnelStats(models.Model):
+    """
+    Дневная воронка заказ -> отклик -> работа -> завершение по категориям.
+    Счётчики копятся инкрементально, медиана и is_closed выставляются при закрытии дня.
+    """
+    date = models.DateField()
+    category = models.ForeignKey('users.Category', on_delete=models.CASCADE, related_name='funnel_stats')
+    orders_created = models.IntegerField(default=0)
+    orders_with_first_proposal = models.IntegerField(default=0)
+    proposals_created = models.IntegerField(default=0)
+    proposals_approved = models.IntegerField(default=0)
+    jobs_created = models.IntegerField(default=0)
+    jobs_completed = models.IntegerField(default=0)
+    appeals_created = models.IntegerField(default=0)
+    median_time_to_first_proposal = models.DurationField(null=True, blank=True)
+    is_closed = models.BooleanField(default=False)
+
+    @property
+    def approval_rate(self):
+        return self.proposals_approved / self.proposals_created if self.proposals_created else None
+
+    @property
+    def completion_rate(self):
+        return self.jobs_completed / self.jobs_created if self.jobs_created else None
+
+    @property
+    def appeal_rate(self):
+        return self.appeals_created / self.jobs_created if self.jobs_created else None
+
+    def __str__(self):
+        return f"Funnel Stats for {self.date} - Category {self.category_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'category'], name='stats_funnel_date_category_uniq'),
+        ]
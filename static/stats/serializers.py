@@ -0,0 +1,47 @@
+from datetime import timedelta
+from django.utils import timezone
+from rest_framework import serializers
+from .models import CategoryFunnelStats
+
+MAX_RANGE_DAYS = 3 * 366
+DEFAULT_RANGE_DAYS = 30
+
+
+class StatsQuerySerializer(serializers.Serializer):
+    interval = serializers.ChoiceField(choices=['day', 'week', 'month'], default='day')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        end = attrs.get('end') or timezone.localdate()
+        start = attrs.get('start') or end - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+        if start > end:
+            raise serializers.ValidationError("start must not be after end.")
+        if (end - start).days >= MAX_RANGE_DAYS:
+            raise serializers.ValidationError(f"Range is limited to {MAX_RANGE_DAYS} days.")
+        attrs['start'] = start
+        attrs['end'] = end
+        return attrs
+
+
+class StatsBucketSerializer(serializers.Serializer):
+    period = serializers.DateField()
+    registered_users = serializers.IntegerField()
+    created_orders = serializers.IntegerField()
+    created_proposals = serializers.IntegerField()
+
+
+class FunnelQuerySerializer(StatsQuerySerializer):
+    category = serializers.IntegerField(required=False)
+
+
+class CategoryFunnelStatsSerializer(serializers.ModelSerializer):
+    approval_rate = serializers.FloatField(read_only=True)
+    completion_rate = serializers.FloatField(read_only=True)
+    appeal_rate = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = CategoryFunnelStats
+        fields = ['date', 'category', 'orders_created', 'orders_with_first_proposal', 'proposals_created',
+                  'proposals_approved', 'jobs_created', 'jobs_completed', 'appeals_created',
+                  'median_time_to_first_proposal', 'approval_rate', 'completion_rate', 'appeal_rate', 'is_closed']
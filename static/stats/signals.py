@@ -1,29 +1,58 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.utils import timezone
-from users.models import CustomUser, Order, Proposal
-from .models import UserStats, OrderStats, ProposalStats
+from django.utils.dateparse import parse_datetime
+from users.models import CustomUser, Order, Job, Appeal
+from users.outbox import outbox_handler
+from users.status import JobStatusChoices
+from .counters import funnel_field, increment_once, increment_on_commit, increment_funnel_on_commit
 
 @receiver(post_save, sender=CustomUser)
 def update_user_stats(sender, instance, created, **kwargs):
     if created:
-        today = timezone.now().date()
-        stats, _ = UserStats.objects.get_or_create(date=today)
-        stats.registered_users += 1
-        stats.save()
+        increment_on_commit('registered_users')
 
-@receiver(post_save, sender=Order)
-def update_order_stats(sender, instance, created, **kwargs):
-    if created:
-        today = timezone.now().date()
-        stats, _ = OrderStats.objects.get_or_create(date=today)
-        stats.created_orders += 1
-        stats.save()
+# Заказы, отклики и работы считаются по событиям outbox (users.outbox) вне запроса. Доставка
+# не реже одного раза, поэтому инкременты события делаются через increment_once: повторная
+# доставка их не повторяет, а событие, уже учтённое ночным пересчётом, не считается снова.
+# День счётчика - день события, а не обработки.
+
+@outbox_handler('order.created')
+def update_order_stats(event):
+    increment_once(event, {
+        'created_orders': 1,
+        funnel_field(event.payload['category'], 'orders_created'): 1,
+    }, event.created_at.date())
+
+@outbox_handler('proposal.created')
+def update_proposal_stats(event):
+    category_id = event.payload['category']
+    fields = {'created_proposals': 1, funnel_field(category_id, 'proposals_created'): 1}
+    # Отметка первого отклика откатится вместе с транзакцией relay, а счётчики в Redis - нет:
+    # при повторной доставке она снова вернёт True, но increment_once событие уже не посчитает.
+    if Order(pk=event.payload['order']).mark_first_proposal(parse_datetime(event.payload['created_at'])):
+        fields[funnel_field(category_id, 'orders_with_first_proposal')] = 1
+    increment_once(event, fields, event.created_at.date())
+
+def job_category(job_id):
+    return Job.objects.filter(pk=job_id).values_list('order__category_id', flat=True).first()
+
+@outbox_handler('job.created')
+def update_job_funnel_stats(event):
+    category_id = job_category(event.aggregate_id)
+    if category_id is not None:
+        increment_once(event, {
+            funnel_field(category_id, 'proposals_approved'): 1,
+            funnel_field(category_id, 'jobs_created'): 1,
+        }, event.created_at.date())
+
+@outbox_handler('job.status_changed')
+def update_job_completion_stats(event):
+    if event.payload['to_status'] == JobStatusChoices.COMPLETED:
+        category_id = job_category(event.aggregate_id)
+        if category_id is not None:
+            increment_once(event, {funnel_field(category_id, 'jobs_completed'): 1}, event.created_at.date())
 
-@receiver(post_save, sender=Proposal)
-def update_proposal_stats(sender, instance, created, **kwargs):
+@receiver(post_save, sender=Appeal)
+def update_appeal_funnel_stats(sender, instance, created, **kwargs):
     if created:
-        today = timezone.now().date()
-        stats, _ = ProposalStats.objects.get_or_create(date=today)
-        stats.created_proposals += 1
-        stats.save()
+        increment_funnel_on_commit(instance.job.order.category_id, 'appeals_created')
@@ -1,6 +1,19 @@
+from datetime import date, timedelta
 from celery import shared_task
 from django.core.management import call_command
+from django.utils import timezone
+from .counters import flush
+from .funnel import close_day
 
 @shared_task
 def update_daily_statistics():
-    call_command('update_daily_statistics')
\ No newline at end of file
+    call_command('update_daily_statistics')
+
+@shared_task
+def flush_stats_counters():
+    return flush()
+
+@shared_task
+def close_funnel_day(day=None):
+    day = date.fromisoformat(day) if day else timezone.localdate() - timedelta(days=1)
+    return close_day(day)
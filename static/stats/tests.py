@@ -1,3 +1,217 @@
+from datetime import date, timedelta
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from django.utils import timezone
+from django_redis import get_redis_connection
+from users.models import CustomUser, Category, Order, Proposal, Job, OutboxEvent
+from users.outbox import dispatch, relay
+from users.status import JobStatusChoices, ProposalStatusChoices
+from .counters import COUNTERS_KEY, PENDING_DATES_KEY, REBUILDING_KEY, flush, increment
+from .funnel import close_day
+from .models import UserStats, OrderStats, ProposalStats, CategoryFunnelStats
 
-# Create your tests here.
+
+class StatsCountersTestCases(TestCase):
+
+    def setUp(self):
+        self.today = timezone.now().date()
+        connection = get_redis_connection('default')
+        connection.delete(COUNTERS_KEY.format(date=self.today.isoformat()), PENDING_DATES_KEY)
+
+    def test_registration_is_buffered_until_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.create_user(user_id='7000001', password='testpassword')
+            CustomUser.objects.create_user(user_id='7000002', password='testpassword')
+        self.assertFalse(UserStats.objects.filter(date=self.today).exists())
+
+        self.assertEqual(flush(), 2)
+        self.assertEqual(UserStats.objects.get(date=self.today).registered_users, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.create_user(user_id='7000003', password='testpassword')
+        flush()
+        self.assertEqual(UserStats.objects.get(date=self.today).registered_users, 3)
+        self.assertEqual(flush(), 0)
+
+
+class UpdateDailyStatisticsTestCases(TestCase):
+
+    def test_rebuilds_range_with_zero_filled_days(self):
+        today = timezone.localdate()
+        user = CustomUser.objects.create_user(user_id='7100001', password='testpassword')
+        CustomUser.objects.create_user(user_id='7100002', password='testpassword')
+        CustomUser.objects.filter(pk=user.pk).update(date_created=timezone.now() - timedelta(days=3))
+        UserStats.objects.create(date=today - timedelta(days=3), registered_users=42)
+
+        call_command('update_daily_statistics', start=today - timedelta(days=4), stdout=StringIO())
+
+        counts = dict(UserStats.objects.values_list('date', 'registered_users'))
+        self.assertEqual(counts[today - timedelta(days=3)], 1)
+        self.assertEqual(counts[today - timedelta(days=4)], 0)
+        self.assertEqual(counts[today - timedelta(days=1)], 0)
+        self.assertNotIn(today, counts)
+        self.assertEqual(OrderStats.objects.count(), 4)
+
+    def test_fills_missing_days_by_default(self):
+        today = timezone.localdate()
+        user = CustomUser.objects.create_user(user_id='7100003', password='testpassword')
+        CustomUser.objects.filter(pk=user.pk).update(date_created=timezone.now() - timedelta(days=2))
+
+        call_command('update_daily_statistics', stdout=StringIO())
+        self.assertEqual(UserStats.objects.get(date=today - timedelta(days=2)).registered_users, 1)
+        self.assertEqual(ProposalStats.objects.count(), 2)
+
+    def test_recent_days_are_recomputed_without_double_counting_pending(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        key = COUNTERS_KEY.format(date=yesterday.isoformat())
+        connection = get_redis_connection('default')
+        connection.delete(key, PENDING_DATES_KEY)
+        customer = CustomUser.objects.create_user(user_id='7100004', password='testpassword', roles=['Customer'])
+        category = Category.objects.create(name='Ремонт')
+        order = Order.objects.create(owner=customer, category=category, description='Покраска', location='Юнусабад', price='100')
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=1))
+        CustomUser.objects.filter(pk=customer.pk).update(date_created=timezone.now() - timedelta(days=1))
+        # Строки за вчера уже есть, но расходятся с таблицами; в Redis ещё ждёт перенос вчерашний инкремент.
+        OrderStats.objects.create(date=yesterday, created_orders=5)
+        CategoryFunnelStats.objects.create(date=yesterday, category=category, orders_created=5, appeals_created=2)
+        increment('created_orders', date=yesterday)
+        increment('registered_users', date=yesterday)
+
+        call_command('update_daily_statistics', stdout=StringIO())
+        flush()
+
+        self.assertEqual(OrderStats.objects.get(date=yesterday).created_orders, 1)
+        self.assertEqual(UserStats.objects.get(date=yesterday).registered_users, 1)
+        funnel = CategoryFunnelStats.objects.get(date=yesterday, category=category)
+        self.assertEqual((funnel.orders_created, funnel.proposals_created, funnel.appeals_created), (1, 0, 2))
+
+    def test_events_relayed_after_rebuild_are_not_counted_twice(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        connection = get_redis_connection('default')
+        connection.delete(COUNTERS_KEY.format(date=yesterday.isoformat()), PENDING_DATES_KEY)
+        customer = CustomUser.objects.create_user(user_id='7100005', password='testpassword', roles=['Customer'])
+        worker = CustomUser.objects.create_user(user_id='7100006', password='testpassword', roles=['Worker'])
+        category = Category.objects.create(name='Ремонт')
+        order = Order.objects.create(owner=customer, category=category, description='Покраска', location='Юнусабад', price='100')
+        Proposal.objects.create(owner=worker, order=order, message='Готов', price='100')
+        # Заказ и отклик вчерашние, а их события outbox relay ещё не разобрал.
+        a_day_ago = timezone.now() - timedelta(days=1)
+        Order.objects.update(created_at=a_day_ago)
+        Proposal.objects.update(created_at=a_day_ago)
+        OutboxEvent.objects.update(created_at=a_day_ago)
+
+        call_command('update_daily_statistics', stdout=StringIO())
+        relay()
+        flush()
+
+        self.assertEqual(OrderStats.objects.get(date=yesterday).created_orders, 1)
+        self.assertEqual(ProposalStats.objects.get(date=yesterday).created_proposals, 1)
+        funnel = CategoryFunnelStats.objects.get(date=yesterday, category=category)
+        self.assertEqual((funnel.orders_created, funnel.proposals_created, funnel.orders_with_first_proposal), (1, 1, 1))
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_events_of_a_day_being_rebuilt_wait_for_the_rebuild(self):
+        customer = CustomUser.objects.create_user(user_id='7100007', password='testpassword', roles=['Customer'])
+        category = Category.objects.create(name='Ремонт')
+        Order.objects.create(owner=customer, category=category, description='Покраска', location='Юнусабад', price='100')
+        key = REBUILDING_KEY.format(date=timezone.now().date().isoformat())
+        connection = get_redis_connection('default')
+        connection.set(key, 1)
+        try:
+            with self.assertLogs('users.outbox', 'ERROR'):
+                relay()
+            self.assertEqual(OutboxEvent.objects.get(event_type='order.created').attempts, 1)
+        finally:
+            connection.delete(key)
+        relay()
+        self.assertFalse(OutboxEvent.objects.exists())
+
+
+class StatsAPITestCases(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = CustomUser.objects.create_user(user_id='7200001', password='testpassword', roles=['Admin'])
+        self.client.force_authenticate(user=self.admin)
+        OrderStats.objects.create(date=date(2024, 8, 5), created_orders=3)
+        OrderStats.objects.create(date=date(2024, 8, 7), created_orders=2)
+        OrderStats.objects.create(date=date(2024, 8, 12), created_orders=1)
+
+    def test_daily_series_is_zero_filled(self):
+        response = self.client.get(reverse('stats'), {'start': '2024-08-05', 'end': '2024-08-07'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['created_orders'] for row in response.data['results']], [3, 0, 2])
+        self.assertEqual(response.data['results'][1]['registered_users'], 0)
+
+    def test_weekly_and_monthly_rollups(self):
+        response = self.client.get(reverse('stats'), {'start': '2024-08-01', 'end': '2024-08-31', 'interval': 'week'})
+        weeks = {row['period']: row['created_orders'] for row in response.data['results']}
+        self.assertEqual(weeks['2024-08-05'], 5)
+        self.assertEqual(weeks['2024-08-12'], 1)
+
+        response = self.client.get(reverse('stats'), {'start': '2024-08-01', 'end': '2024-08-31', 'interval': 'month'})
+        self.assertEqual(response.data['results'], [{'period': '2024-08-01', 'registered_users': 0, 'created_orders': 6, 'created_proposals': 0}])
+
+    def test_etag_returns_not_modified(self):
+        params = {'start': '2024-08-01', 'end': '2024-08-31'}
+        response = self.client.get(reverse('stats'), params)
+        response = self.client.get(reverse('stats'), params, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(user=CustomUser.objects.create_user(user_id='7200002', password='testpassword', roles=['Worker']))
+        self.assertEqual(self.client.get(reverse('stats')).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class FunnelStatsTestCases(TestCase):
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        connection = get_redis_connection('default')
+        connection.delete(COUNTERS_KEY.format(date=self.today.isoformat()), PENDING_DATES_KEY)
+        self.customer = CustomUser.objects.create_user(user_id='7300001', password='testpassword', roles=['Customer'])
+        self.worker = CustomUser.objects.create_user(user_id='7300002', password='testpassword', roles=['Worker'])
+        self.category = Category.objects.create(name='Ремонт')
+
+    def test_funnel_counters_and_day_close(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(owner=self.customer, category=self.category, description='Покраска', location='Юнусабад', price='100')
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(hours=2))
+            first = Proposal.objects.create(owner=self.worker, order=order, message='Готов', price='100')
+            Proposal.objects.create(owner=self.customer, order=order, message='Тоже готов', price='90')
+            first.status = ProposalStatusChoices.APPROVED
+            first.save()
+            job = Job.objects.get(proposal=first)
+            job.transition(JobStatusChoices.PAYMENT)
+            Job.objects.filter(pk=job.pk).update(status=JobStatusChoices.REVIEW)
+            job.refresh_from_db()
+            job.transition(JobStatusChoices.COMPLETED)
+        relay()
+
+        self.assertEqual(close_day(self.today), 1)
+        stats = CategoryFunnelStats.objects.get(date=self.today, category=self.category)
+        self.assertEqual(
+            (stats.orders_created, stats.orders_with_first_proposal, stats.proposals_created,
+             stats.proposals_approved, stats.jobs_created, stats.jobs_completed, stats.appeals_created),
+            (1, 1, 2, 1, 1, 1, 0)
+        )
+        self.assertEqual(stats.approval_rate, 0.5)
+        self.assertEqual(stats.completion_rate, 1)
+        self.assertTrue(stats.is_closed)
+        self.assertAlmostEqual(stats.median_time_to_first_proposal.total_seconds(), 2 * 3600, delta=60)
+
+    def test_redelivered_events_are_counted_once(self):
+        order = Order.objects.create(owner=self.customer, category=self.category, description='Покраска', location='Юнусабад', price='100')
+        Proposal.objects.create(owner=self.worker, order=order, message='Готов', price='100')
+        events = list(OutboxEvent.objects.order_by('pk'))
+        for event in events + events:
+            dispatch(event)
+        flush()
+        stats = CategoryFunnelStats.objects.get(date=self.today, category=self.category)
+        self.assertEqual((stats.orders_created, stats.proposals_created, stats.orders_with_first_proposal), (1, 1, 1))
+        self.assertEqual(OrderStats.objects.get(date=self.today).created_orders, 1)
@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import StatsView, FunnelStatsView
+
+urlpatterns = [
+    path('stats/', StatsView.as_view(), name='stats'),
+    path('stats/funnel/', FunnelStatsView.as_view(), name='stats-funnel'),
+]
@@ -1,3 +1,97 @@
-from django.shortcuts import render
+from datetime import timedelta
+from django.core.cache import cache
+from django.utils.http import quote_etag, parse_etags
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from users.permissions import IsAdmin
+from .counters import get_version
+from .models import UserStats, OrderStats, ProposalStats, CategoryFunnelStats
+from .serializers import StatsQuerySerializer, StatsBucketSerializer, FunnelQuerySerializer, CategoryFunnelStatsSerializer
 
-# Create your views here.
+SERIES = [
+    (UserStats, 'registered_users'),
+    (OrderStats, 'created_orders'),
+    (ProposalStats, 'created_proposals'),
+]
+SERIES_CACHE_TIMEOUT = 60 * 60
+
+
+def bucket_start(day, interval):
+    if interval == 'week':
+        return day - timedelta(days=day.weekday())
+    if interval == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def build_series(start, end, interval):
+    """
+    Один запрос на таблицу по диапазону дат и один проход по дням:
+    пропущенные дни считаются нулями и сразу сворачиваются в недели/месяцы.
+    """
+    columns = {
+        counter: dict(model.objects.filter(date__gte=start, date__lte=end).values_list('date', counter))
+        for model, counter in SERIES
+    }
+    buckets = {}
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        bucket = buckets.setdefault(bucket_start(day, interval), dict.fromkeys(columns, 0))
+        for counter, values in columns.items():
+            bucket[counter] += values.get(day, 0)
+    return [{'period': period, **values} for period, values in buckets.items()]
+
+
+class StatsView(APIView):
+    """
+    Временные ряды регистраций, заказов и откликов по дням, неделям или месяцам.
+    Ответ кэшируется по версии статистики, а ETag позволяет дашбордам получать 304.
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+    query_budget = 5
+
+    def get(self, request, *args, **kwargs):
+        query = StatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        interval = query.validated_data['interval']
+        start = query.validated_data['start']
+        end = query.validated_data['end']
+
+        version = get_version()
+        etag = quote_etag(f'stats-{version}-{interval}-{start}-{end}')
+        headers = {'ETag': etag, 'Cache-Control': 'private, max-age=60'}
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        cache_key = f'stats:series:{version}:{interval}:{start}:{end}'
+        data = cache.get(cache_key)
+        if data is None:
+            data = {
+                'interval': interval,
+                'start': start.isoformat(),
+                'end': end.isoformat(),
+                'results': StatsBucketSerializer(build_series(start, end, interval), many=True).data,
+            }
+            cache.set(cache_key, data, timeout=SERIES_CACHE_TIMEOUT)
+        return Response(data, headers=headers)
+
+
+class FunnelStatsView(APIView):
+    """
+    Дневная воронка по категориям: читает только строки CategoryFunnelStats за диапазон.
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+    query_budget = 3
+
+    def get(self, request, *args, **kwargs):
+        query = FunnelQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        queryset = CategoryFunnelStats.objects.filter(
+            date__gte=query.validated_data['start'],
+            date__lte=query.validated_data['end'],
+        ).order_by('date', 'category_id')
+        if 'category' in query.validated_data:
+            queryset = queryset.filter(category_id=query.validated_data['category'])
+        return Response({'results': CategoryFunnelStatsSerializer(queryset, many=True).data})
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CustomUser, Passport, BankCard, Cv, Category, Order, Proposal, Job, Review, Appeal, Image, Video
+from .models import CustomUser, Passport, BankCard, Cv, Category, Order, Proposal, Job, JobStatusEvent, Review, Appeal, Image, Video, OutboxEvent
 from django import forms
 from .status import RoleChoices
 
@@ -93,8 +93,15 @@ class ProposalAdmin(admin.ModelAdmin):
     search_fields = ('id', 'owner__user_id', 'order__id')
 
 
+class JobStatusEventInline(admin.TabularInline):
+    model = JobStatusEvent
+    extra = 0
+    readonly_fields = ('from_status', 'to_status', 'created_at')
+    can_delete = False
+
 @admin.register(Job)
 class JobAdmin(admin.ModelAdmin):
+    inlines = [JobStatusEventInline]
     list_display = ('id', 'order', 'proposal', 'status', 'created_at', 'assignee')
     list_filter = ('status', 'created_at')
     search_fields = ('id', 'order__id', 'proposal__id')
@@ -111,6 +118,14 @@ class AppealAdmin(admin.ModelAdmin):
     search_fields = ('job__id', 'owner__user_id', 'whom__owner__user_id', 'problem', 'to')
     list_filter = ('to',)
 
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    # В таблице остаются только необработанные события: attempts > 0 - события с ошибкой.
+    list_display = ('id', 'event_type', 'aggregate_type', 'aggregate_id', 'created_at', 'attempts')
+    list_filter = ('event_type', 'aggregate_type')
+    search_fields = ('aggregate_id',)
+    readonly_fields = ('aggregate_type', 'aggregate_id', 'event_type', 'payload', 'created_at', 'attempts', 'last_error')
+
 
 class ImageAdmin(admin.ModelAdmin):
     list_display = ('id', 'order', 'image_file')
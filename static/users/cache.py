@@ -0,0 +1,108 @@
+import hashlib
+import random
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+from .responses import RawJSON, RawJSONResponse
+
+
+VERSION_KEY = 'api:version:{resource}'
+RESPONSE_KEY = 'api:response:{resources}:{versions}:{user}:{path}'
+LOCK_SUFFIX = ':lock'
+
+
+def resource_name(model):
+    return model._meta.label_lower
+
+
+def bump_versions(*models):
+    """
+    Увеличивает версии ресурсов, чтобы закэшированные ответы по ним перестали находиться.
+    Версия поднимается сразу и ещё раз после коммита: иначе чтение между записью и коммитом
+    могло бы закэшировать старые данные под новой версией.
+    """
+    keys = [VERSION_KEY.format(resource=resource_name(model)) for model in models]
+
+    def bump():
+        for key in keys:
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, timeout=None)
+
+    bump()
+    transaction.on_commit(bump, robust=True)
+
+
+def get_versions(models):
+    keys = [VERSION_KEY.format(resource=resource_name(model)) for model in models]
+    values = cache.get_many(keys)
+    return [values.get(key, 0) for key in keys]
+
+
+class CachedResponseMixin:
+    """
+    Кэширует ответы list/retrieve в Redis отдельно для каждого пользователя.
+
+    Ключ включает версии всех моделей из `cache_models`: любая запись в них поднимает версию
+    (см. bump_versions), и старые ответы просто перестают находиться. При промахе ответ строит
+    только один запрос, остальные ждут его результат (защита от stampede), а TTL слегка
+    размазан, чтобы популярные ключи не истекали одновременно.
+    """
+    cache_models = ()
+    cache_actions = ('list', 'retrieve')
+    cache_timeout = 300
+    cache_lock_timeout = 10
+    cache_wait = 1.0
+
+    def dispatch(self, request, *args, **kwargs):
+        action = getattr(self, 'action_map', {}).get('get')
+        if action in self.cache_actions and hasattr(self, 'get'):
+            handler = self.get
+            self.get = lambda request, *args, **kwargs: self.cached_response(handler, request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_response_cache_key(self, request):
+        user = request.user
+        roles = getattr(user, 'role_mask', 0)
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        return RESPONSE_KEY.format(
+            resources=resource_name(self.cache_models[0]),
+            versions='.'.join(str(version) for version in get_versions(self.cache_models)),
+            user=f'{user.pk}-{roles}',
+            path=path,
+        )
+
+    def cached_response_from(self, data):
+        # Страницы, собранные в БД (users.dbjson), хранятся готовым JSON.
+        if isinstance(data, RawJSON):
+            return RawJSONResponse(data)
+        return Response(data)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return self.cached_response_from(data)
+
+        lock_key = key + LOCK_SUFFIX
+        if not cache.add(lock_key, 1, timeout=self.cache_lock_timeout):
+            deadline = time.monotonic() + self.cache_wait
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                data = cache.get(key)
+                if data is not None:
+                    return self.cached_response_from(data)
+            return handler(request, *args, **kwargs)
+
+        try:
+            response = handler(request, *args, **kwargs)
+            if response.status_code == 200:
+                timeout = int(self.cache_timeout * random.uniform(0.9, 1.1))
+                cache.set(key, response.data, timeout=timeout)
+            return response
+        finally:
+            cache.delete(lock_key)
@@ -0,0 +1,114 @@
+import hashlib
+from datetime import datetime
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .fieldsets import parse_field_tree
+from .models import VersionedModel
+from .prefetch import get_relation
+
+
+def has_updated_at(model):
+    return any(field.name == 'updated_at' for field in model._meta.concrete_fields)
+
+
+class ConditionalGetMixin:
+    """
+    ETag для list/retrieve (и Last-Modified для одного объекта): запрос с совпавшим
+    If-None-Match получает 304 Not Modified до кэша ответов и до сериализатора.
+
+    ETag - хэш одного агрегата по тому же queryset, что и ответ: max(updated_at) и число строк
+    (число строк замечает удаления), плюс версии связей из ?expand= (get_conditional_aggregates). Дочерние записи, которые
+    входят в ответ, сдвигают updated_at родителя (см. signals.touch_order).
+
+    В списке базовых классов ставится после CachedResponseMixin: обёртка над get должна быть внешней.
+    """
+    conditional_actions = ('list', 'retrieve')
+
+    def dispatch(self, request, *args, **kwargs):
+        action = getattr(self, 'action_map', {}).get('get')
+        if action in self.conditional_actions and hasattr(self, 'get'):
+            handler = self.get
+            self.get = lambda request, *args, **kwargs: self.conditional_response(handler, request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_conditional_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.detail:
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return queryset
+
+    def get_conditional_aggregates(self, model):
+        """
+        Агрегаты, которые входят в ETag: max(updated_at) строк ответа и для каждой связи из ?expand= -
+        max(updated_at) или, если его нет (Category), сумма row_version: версии только растут,
+        поэтому сумма меняется при любом сохранении связанной строки.
+        """
+        aggregates = [Max('updated_at')]
+        _, expand = self.get_field_selection()
+        for name in parse_field_tree(expand):
+            relation = get_relation(model, name)
+            if relation is None or relation[1] is None or relation[2]:
+                continue
+            if has_updated_at(relation[1]):
+                aggregates.append(Max(f'{name}__updated_at'))
+            elif issubclass(relation[1], VersionedModel):
+                aggregates.append(Sum(f'{name}__row_version'))
+        return aggregates
+
+    def get_validators(self):
+        """
+        (etag, last_modified) или (None, None), если объекта нет и ответ всё равно строит view.
+        """
+        try:
+            queryset = self.get_conditional_queryset()
+            aggregates = self.get_conditional_aggregates(queryset.model)
+            values = queryset.select_related(None).prefetch_related(None).order_by().aggregate(
+                rows=Count('pk'),
+                **{f'value_{index}': aggregate for index, aggregate in enumerate(aggregates)},
+            )
+        except (ValueError, TypeError, DjangoValidationError):
+            # Ключ в URL не того типа: 404 вернёт сам view.
+            return None, None
+        if self.detail and not values['rows']:
+            return None, None
+
+        aggregated = [values[f'value_{index}'] for index in range(len(aggregates))]
+        user = self.request.user
+        parts = [
+            f'{user.pk}-{getattr(user, "role_mask", 0)}',
+            self.request.get_full_path(),
+            self.request.accepted_media_type or '',
+            str(values['rows']),
+            *[value.isoformat() if isinstance(value, datetime) else str(value or '') for value in aggregated],
+        ]
+        etag = 'W/"%s"' % hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+        # Для списка max(updated_at) не замечает удалений, поэтому Last-Modified только у объекта.
+        last_modified = None
+        stamps = [value for value in aggregated if isinstance(value, datetime)]
+        if self.detail and stamps:
+            last_modified = int(max(stamps).timestamp())
+        return etag, last_modified
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        if etag is None:
+            return handler(request, *args, **kwargs)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            # Данные могли измениться после подсчёта ETag: тогда ответ новее него, и следующий
+            # запрос с этим ETag просто получит 200.
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
@@ -0,0 +1,280 @@
+import json
+import re
+import uuid
+from itertools import count
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import connections
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from .prefetch import NESTED_LIMIT, PrefetchPlanMixin, get_relation
+from .responses import RawJSON, RawJSONResponse
+
+
+# Байты, которые django.utils.encoding.filepath_to_uri не кодирует в URL файла.
+URL_SAFE_BYTES = sorted(set(b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_.-~' + b"/~!*()'"))
+TIMEZONE_NAME_RE = re.compile(r'^[A-Za-z0-9_/+-]+$')
+
+
+class Unsupported(Exception):
+    """
+    Сериализатор нельзя повторить в SQL один в один - ответ строится обычным DRF.
+    """
+
+
+class JSONCompiler:
+    """
+    Переводит дерево полей сериализатора в одно SQL-выражение, которое возвращает JSON объекта
+    текстом в том же виде, что и JSONRenderer DRF: те же ключи в том же порядке, компактные
+    разделители, строки без ensure_ascii, Decimal строкой, datetime в ISO 8601 с 'Z'.
+
+    Поддерживаются поля, для которых это проверено тестами паритета (PrimaryKeyRelatedField,
+    Integer/Boolean/Char/Choice/Decimal/DateTime/File, вложенные сериализаторы по FK и обратным
+    FK); на остальном - Unsupported. SerializerMethodField объявляет свой путь в
+    `json_sources = {'whom': 'whom__owner__user_id'}`: метод должен возвращать значение этой колонки.
+    """
+
+    def __init__(self, request, using='default'):
+        self.request = request
+        self.connection = connections[using]
+        self.aliases = count(1)
+        tz_name = timezone.get_current_timezone_name() if settings.USE_TZ else None
+        if tz_name is None or not TIMEZONE_NAME_RE.match(tz_name):
+            raise Unsupported('timezone')
+        self.tz_name = tz_name
+
+    def quote(self, name):
+        return self.connection.ops.quote_name(name)
+
+    def next_alias(self):
+        return f't{next(self.aliases)}'
+
+    def object_sql(self, serializer, model, alias):
+        if serializer.context.get('hide_owner'):
+            raise Unsupported('hide_owner')
+        parts = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            key = json.dumps(name, ensure_ascii=False)
+            if "'" in key or '%' in key:
+                raise Unsupported(name)
+            separator = '{' if not parts else ','
+            parts.append(f"'{separator}{key}:' || coalesce({self.field_sql(serializer, name, field, model, alias)}, 'null')")
+        if not parts:
+            return "'{}'"
+        return '(' + ' || '.join(parts) + " || '}')"
+
+    def field_sql(self, serializer, name, field, model, alias):
+        if isinstance(field, serializers.SerializerMethodField):
+            path = getattr(serializer, 'json_sources', {}).get(name)
+            if path is None:
+                raise Unsupported(name)
+            return self.path_sql(model, alias, path.split('__'), self.model_value_sql)
+        if field.source == '*' or isinstance(field, serializers.ManyRelatedField):
+            raise Unsupported(name)
+        if isinstance(field, serializers.ListSerializer):
+            return self.many_sql(field.child, model, alias, field.source_attrs)
+        if isinstance(field, serializers.BaseSerializer):
+            return self.path_sql(model, alias, field.source_attrs, lambda model_field, column: self.nested_sql(field, model_field, column))
+        return self.path_sql(model, alias, field.source_attrs, lambda model_field, column: self.value_sql(field, column))
+
+    def path_sql(self, model, alias, names, render):
+        """
+        Значение по пути source через FK: каждый шаг - скалярный подзапрос по первичному ключу.
+        """
+        relation = get_relation(model, names[0])
+        if relation is None:
+            raise Unsupported(names[0])
+        model_field, related_model, many = relation
+        if len(names) == 1:
+            if many or not model_field.concrete:
+                raise Unsupported(names[0])
+            return render(model_field, f'{alias}.{self.quote(model_field.column)}')
+        if related_model is None or many or not model_field.concrete:
+            raise Unsupported(names[0])
+        inner = self.next_alias()
+        value = self.path_sql(related_model, inner, names[1:], render)
+        return (f'(SELECT {value} FROM {self.quote(related_model._meta.db_table)} {inner} '
+                f'WHERE {inner}.{self.quote(model_field.target_field.column)} = {alias}.{self.quote(model_field.column)})')
+
+    def nested_sql(self, field, model_field, column):
+        if model_field.related_model is None:
+            raise Unsupported(field.field_name)
+        related_model = model_field.related_model
+        inner = self.next_alias()
+        return (f'(SELECT {self.object_sql(field, related_model, inner)} FROM {self.quote(related_model._meta.db_table)} {inner} '
+                f'WHERE {inner}.{self.quote(model_field.target_field.column)} = {column})')
+
+    def many_sql(self, child, model, alias, attrs):
+        """
+        Вложенная коллекция по обратному FK: по первичному ключу и не больше NESTED_LIMIT,
+        как в плане загрузки (users.prefetch).
+        """
+        relation = get_relation(model, attrs[0]) if len(attrs) == 1 else None
+        if relation is None or not relation[0].one_to_many:
+            raise Unsupported('.'.join(attrs))
+        related_model = relation[1]
+        remote_field = relation[0].field
+        inner = self.next_alias()
+        table = self.quote(related_model._meta.db_table)
+        pk = self.quote(related_model._meta.pk.column)
+        return (f"(SELECT '[' || coalesce(string_agg(items.item, ',' ORDER BY items.position), '') || ']' FROM ("
+                f'SELECT {self.object_sql(child, related_model, inner)} AS item, {inner}.{pk} AS position FROM {table} {inner} '
+                f'WHERE {inner}.{self.quote(remote_field.column)} = {alias}.{self.quote(remote_field.target_field.column)} '
+                f'ORDER BY {inner}.{pk} LIMIT {int(NESTED_LIMIT)}) items)')
+
+    def model_value_sql(self, model_field, column):
+        """
+        Значение колонки так, как его отдал бы json.dumps для Python-значения поля модели.
+        """
+        if model_field.get_internal_type() in ('AutoField', 'BigAutoField', 'IntegerField', 'BigIntegerField', 'SmallIntegerField',
+                                               'PositiveIntegerField', 'PositiveBigIntegerField', 'PositiveSmallIntegerField',
+                                               'BooleanField', 'ForeignKey', 'OneToOneField'):
+            return f'to_json({column})::text'
+        if model_field.get_internal_type() in ('CharField', 'TextField'):
+            return f'to_json({column})::text'
+        raise Unsupported(model_field.name)
+
+    def value_sql(self, field, column):
+        if isinstance(field, serializers.RelatedField):
+            if not isinstance(field, serializers.PrimaryKeyRelatedField) or field.pk_field is not None:
+                raise Unsupported(field.field_name)
+            return f'to_json({column})::text'
+        if isinstance(field, (serializers.BooleanField, serializers.IntegerField)):
+            return f'to_json({column})::text'
+        if isinstance(field, serializers.MultipleChoiceField):
+            raise Unsupported(field.field_name)
+        if isinstance(field, serializers.ChoiceField):
+            return self.choice_sql(field, column)
+        if isinstance(field, serializers.CharField):
+            return f'to_json({column}::text)::text'
+        if isinstance(field, serializers.DecimalField):
+            coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+            if not coerce_to_string or field.localize or field.decimal_places is None or getattr(field, 'normalize_output', False):
+                raise Unsupported(field.field_name)
+            return f'to_json(round({column}, {int(field.decimal_places)})::text)::text'
+        if isinstance(field, serializers.DateTimeField):
+            if getattr(field, 'format', api_settings.DATETIME_FORMAT).lower() != 'iso-8601':
+                raise Unsupported(field.field_name)
+            return self.datetime_sql(column)
+        if isinstance(field, serializers.FileField):
+            return self.file_url_sql(field, column)
+        raise Unsupported(field.field_name)
+
+    def choice_sql(self, field, column):
+        """
+        ChoiceField отдаёт значение из choices, совпавшее по str(), иначе само значение.
+        """
+        cases = []
+        for key, value in field.choice_strings_to_values.items():
+            literal = json.dumps(value, ensure_ascii=False)
+            if "'" in key + literal or '%' in key + literal:
+                raise Unsupported(field.field_name)
+            cases.append(f"WHEN '{key}' THEN '{literal}'")
+        fallback = f'to_json({column})::text'
+        if not cases:
+            return fallback
+        return f"CASE {column}::text {' '.join(cases)} ELSE {fallback} END"
+
+    def datetime_sql(self, column):
+        """
+        datetime.isoformat() в текущей временной зоне: микросекунды только если они не нулевые,
+        смещение '+05:00', а для UTC - 'Z', как у DateTimeField DRF.
+        """
+        local = f"({column} AT TIME ZONE '{self.tz_name}')"
+        minutes = f"(extract(epoch FROM {local} - ({column} AT TIME ZONE 'UTC'))::int / 60)"
+        offset = (f"CASE WHEN {minutes} = 0 THEN 'Z' ELSE CASE WHEN {minutes} < 0 THEN '-' ELSE '+' END"
+                  f" || lpad((abs({minutes}) / 60)::text, 2, '0') || ':' || lpad((abs({minutes}) % 60)::text, 2, '0') END")
+        offset = offset.replace('%', '%%')
+        fraction = f"CASE WHEN to_char({local}, 'US') = '000000' THEN '' ELSE '.' || to_char({local}, 'US') END"
+        return f"""('"' || to_char({local}, 'YYYY-MM-DD"T"HH24:MI:SS') || {fraction} || {offset} || '"')"""
+
+    def file_url_sql(self, field, column):
+        """
+        request.build_absolute_uri(storage.url(name)): имя кодируется как в filepath_to_uri.
+        """
+        request = field.context.get('request') if hasattr(field, 'context') else None
+        storage = default_storage
+        base_url = getattr(storage, 'base_url', '')
+        if (not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL) or request is None or not isinstance(storage, FileSystemStorage)
+                or not base_url.startswith('/') or base_url.startswith('//')):
+            raise Unsupported(field.field_name)
+        prefix = request.build_absolute_uri(base_url)
+        if "'" in prefix:
+            raise Unsupported(field.field_name)
+        prefix = prefix.replace('%', '%%')
+        safe = ', '.join(str(byte) for byte in URL_SAFE_BYTES)
+        quoted = (f"(SELECT coalesce(string_agg(CASE WHEN get_byte(name.bytes, position) = ANY(ARRAY[{safe}]) "
+                  f"THEN chr(get_byte(name.bytes, position)) "
+                  f"ELSE '%%' || upper(lpad(to_hex(get_byte(name.bytes, position)), 2, '0')) END, '' ORDER BY position), '') "
+                  f"FROM (SELECT convert_to(ltrim(replace({column}, '\\', '/'), '/'), 'UTF8') AS bytes) name, "
+                  f"generate_series(0, octet_length(name.bytes) - 1) position)")
+        return f"""CASE WHEN coalesce({column}, '') = '' THEN NULL ELSE to_json('{prefix}' || {quoted})::text END"""
+
+    def page_sql(self, serializer, model):
+        """
+        Запрос, который возвращает JSON-массив объектов для списка первичных ключей (%s)
+        в порядке этого списка.
+        """
+        alias = self.next_alias()
+        item = self.object_sql(serializer, model, alias)
+        pk = self.quote(model._meta.pk.column)
+        page = (f"'[' || coalesce(string_agg(page.item, ',' ORDER BY page.position), '') || ']'")
+        return (f"SELECT replace(replace({page}, chr(8232), '\\u2028'), chr(8233), '\\u2029') FROM ("
+                f'SELECT {item} AS item, ids.position FROM {self.quote(model._meta.db_table)} {alias} '
+                f'JOIN unnest(%s::bigint[]) WITH ORDINALITY AS ids(id, position) ON {alias}.{pk} = ids.id) page')
+
+
+class DatabaseJSONMixin(PrefetchPlanMixin):
+    """
+    Режим, в котором страницу списка собирает Postgres: сначала пагинатор выбирает ключи
+    лёгким запросом, затем один запрос строит JSON всех объектов страницы с вложенными
+    коллекциями, и он отдаётся клиенту без сериализации в Python.
+
+    Включается настройкой DB_JSON_RENDERING для действий `db_json_actions` и только когда
+    результат совпадёт с JSONRenderer байт в байт (см. JSONCompiler); иначе view работает
+    как обычно.
+    """
+    db_json_actions = ('list',)
+
+    def use_database_json(self):
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        return (
+            getattr(settings, 'DB_JSON_RENDERING', False)
+            and self.action in self.db_json_actions
+            and type(renderer) is JSONRenderer
+            and renderer.compact and not renderer.ensure_ascii
+            and 'indent' not in (self.request.accepted_media_type or '')
+        )
+
+    def database_json_response(self, queryset):
+        """
+        Ответ списка, собранный в БД, или None, если этот запрос нужно отдать через сериализатор.
+        """
+        if not self.use_database_json():
+            return None
+        model = queryset.model
+        try:
+            sql = JSONCompiler(self.request, queryset.db).page_sql(self.get_serializer(), model)
+        except Unsupported:
+            return None
+
+        keys = queryset.select_related(None).prefetch_related(None).only(model._meta.pk.name, *self.get_cursor_columns(model))
+        page = self.paginator.paginate_queryset(keys, self.request, view=self) if self.paginator is not None else None
+        rows = page if page is not None else list(keys)
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(sql, [[row.pk for row in rows]])
+            content = cursor.fetchone()[0].encode()
+        if page is None:
+            return RawJSONResponse(content)
+
+        # Обёртку пагинатора (count/next/previous) рендерит DRF, массив страницы подставляется готовым.
+        marker = uuid.uuid4().hex
+        envelope = self.paginator.get_paginated_response(marker).data
+        rendered = self.request.accepted_renderer.render(envelope, self.request.accepted_media_type, self.get_renderer_context())
+        return RawJSONResponse(rendered.replace(json.dumps(marker).encode(), content, 1))
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import logging
+import time
+from urllib.parse import parse_qs
+
+import redis.asyncio
+from django.conf import settings
+from django_redis import get_redis_connection
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+logger = logging.getLogger(__name__)
+
+USER_CHANNEL = 'events:user:{user_id}'
+# Комментарий-пинг, чтобы прокси и клиент не закрывали молчащее соединение.
+HEARTBEAT_INTERVAL = 20
+# Сколько событий может ждать отправки одному клиенту. Кто не успевает читать, получает
+# событие reset и переподключается, а пропущенное забирает через /sync/.
+QUEUE_SIZE = 100
+READ_TIMEOUT = 1.0
+RECONNECT_DELAY = 1.0
+
+
+def user_channel(user_id):
+    return USER_CHANNEL.format(user_id=user_id)
+
+
+def format_event(event, data):
+    """
+    Кадр Server-Sent Events. Собирается один раз при публикации, а не на каждое соединение.
+    """
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'.encode()
+
+
+def publish(user_ids, event, data):
+    """
+    Рассылает событие пользователям. Вызывается обработчиками outbox (users.signals), то есть
+    уже после коммита изменения: клиент, получивший событие, видит его и в API.
+    """
+    frame = format_event(event, data)
+    connection = get_redis_connection('default')
+    for user_id in sorted(set(user_ids)):
+        connection.publish(user_channel(user_id), frame)
+
+
+class EventHub:
+    """
+    Одно соединение Redis pub/sub на процесс: канал пользователя подписывается, пока у него есть
+    хотя бы одно открытое соединение в этом процессе, и каждое сообщение раскладывается по их
+    очередям. Само соединение клиента - это только очередь и ожидающая корутина.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.listeners = {}
+        self.pubsub = None
+        self.reader = None
+
+    async def add(self, user_id, queue):
+        if self.pubsub is None:
+            self.pubsub = redis.asyncio.from_url(self.url).pubsub()
+        listeners = self.listeners.setdefault(user_id, set())
+        listeners.add(queue)
+        if len(listeners) == 1:
+            await self.pubsub.subscribe(user_channel(user_id))
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.ensure_future(self.read())
+
+    async def remove(self, user_id, queue):
+        listeners = self.listeners.get(user_id, set())
+        listeners.discard(queue)
+        if listeners:
+            return
+        self.listeners.pop(user_id, None)
+        try:
+            await self.pubsub.unsubscribe(user_channel(user_id))
+        except (redis.ConnectionError, redis.TimeoutError, OSError):
+            # После переподключения redis-py подпишет заново только оставшиеся каналы.
+            pass
+
+    def dispatch(self, message):
+        user_id = int(message['channel'].rsplit(b':', 1)[1])
+        for queue in list(self.listeners.get(user_id, ())):
+            try:
+                queue.put_nowait(message['data'])
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def read(self):
+        while self.listeners:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=READ_TIMEOUT)
+            except (redis.ConnectionError, redis.TimeoutError, OSError):
+                logger.warning('Redis pub/sub connection lost, reconnecting')
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            if message is not None and message['type'] == 'message':
+                self.dispatch(message)
+
+
+def authenticate(scope):
+    """
+    (id пользователя, время истечения) по access-токену из ?token= (EventSource не умеет
+    заголовки) или из Authorization: Bearer. Без запроса к БД: токен подписан и короткоживущий,
+    а поток закрывается, когда он истекает.
+    """
+    raw = parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+    if raw is None:
+        header = dict(scope.get('headers', ())).get(b'authorization', b'').decode()
+        header_type, _, value = header.partition(' ')
+        if header_type in jwt_settings.AUTH_HEADER_TYPES:
+            raw = value
+    if not raw:
+        return None
+    try:
+        token = AccessToken(raw)
+    except TokenError:
+        return None
+    return token[jwt_settings.USER_ID_CLAIM], token['exp']
+
+
+class EventStreamApp:
+    """
+    ASGI-приложение поверх Django: GET `path` - поток Server-Sent Events пользователя
+    (proposal.created, job.status_changed, job.payment_confirmed), остальные запросы
+    уходят в Django.
+    """
+
+    def __init__(self, application, path='/events/', redis_url=None):
+        self.application = application
+        self.path = path
+        self.hub = EventHub(redis_url or settings.CACHE_URL)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != self.path:
+            return await self.application(scope, receive, send)
+        if scope['method'] != 'GET':
+            return await self.respond(send, 405, {'detail': 'Method not allowed.'})
+        auth = authenticate(scope)
+        if auth is None:
+            return await self.respond(send, 401, {'detail': 'Authentication credentials were not provided or are invalid.'})
+        await self.stream(receive, send, *auth)
+
+    async def respond(self, send, status, data):
+        await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': json.dumps(data).encode()})
+
+    async def wait_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def stream(self, receive, send, user_id, expires_at):
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        await self.hub.add(user_id, queue)
+        disconnected = asyncio.ensure_future(self.wait_disconnect(receive))
+        getter = None
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]})
+            await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+            while True:
+                timeout = min(HEARTBEAT_INTERVAL, expires_at - time.time())
+                if timeout <= 0:
+                    break
+                if getter is None:
+                    getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({getter, disconnected}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    return
+                if getter in done:
+                    frame, getter = getter.result(), None
+                    if frame is None:
+                        await send({'type': 'http.response.body', 'body': format_event('reset', {}), 'more_body': True})
+                        break
+                    await send({'type': 'http.response.body', 'body': frame, 'more_body': True})
+                else:
+                    await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+            if getter is not None:
+                getter.cancel()
+            await self.hub.remove(user_id, queue)
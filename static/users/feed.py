@@ -0,0 +1,94 @@
+import heapq
+from itertools import islice
+from threading import local
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import Order
+from .pagination import CreatedAtCursorPagination
+from .prefetch import plan_for
+from .serializers import OrderFeedSerializer
+from .status import OrderStatusChoices
+
+
+# Окно последних открытых заказов по каждой категории (и общее под 'all') хранится в Redis
+# уже сериализованным, так что первая страница ленты - это одно чтение из кэша.
+FEED_KEY = 'orders:feed:{category}'
+# На один элемент больше максимальной страницы: по следующему элементу строится ссылка next.
+FEED_WINDOW = CreatedAtCursorPagination.max_page_size + 1
+FEED_TIMEOUT = 60 * 60
+
+# Категории, окна которых устарели в текущей транзакции этого потока.
+_stale = local()
+
+
+def feed_key(category_id=None):
+    return FEED_KEY.format(category=category_id or 'all')
+
+
+def open_orders():
+    queryset = Order.objects.filter(status=OrderStatusChoices.OPEN).order_by('-created_at', '-id')
+    return plan_for(OrderFeedSerializer).apply(queryset)
+
+
+def build_window(category_id=None):
+    queryset = open_orders()
+    if category_id:
+        queryset = queryset.filter(category_id=category_id)
+    items = OrderFeedSerializer(queryset[:FEED_WINDOW], many=True).data
+    items = [dict(item) for item in items]
+    cache.set(feed_key(category_id), items, timeout=FEED_TIMEOUT)
+    return items
+
+
+def invalidate_windows_on_commit(*category_ids):
+    """
+    После коммита помечает устаревшими общее окно и окна указанных категорий: ключи удаляются,
+    а окно пересобирает следующее чтение ленты (first_page). Все вызовы одной транзакции (заказ
+    со всеми фото и видео) сливаются в одно удаление. Недоступный Redis не роняет запись.
+    """
+    pending = getattr(_stale, 'categories', None)
+    if pending is None:
+        pending = _stale.categories = set()
+    pending.add(None)
+    pending.update(category_id for category_id in category_ids if category_id)
+
+    def invalidate():
+        categories = getattr(_stale, 'categories', None)
+        if not categories:
+            return
+        _stale.categories = None
+        cache.delete_many([feed_key(category_id) for category_id in categories])
+
+    # Колбэк регистрируется на каждый вызов, но удаляет только первый сработавший; если транзакция
+    # откатилась, накопленные категории просто удалятся вместе со следующей.
+    transaction.on_commit(invalidate, robust=True)
+
+
+def _sort_key(item):
+    return parse_datetime(item['created_at']), item['id']
+
+
+def first_page(category_ids, page_size):
+    """
+    Первая страница ленты из окон в Redis. Возвращает (items, next_item),
+    next_item - первый заказ следующей страницы или None.
+    """
+    category_ids = sorted(set(category_ids)) or [None]
+    keys = {feed_key(category_id): category_id for category_id in category_ids}
+    cached = cache.get_many(list(keys))
+    windows = [cached[key] if key in cached else build_window(category_id) for key, category_id in keys.items()]
+
+    merged = heapq.merge(*windows, key=_sort_key, reverse=True)
+    items = list(islice(merged, page_size + 1))
+    return items[:page_size], items[page_size] if len(items) > page_size else None
+
+
+def with_absolute_urls(items, request):
+    for item in items:
+        for image in item['images']:
+            if image['image_file']:
+                image['image_file'] = request.build_absolute_uri(image['image_file'])
+    return items
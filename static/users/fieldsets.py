@@ -0,0 +1,80 @@
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+
+def normalize_field_list(value):
+    return ','.join(sorted({name.strip() for name in (value or '').split(',') if name.strip()}))
+
+
+def parse_field_tree(value):
+    """
+    'id,cv.bio,cv.rating' -> {'id': {}, 'cv': {'bio': {}, 'rating': {}}}.
+    Пустое поддерево - поле целиком.
+    """
+    tree = {}
+    for path in normalize_field_list(value).split(','):
+        if not path:
+            continue
+        node = tree
+        for name in path.split('.'):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def nested_serializer(field):
+    if isinstance(field, serializers.ListSerializer):
+        return field.child
+    if isinstance(field, serializers.BaseSerializer):
+        return field
+    return None
+
+
+def restrict_fields(serializer, fields, expand, param_path=''):
+    """
+    Урезает уже созданный сериализатор на месте: поля из `expandable_fields`, перечисленные
+    в expand, заменяются вложенными сериализаторами, а если задан fields - остаются только
+    перечисленные поля. Неизвестные имена - ValidationError (400).
+    """
+    serializer = nested_serializer(serializer)
+    expandable = getattr(serializer, 'expandable_fields', {})
+    for name, subtree in expand.items():
+        if name not in expandable:
+            raise ValidationError({'expand': [f"Field '{param_path}{name}' can't be expanded."]})
+        serializer.fields[name] = expandable[name](read_only=True)
+        restrict_fields(serializer.fields[name], {}, subtree, f'{param_path}{name}.')
+
+    for name, subtree in fields.items():
+        if name not in serializer.fields:
+            raise ValidationError({'fields': [f"Unknown field '{param_path}{name}'."]})
+        if subtree:
+            nested = nested_serializer(serializer.fields[name])
+            if nested is None:
+                raise ValidationError({'fields': [f"Field '{param_path}{name}' has no subfields."]})
+            restrict_fields(nested, subtree, {}, f'{param_path}{name}.')
+    if fields:
+        for name in list(serializer.fields):
+            if name not in fields:
+                serializer.fields.pop(name)
+
+
+class SparseFieldsMixin:
+    """
+    ?fields=id,description,images.id - только перечисленные поля (вложенные через точку);
+    ?expand=category - вложенный объект вместо ключа для полей из `expandable_fields`
+    сериализатора. Действует на GET-запросы: запись всегда идёт через полный сериализатор.
+    """
+
+    def get_field_selection(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return '', ''
+        params = request.query_params
+        return normalize_field_list(params.get('fields')), normalize_field_list(params.get('expand'))
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fields, expand = self.get_field_selection()
+        if fields or expand:
+            restrict_fields(serializer, parse_field_tree(fields), parse_field_tree(expand))
+        return serializer
@@ -1,39 +1,93 @@
 import django_filters
 from django_filters import rest_framework as filters
 from .models import CustomUser, Passport, Order, Proposal, Job, Review, Appeal
-from django.db.models import IntegerField, Q
-from django.db.models.functions import Cast
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from .search import search_orders, phone_digits
+from .geo import filter_near, valid_coordinates
+from .status import RoleChoices
 
 class PriceRangeFilter(django_filters.FilterSet):
     min_price = django_filters.NumberFilter(method='filter_by_min_price')
     max_price = django_filters.NumberFilter(method='filter_by_max_price')
+    currency = django_filters.CharFilter(field_name='price_currency')
 
     class Meta:
-        fields = ['min_price', 'max_price']
+        fields = ['min_price', 'max_price', 'currency']
 
     def filter_by_min_price(self, queryset, name, value):
-        return queryset.annotate(
-            numeric_price=Cast('price', IntegerField())
-        ).filter(numeric_price__gte=value)
+        return queryset.filter(price_amount__gte=value)
 
     def filter_by_max_price(self, queryset, name, value):
-        return queryset.annotate(
-            numeric_price=Cast('price', IntegerField())
-        ).filter(numeric_price__lte=value)
-        
+        return queryset.filter(price_amount__lte=value)
+
+
+class NearFilter(django_filters.FilterSet):
+    """
+    ?near=41.31,69.24&radius_km=5 - заказы в радиусе от точки (по умолчанию 5 км, максимум 100).
+    """
+    near = django_filters.CharFilter(method='filter_by_near')
+    radius_km = django_filters.NumberFilter(method='filter_by_radius')
+
+    default_radius_km = 5
+    max_radius_km = 100
+
+    def filter_by_near(self, queryset, name, value):
+        try:
+            latitude, longitude = (float(part) for part in value.split(','))
+        except ValueError:
+            raise ValidationError({'near': "Ожидается формат 'широта,долгота'."})
+        if not valid_coordinates(latitude, longitude):
+            raise ValidationError({'near': "Координаты вне допустимого диапазона."})
+
+        radius_km = self.form.cleaned_data.get('radius_km') or self.default_radius_km
+        if not 0 < radius_km <= self.max_radius_km:
+            raise ValidationError({'radius_km': f"Радиус должен быть от 0 до {self.max_radius_km} км."})
+        return filter_near(queryset, latitude, longitude, float(radius_km))
+
+    def filter_by_radius(self, queryset, name, value):
+        # Радиус применяется вместе с near в filter_by_near.
+        return queryset
 
 
 class CustomUserFilter(filters.FilterSet):
     user_id = filters.NumberFilter()
-    full_name = filters.CharFilter(field_name='full_name', lookup_expr='icontains')
-    roles = filters.CharFilter(field_name='roles', lookup_expr='icontains')
-    phone_number = filters.CharFilter(lookup_expr='icontains')
+    full_name = filters.CharFilter(method='filter_by_full_name')
+    roles = filters.CharFilter(method='filter_by_roles')
+    roles_any = filters.CharFilter(method='filter_by_any_role')
+    phone_number = filters.CharFilter(method='filter_by_phone_number')
     language = filters.CharFilter(lookup_expr='icontains')
-    tg_username = filters.CharFilter(lookup_expr='icontains')
+    tg_username = filters.CharFilter(method='filter_by_tg_username')
 
     class Meta:
         model = CustomUser
-        fields = ['user_id', 'full_name', 'roles', 'phone_number', 'language', 'tg_username']
+        fields = ['user_id', 'full_name', 'roles', 'roles_any', 'phone_number', 'language', 'tg_username']
+
+    def parse_roles(self, name, value):
+        roles = [role.strip() for role in value.split(',') if role.strip()]
+        unknown = [role for role in roles if role not in RoleChoices.values]
+        if unknown:
+            raise ValidationError({name: f"Неизвестные роли: {', '.join(unknown)}."})
+        return roles
+
+    # ?roles=Worker,Customer - есть все роли (@>), ?roles_any=Worker,Admin - хотя бы одна (&&).
+    def filter_by_roles(self, queryset, name, value):
+        return queryset.with_roles(*self.parse_roles(name, value))
+
+    def filter_by_any_role(self, queryset, name, value):
+        return queryset.with_any_role(*self.parse_roles(name, value))
+
+    # icontains на Postgres - это UPPER(col) LIKE UPPER('%...%'), его обслуживают триграммные индексы.
+    def filter_by_full_name(self, queryset, name, value):
+        for word in value.split():
+            queryset = queryset.filter(Q(first_name__icontains=word) | Q(last_name__icontains=word))
+        return queryset
+
+    def filter_by_phone_number(self, queryset, name, value):
+        return queryset.filter(phone_number__icontains=phone_digits(value) or value)
+
+    def filter_by_tg_username(self, queryset, name, value):
+        return queryset.filter(tg_username__icontains=value.lstrip('@'))
 
 
 class PassportFilter(filters.FilterSet):
@@ -44,7 +98,7 @@ class PassportFilter(filters.FilterSet):
         fields = ['owner']
 
 
-class OrderFilter(PriceRangeFilter):
+class OrderFilter(NearFilter, PriceRangeFilter):
     owner = filters.NumberFilter(field_name='owner__id')
     category = filters.NumberFilter(field_name='category__id')
     status = filters.CharFilter(lookup_expr='icontains')
@@ -55,6 +109,22 @@ class OrderFilter(PriceRangeFilter):
         fields = ['owner', 'category', 'status', 'created_at']
 
 
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
+
+
+class OrderFeedFilter(NearFilter, PriceRangeFilter):
+    category = NumberInFilter(field_name='category_id')
+    search = filters.CharFilter(method='filter_search')
+
+    class Meta(PriceRangeFilter.Meta):
+        model = Order
+        fields = ['category', 'search']
+
+    def filter_search(self, queryset, name, value):
+        return search_orders(queryset, value)
+
+
 class ProposalFilter(PriceRangeFilter):
     owner = filters.NumberFilter(field_name='owner__id')
     order = filters.NumberFilter(field_name='order__id')
@@ -0,0 +1,122 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db import models
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+
+
+FRAGMENT_KEY = 'api:fragment:{shape}:{pk}:{version}'
+# Фрагмент не устаревает сам (ключ меняется вместе с row_version), TTL только чистит Redis от старых версий.
+FRAGMENT_TIMEOUT = 24 * 60 * 60
+
+
+def represent_field(field, instance):
+    """
+    Значение одного поля так же, как его считает Serializer.to_representation.
+    """
+    attribute = field.get_attribute(instance)
+    check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+    return None if check_for_none is None else field.to_representation(attribute)
+
+
+def is_own_field(field):
+    """
+    Поле, которое читает только колонки самой строки: не вложенный сериализатор, не список связей,
+    не метод get_* и не source через точку ('cv.bio'). Такие поля могут читать другие строки,
+    которые не поднимают row_version этой, поэтому считаются заново на каждый ответ.
+    """
+    if isinstance(field, (serializers.BaseSerializer, serializers.ManyRelatedField, serializers.SerializerMethodField)):
+        return False
+    return len(field.source_attrs) == 1
+
+
+class FragmentListSerializer(serializers.ListSerializer):
+    """
+    Список объектов с кэшем фрагментов: все ключи страницы читаются одним get_many,
+    недостающие фрагменты собираются и записываются одним set_many.
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.load_fragments(items)
+        return [self.child.to_representation(item) for item in items]
+
+
+class FragmentCacheMixin:
+    """
+    Кэширует в Redis собственные поля объекта (is_own_field) под ключом (сериализатор и набор
+    полей, pk, row_version). Вложенные сериализаторы каждый раз строятся заново и кэшируются своими
+    фрагментами, а методы и поля через связи считаются заново, поэтому фрагмент зависит только от
+    строки самой модели и устаревает вместе с её row_version (см. users.models.VersionedModel).
+
+    Модель должна наследовать VersionedModel, а Meta сериализатора - указывать
+    `list_serializer_class = FragmentListSerializer`, чтобы списки читали кэш пачкой.
+    """
+    fragment_timeout = FRAGMENT_TIMEOUT
+
+    def get_fragment_fields(self):
+        # Поля урезаются ?fields=/?expand= уже после создания сериализатора, поэтому набор
+        # полей и форма ключа считаются при первом использовании.
+        if getattr(self, '_fragment_fields', None) is None:
+            self._fragment_fields = {
+                field.field_name: field for field in self._readable_fields if is_own_field(field)
+            }
+            request = self.context.get('request')
+            parts = [
+                f'{type(self).__module__}.{type(self).__qualname__}',
+                ','.join(self._fragment_fields),
+                # Ссылки на файлы абсолютные, даты - в текущей временной зоне.
+                request.build_absolute_uri('/') if request is not None else '',
+                timezone.get_current_timezone_name(),
+            ]
+            self._fragment_shape = hashlib.md5('|'.join(parts).encode()).hexdigest()
+        return self._fragment_fields
+
+    def get_fragment_key(self, instance):
+        self.get_fragment_fields()
+        return FRAGMENT_KEY.format(shape=self._fragment_shape, pk=instance.pk, version=instance.row_version)
+
+    def build_fragment(self, instance):
+        fragment = {}
+        for field in self.get_fragment_fields().values():
+            try:
+                fragment[field.field_name] = represent_field(field, instance)
+            except SkipField:
+                continue
+        return fragment
+
+    def load_fragments(self, instances):
+        keys = {self.get_fragment_key(instance): instance for instance in instances}
+        fragments = cache.get_many(list(keys))
+        missing = {key: self.build_fragment(instance) for key, instance in keys.items() if key not in fragments}
+        if missing:
+            cache.set_many(missing, timeout=self.fragment_timeout)
+        self._fragments = {**fragments, **missing}
+
+    def get_fragment(self, instance):
+        key = self.get_fragment_key(instance)
+        fragment = getattr(self, '_fragments', {}).get(key)
+        if fragment is None:
+            fragment = cache.get(key)
+        if fragment is None:
+            fragment = self.build_fragment(instance)
+            cache.set(key, fragment, timeout=self.fragment_timeout)
+        return fragment
+
+    def to_representation(self, instance):
+        fragment = self.get_fragment(instance)
+        own = self.get_fragment_fields()
+        ret = {}
+        for field in self._readable_fields:
+            if field.field_name in own:
+                if field.field_name in fragment:
+                    ret[field.field_name] = fragment[field.field_name]
+                continue
+            try:
+                ret[field.field_name] = represent_field(field, instance)
+            except SkipField:
+                continue
+        return ret
@@ -0,0 +1,122 @@
+import math
+import re
+
+from django.db.models import F, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# 9 символов - ячейка примерно 5 x 5 м, для адреса заказа этого достаточно.
+GEOHASH_PRECISION = 9
+# Сколько ячеек допускается в условии OR при поиске по радиусу.
+MAX_COVERING_CELLS = 16
+
+COORDINATE = r'(-?\d{1,3}(?:\.\d+)?)'
+# Google Maps: .../@41.31,69.24,15z, ?q=41.31,69.24, ?ll=41.31,69.24
+LAT_LON_RE = re.compile(r'(?:@|[?&](?:q|query|ll|destination)=)' + COORDINATE + r'(?:,|%2C)\s*' + COORDINATE, re.IGNORECASE)
+# Яндекс.Карты пишут сначала долготу: ?ll=69.24,41.31 или ?pt=69.24,41.31
+LON_LAT_RE = re.compile(r'[?&](?:ll|pt|whatshere%5Bpoint%5D|whatshere\[point\])=' + COORDINATE + r'(?:,|%2C)\s*' + COORDINATE, re.IGNORECASE)
+# Просто пара "41.31, 69.24" без URL
+PLAIN_RE = re.compile(r'^\s*' + COORDINATE + r'\s*,\s*' + COORDINATE + r'\s*$')
+
+
+def valid_coordinates(latitude, longitude):
+    return -90 <= latitude <= 90 and -180 <= longitude <= 180
+
+
+def parse_location_link(link):
+    """
+    Достаёт (широта, долгота) из ссылки на карту или строки "lat,lon".
+    Возвращает None, если координаты распознать не удалось.
+    """
+    if not link:
+        return None
+    if 'yandex' in link:
+        match = LON_LAT_RE.search(link)
+        if match:
+            longitude, latitude = float(match.group(1)), float(match.group(2))
+            return (latitude, longitude) if valid_coordinates(latitude, longitude) else None
+    match = LAT_LON_RE.search(link) or PLAIN_RE.match(link)
+    if match:
+        latitude, longitude = float(match.group(1)), float(match.group(2))
+        return (latitude, longitude) if valid_coordinates(latitude, longitude) else None
+    return None
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        bounds, value = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """
+    Размер ячейки geohash в градусах: (по широте, по долготе).
+    """
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering_cells(latitude, longitude, radius_km, max_cells=MAX_COVERING_CELLS):
+    """
+    Набор префиксов geohash, покрывающий квадрат вокруг круга радиуса radius_km.
+    Берётся самая мелкая точность, при которой ячеек не больше max_cells.
+    Переход через 180-й меридиан не поддерживается: квадрат обрезается по краю.
+    """
+    delta_lat = radius_km / KM_PER_DEGREE
+    delta_lon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    south, north = max(latitude - delta_lat, -90.0), min(latitude + delta_lat, 90.0)
+    west, east = max(longitude - delta_lon, -180.0), min(longitude + delta_lon, 180.0)
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(int((south + 90) // height), int((north + 90) // height) + 1)
+        columns = range(int((west + 180) // width), int((east + 180) // width) + 1)
+        if len(rows) * len(columns) <= max_cells or precision == 1:
+            return sorted({
+                encode_geohash(min(-90 + (row + 0.5) * height, 90.0), min(-180 + (column + 0.5) * width, 180.0), precision)
+                for row in rows for column in columns
+            })
+
+
+def distance_km(latitude, longitude):
+    """
+    Выражение с расстоянием по формуле гаверсинусов от точки до (latitude, longitude) заказа.
+    """
+    half_dlat = Radians(F('latitude') - Value(latitude)) / 2
+    half_dlon = Radians(F('longitude') - Value(longitude)) / 2
+    a = Power(Sin(half_dlat), 2) + Cos(Radians(Value(latitude))) * Cos(Radians(F('latitude'))) * Power(Sin(half_dlon), 2)
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Least(Sqrt(a), Value(1.0)))
+
+
+def filter_near(queryset, latitude, longitude, radius_km):
+    """
+    Сначала отсекает заказы по ячейкам geohash (B-tree индекс по префиксу),
+    затем оставшихся кандидатов проверяет точным расстоянием одним проходом в SQL.
+    """
+    cells = Q()
+    for cell in covering_cells(latitude, longitude, radius_km):
+        cells |= Q(geohash__startswith=cell)
+    return queryset.filter(cells).annotate(distance_km=distance_km(latitude, longitude)).filter(distance_km__lte=radius_km)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from users.cache import bump_versions
+from users.models import Order
+
+
+class Command(BaseCommand):
+    help = "Parse latitude/longitude and geohash from Order.location_link in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true', help="Recompute orders that already have a geohash")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        queryset = Order.objects.exclude(location_link__isnull=True).exclude(location_link='')
+        if not options['all']:
+            queryset = queryset.filter(geohash__isnull=True)
+
+        last_pk = 0
+        updated = 0
+        located = 0
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk').only('pk', 'location_link')[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+
+            for order in chunk:
+                order.set_coordinates()
+                if order.geohash:
+                    located += 1
+            Order.objects.bulk_update(chunk, ['latitude', 'longitude', 'geohash'])
+            updated += len(chunk)
+
+        bump_versions(Order)
+        self.stdout.write(f"Order: {updated} rows processed, {located} with coordinates")
+        self.stdout.write(self.style.SUCCESS('Successfully backfilled order coordinates.'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from users.cache import bump_versions
+from users.models import Order, Proposal, Job, parse_price, parse_currency
+
+
+class Command(BaseCommand):
+    help = "Fill numeric price_amount and price_currency from the legacy price string in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true', help="Recompute rows that already have price_amount")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+
+        for model in (Order, Proposal, Job):
+            queryset = model.objects.all()
+            if not options['all']:
+                queryset = queryset.filter(price_amount__isnull=True)
+
+            last_pk = 0
+            updated = 0
+            unparsed = 0
+            while True:
+                chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk').only('pk', 'price', 'price_currency')[:chunk_size])
+                if not chunk:
+                    break
+                last_pk = chunk[-1].pk
+
+                for instance in chunk:
+                    instance.price_amount = parse_price(instance.price)
+                    instance.price_currency = parse_currency(instance.price) or instance.price_currency
+                    if instance.price_amount is None:
+                        unparsed += 1
+                model.objects.bulk_update(chunk, ['price_amount', 'price_currency'])
+                updated += len(chunk)
+
+            bump_versions(model)
+            self.stdout.write(f"{model.__name__}: {updated} rows processed, {unparsed} without a numeric price")
+
+        self.stdout.write(self.style.SUCCESS('Successfully backfilled price amounts.'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from users.models import ChangeLog
+from users.sync import CHANGELOG_RETENTION
+
+
+class Command(BaseCommand):
+    help = "Delete /sync/ change log rows older than the retention period"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - CHANGELOG_RETENTION
+        deleted = 0
+        while True:
+            ids = list(ChangeLog.objects.filter(created_at__lt=cutoff).order_by('id').values_list('id', flat=True)[:options['chunk_size']])
+            if not ids:
+                break
+            deleted += ChangeLog.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} change log rows.'))
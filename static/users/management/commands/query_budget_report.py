@@ -0,0 +1,70 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import URLPattern, URLResolver, get_resolver
+from users.queries import get_query_budget
+
+
+def iter_patterns(patterns, prefix=''):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_patterns(pattern.url_patterns, prefix + str(pattern.pattern))
+        elif isinstance(pattern, URLPattern):
+            yield prefix + str(pattern.pattern), pattern.callback
+
+
+def collect_budgets():
+    """
+    Строка отчёта на каждую пару (маршрут, действие) для DRF-view из URLConf.
+    """
+    rows = []
+    seen = set()
+    for route, callback in iter_patterns(get_resolver().url_patterns):
+        view_class = getattr(callback, 'cls', None)
+        # Маршруты с суффиксом формата (.json) дублируют основные.
+        if view_class is None or '(?P<format>' in route:
+            continue
+        actions = getattr(callback, 'actions', None)
+        if actions:
+            pairs = sorted(actions.items())
+        else:
+            pairs = [(method, method) for method in view_class.http_method_names
+                     if method not in ('options', 'head') and hasattr(view_class, method)]
+        for method, action in pairs:
+            key = (route, method)
+            if key in seen:
+                continue
+            seen.add(key)
+            rows.append({
+                'route': route,
+                'method': method.upper(),
+                'view': f'{view_class.__module__}.{view_class.__name__}',
+                'action': action,
+                'budget': get_query_budget(view_class, action),
+            })
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Print the declared query_budget of every API endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=('text', 'json'), default='text')
+        parser.add_argument('--app', action='append', help="Only views from these apps (e.g. --app users --app stats)")
+        parser.add_argument('--strict', action='store_true', help="Fail if an endpoint has no budget")
+
+    def handle(self, *args, **options):
+        rows = collect_budgets()
+        if options['app']:
+            rows = [row for row in rows if row['view'].split('.')[0] in options['app']]
+
+        if options['format'] == 'json':
+            self.stdout.write(json.dumps(rows, ensure_ascii=False, indent=2))
+        else:
+            for row in rows:
+                budget = '-' if row['budget'] is None else row['budget']
+                self.stdout.write(f"{row['method']:<7} {row['route']:<55} {row['action']:<28} {budget}")
+
+        missing = [row for row in rows if row['budget'] is None]
+        if missing and options['strict']:
+            raise CommandError(f"{len(missing)} endpoints without query_budget")
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from users.cache import bump_versions
+from users.models import Order, Proposal, Cv, Appeal, change_markers
+
+
+# (модель со счётчиком, поле счётчика, дочерняя модель, внешний ключ на родителя, фильтр дочерних строк)
+COUNTERS = (
+    (Order, 'proposal_count', Proposal, 'order_id', {'status__in': Proposal.COUNTED_STATUSES}),
+    (Cv, 'appeal_count', Appeal, 'whom_id', {}),
+)
+
+
+def reconcile(model, field, child_model, parent_key, child_filter, chunk_size, dry_run):
+    last_pk = 0
+    checked = 0
+    drifted = []
+    while True:
+        # Строки пачки блокируются до подсчёта: сигналы двигают счётчик через F() в той же транзакции,
+        # что и дочернюю строку, поэтому такой сдвиг либо уже виден в подсчёте, либо ждёт записи пачки.
+        with transaction.atomic():
+            chunk = list(model.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', field).select_for_update()[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+
+            counts = dict(
+                child_model.objects.filter(**{f'{parent_key}__in': [row.pk for row in chunk]}, **child_filter)
+                .values(parent_key)
+                .annotate(total=Count('pk'))
+                .values_list(parent_key, 'total')
+            )
+            changed = []
+            for row in chunk:
+                actual = counts.get(row.pk, 0)
+                if getattr(row, field) != actual:
+                    setattr(row, field, actual)
+                    changed.append(row)
+
+            if changed and not dry_run:
+                model.objects.bulk_update(changed, [field])
+                if change_markers(model):
+                    model.objects.filter(pk__in=[row.pk for row in changed]).update(**change_markers(model))
+        checked += len(chunk)
+        drifted += changed
+
+    if drifted and not dry_run:
+        bump_versions(model)
+    return checked, len(drifted)
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized counters (Order.proposal_count, Cv.appeal_count) and fix drifted rows in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        for model, field, child_model, parent_key, child_filter in COUNTERS:
+            checked, fixed = reconcile(model, field, child_model, parent_key, child_filter, options['chunk_size'], options['dry_run'])
+            self.stdout.write(f"{model.__name__}.{field}: {checked} checked, {fixed} drifted")
+        self.stdout.write(self.style.SUCCESS('Successfully reconciled counters.'))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum, Count
+from users.cache import bump_versions
+from users.models import Cv, Review, change_markers
+
+
+class Command(BaseCommand):
+    help = "Recompute CV rating counters from reviews and fix drifted rows in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        fields = ['rating_sum', 'rating_count', 'rating_avg', 'rating']
+
+        last_pk = 0
+        checked = 0
+        fixed = 0
+        while True:
+            # Пачка блокируется до подсчёта, чтобы не затереть apply_rating_change отзыва,
+            # записанного между подсчётом и bulk_update: тот ждёт конца транзакции пачки.
+            with transaction.atomic():
+                chunk = list(Cv.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', *fields).select_for_update()[:chunk_size])
+                if not chunk:
+                    break
+                last_pk = chunk[-1].pk
+
+                totals = {
+                    row['whom_id']: (row['rating_sum'], row['rating_count'])
+                    for row in Review.objects.filter(whom_id__in=[cv.pk for cv in chunk])
+                    .values('whom_id')
+                    .annotate(rating_sum=Sum('rating'), rating_count=Count('id'))
+                }
+
+                drifted = []
+                for cv in chunk:
+                    current = tuple(getattr(cv, field) for field in fields)
+                    cv.set_rating_totals(*totals.get(cv.pk, (0, 0)))
+                    if tuple(getattr(cv, field) for field in fields) != current:
+                        drifted.append(cv)
+
+                if drifted and not options['dry_run']:
+                    Cv.objects.bulk_update(drifted, fields)
+                    Cv.objects.filter(pk__in=[cv.pk for cv in drifted]).update(**change_markers(Cv))
+            checked += len(chunk)
+            fixed += len(drifted)
+
+        if fixed and not options['dry_run']:
+            bump_versions(Cv)
+        self.stdout.write(f"{checked} CVs checked, {fixed} drifted")
+        self.stdout.write(self.style.SUCCESS('Successfully reconciled CV ratings.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from users.outbox import relay, RELAY_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Process pending outbox events in batches and delete the processed ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RELAY_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        processed = relay(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} outbox events.'))
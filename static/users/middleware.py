@@ -0,0 +1,35 @@
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .queries import QueryRecorder, check_queries, resolve_view
+
+
+logger = logging.getLogger('users.queries')
+
+
+class QueryBudgetMiddleware:
+    """
+    Считает SQL-запросы каждого запроса к API и пишет в лог превышения `query_budget` и N+1.
+    Включается переменной окружения QUERY_BUDGET_ENABLED, по умолчанию не используется.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        response['X-Query-Count'] = str(recorder.count)
+        view_class, action = getattr(request, '_query_budget_view', (None, None))
+        if view_class is not None:
+            for problem in check_queries(recorder, view_class, action):
+                logger.warning("%s %s: %s", request.method, request.path, problem)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget_view = resolve_view(view_func, request.method)
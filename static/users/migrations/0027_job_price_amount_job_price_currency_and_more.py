@@ -0,0 +1,55 @@
+# Generated by Django 5.0.7 on 2026-10-18 08:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0026_delete_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='price_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='price_currency',
+            field=models.CharField(choices=[('UZS', 'Сум'), ('USD', 'Доллар')], default='UZS', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='price_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='price_currency',
+            field=models.CharField(choices=[('UZS', 'Сум'), ('USD', 'Доллар')], default='UZS', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='proposal',
+            name='price_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='proposal',
+            name='price_currency',
+            field=models.CharField(choices=[('UZS', 'Сум'), ('USD', 'Доллар')], default='UZS', max_length=3),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['price_amount'], name='users_job_price_a_882d62_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['price_amount'], name='users_order_price_a_f41593_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='proposal',
+            index=models.Index(fields=['price_amount'], name='users_propo_price_a_c7f1a4_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.7 on 2026-10-18 08:55
+
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_rating_totals(apps, schema_editor):
+    # Те же значения, что даёт Cv.set_rating_totals: сумма и число отзывов, среднее и ближайшая оценка.
+    Cv = apps.get_model('users', 'Cv')
+    Review = apps.get_model('users', 'Review')
+
+    totals = Review.objects.values('whom_id').annotate(rating_sum=Sum('rating'), rating_count=Count('id')).order_by('whom_id')
+    cvs = []
+    for row in totals.iterator(chunk_size=1000):
+        rating_avg = (Decimal(row['rating_sum']) / row['rating_count']).quantize(Decimal('0.0001'))
+        rating = min(max(int(rating_avg.quantize(Decimal('1'), rounding=ROUND_HALF_UP)), 1), 5)
+        cvs.append(Cv(
+            id=row['whom_id'], rating_sum=row['rating_sum'], rating_count=row['rating_count'],
+            rating_avg=rating_avg, rating=str(rating),
+        ))
+        if len(cvs) >= 1000:
+            Cv.objects.bulk_update(cvs, ['rating_sum', 'rating_count', 'rating_avg', 'rating'])
+            cvs = []
+    Cv.objects.bulk_update(cvs, ['rating_sum', 'rating_count', 'rating_avg', 'rating'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0027_job_price_amount_job_price_currency_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cv',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=4, default=Decimal('0'), max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='cv',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cv',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_rating_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.0.7 on 2026-10-18 08:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils.dateparse import parse_datetime
+
+
+def copy_status_history(apps, schema_editor):
+    # status_history хранил строки вида "<timestamp>: <display> -> <status>", новые сверху.
+    Job = apps.get_model('users', 'Job')
+    JobStatusEvent = apps.get_model('users', 'JobStatusEvent')
+
+    events = []
+    jobs = Job.objects.exclude(status_history__isnull=True).exclude(status_history='')
+    for job in jobs.only('id', 'created_at', 'status_history').iterator(chunk_size=1000):
+        transitions = []
+        for line in reversed(job.status_history.strip().splitlines()):
+            timestamp, _, rest = line.partition(': ')
+            created_at = parse_datetime(timestamp.strip())
+            if created_at is None or ' -> ' not in rest:
+                continue
+            transitions.append((created_at, rest.rsplit(' -> ', 1)[1].strip()))
+
+        previous_status = None
+        for created_at, to_status in transitions:
+            events.append(JobStatusEvent(job_id=job.id, from_status=previous_status, to_status=to_status, created_at=created_at))
+            previous_status = to_status
+
+        if len(events) >= 1000:
+            JobStatusEvent.objects.bulk_create(events)
+            events = []
+    JobStatusEvent.objects.bulk_create(events)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0028_cv_rating_avg_cv_rating_count_cv_rating_sum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, choices=[('in_progress', 'In Progress'), ('payment', 'Payment'), ('warning', 'Warning'), ('review', 'Review'), ('completed', 'Completed')], max_length=15, null=True)),
+                ('to_status', models.CharField(choices=[('in_progress', 'In Progress'), ('payment', 'Payment'), ('warning', 'Warning'), ('review', 'Review'), ('completed', 'Completed')], max_length=15)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='users.job')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['job', 'created_at'], name='users_jobst_job_id_c219ee_idx')],
+            },
+        ),
+        migrations.RunPython(copy_status_history, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='job',
+            name='status_history',
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0029_jobstatusevent_remove_job_status_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='first_proposal_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['first_proposal_at'], name='users_order_first_p_c9965d_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0030_order_first_proposal_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'open')), fields=['-created_at', '-id'], name='order_open_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'open')), fields=['category', '-created_at', '-id'], name='order_open_category_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:13
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Русская конфигурация даёт стемминг, 'simple' - точное совпадение слов (в том числе узбекских,
+# для которых в Postgres нет словаря). Описание весит больше адреса.
+CREATE_TRIGGER = """
+CREATE FUNCTION users_order_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(NEW.location, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'C') ||
+        setweight(to_tsvector('simple', coalesce(NEW.location, '')), 'D');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER users_order_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF description, location ON users_order
+    FOR EACH ROW EXECUTE FUNCTION users_order_search_vector_update();
+
+UPDATE users_order SET description = description;
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS users_order_search_vector_trigger ON users_order;
+DROP FUNCTION IF EXISTS users_order_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0031_order_open_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='order_search_vector_idx'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+    ]
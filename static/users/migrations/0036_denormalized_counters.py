@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0035_customuser_roles_gin_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cv',
+            name='appeal_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='proposal_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
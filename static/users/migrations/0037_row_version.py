@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-18 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0036_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='row_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='row_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cv',
+            name='row_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='row_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.0.7 on 2026-10-18 10:15
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+TABLES = (
+    ('users_order', 'orders'),
+    ('users_proposal', 'proposals'),
+    ('users_job', 'jobs'),
+    ('users_review', 'reviews'),
+    ('users_appeal', 'appeals'),
+)
+
+# Видимость повторяет списки API: заказ, отклик, отзыв и жалобу видит их владелец,
+# работу - заказчик и исполнитель. txid - номер транзакции, clock_timestamp() - время самой записи.
+CREATE_FUNCTION = """
+CREATE FUNCTION users_changelog_record() RETURNS trigger AS $$
+DECLARE
+    changed record;
+    viewers bigint[];
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed := OLD;
+    ELSE
+        changed := NEW;
+    END IF;
+    IF TG_TABLE_NAME = 'users_job' THEN
+        viewers := array_remove(ARRAY[
+            (SELECT owner_id FROM users_order WHERE id = changed.order_id),
+            (SELECT owner_id FROM users_proposal WHERE id = changed.proposal_id)
+        ], NULL);
+    ELSE
+        viewers := ARRAY[changed.owner_id];
+    END IF;
+    INSERT INTO users_changelog (entity, object_id, deleted, audience, txid, created_at)
+    VALUES (TG_ARGV[0], changed.id, TG_OP = 'DELETE', viewers, pg_current_xact_id()::text::bigint, clock_timestamp());
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+CREATE_TRIGGERS = "".join(
+    f"CREATE TRIGGER {table}_changelog_trigger AFTER INSERT OR UPDATE OR DELETE ON {table} "
+    f"FOR EACH ROW EXECUTE FUNCTION users_changelog_record('{entity}');\n"
+    for table, entity in TABLES
+)
+
+DROP_TRIGGERS = "".join(f"DROP TRIGGER IF EXISTS {table}_changelog_trigger ON {table};\n" for table, _ in TABLES) + """
+DROP FUNCTION IF EXISTS users_changelog_record();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0038_order_proposal_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(editable=False, max_length=20)),
+                ('object_id', models.BigIntegerField(editable=False)),
+                ('deleted', models.BooleanField(default=False, editable=False)),
+                ('audience', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=list, editable=False, size=None)),
+                ('txid', models.BigIntegerField(editable=False)),
+                ('created_at', models.DateTimeField(editable=False)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['txid', 'id'], name='users_chang_txid_469be7_idx'), models.Index(fields=['created_at'], name='users_chang_created_6a53c1_idx'), django.contrib.postgres.indexes.GinIndex(fields=['audience'], name='changelog_audience_idx')],
+            },
+        ),
+        migrations.RunSQL(CREATE_FUNCTION + CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.7 on 2026-10-18 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0039_changelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('aggregate_type', models.CharField(editable=False, max_length=20)),
+                ('aggregate_id', models.BigIntegerField(editable=False)),
+                ('event_type', models.CharField(editable=False, max_length=50)),
+                ('payload', models.JSONField(default=dict, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.PositiveIntegerField(default=0, editable=False)),
+                ('last_error', models.TextField(blank=True, editable=False)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['aggregate_type', 'aggregate_id', 'id'], name='users_outbo_aggrega_d613b1_idx')],
+            },
+        ),
+    ]
@@ -1,14 +1,124 @@
 from django.core.validators import MinValueValidator
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
+from .cache import bump_versions
+from .geo import parse_location_link, encode_geohash
 from django.core.exceptions import ValidationError
-from .status import RoleChoices, LanguageChoices, JobStatusChoices, OrderStatusChoices, ProposalStatusChoices, RatingChoices, AppealTypeChoices, PaymentStatusChoices
+from .status import RoleChoices, LanguageChoices, JobStatusChoices, OrderStatusChoices, ProposalStatusChoices, RatingChoices, AppealTypeChoices, PaymentStatusChoices, CurrencyChoices, JOB_STATUS_TRANSITIONS, role_mask
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.contrib.postgres.fields import ArrayField
-from django.db.models import Avg, Case, When, IntegerField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models import Case, When, Value, F, Q, Sum, Count
+from django.db.models.functions import Cast, Greatest, Round, Upper
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+import re
+
+
+RATING_AVG_FIELD = models.DecimalField(max_digits=5, decimal_places=4)
+RATING_SUM_FIELD = models.DecimalField(max_digits=20, decimal_places=4)
+RATING_AVG_QUANT = Decimal('0.0001')
+
+
+# Сумма с разделителями разрядов ("150,000", "1.500.000", "1,500,000.50"): группы ровно по три цифры
+# через один и тот же разделитель, дробная часть - одна-две цифры через другой. Иначе - просто число.
+PRICE_NUMBER_RE = re.compile(r'(?<!\d)(?:[1-9]\d{0,2}([.,])\d{3}(?:\1\d{3})*(?:(?!\1)[.,]\d{1,2})?(?![\d.,]\d)|\d+(?:[.,]\d+)?)')
+PRICE_CURRENCY_MARKERS = (
+    (CurrencyChoices.USD, re.compile(r'\$|\busd\b|доллар|dollar', re.IGNORECASE)),
+    (CurrencyChoices.UZS, re.compile(r'сум|сўм|so[\'ʻ’`]?m|\buzs\b', re.IGNORECASE)),
+)
+
+
+def shift_counter(model, pk, field, delta):
+    """
+    Сдвигает денормализованный счётчик одним UPDATE через F(), не опуская его ниже нуля.
+    Если счётчик всё же разошёлся с таблицей, его исправит команда reconcile_counters.
+    """
+    model.objects.filter(pk=pk).update(**{field: Greatest(F(field) + delta, Value(0))}, **change_markers(model))
+
+
+def change_markers(model):
+    """
+    Аргументы для queryset.update(), которые отмечают изменение строки так же, как save():
+    поднимают row_version у моделей VersionedModel (ключ фрагментов, users.fragments) и
+    ставят updated_at, если он есть (ETag ответов, users.conditional).
+    """
+    markers = {}
+    if issubclass(model, VersionedModel):
+        markers['row_version'] = F('row_version') + 1
+    if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+        markers['updated_at'] = timezone.now()
+    return markers
+
+
+def parse_price(value):
+    """
+    Достаёт числовую сумму из строковой цены ("150 000 сум" -> Decimal('150000')).
+    Возвращает None, если число найти не удалось.
+    """
+    if value is None:
+        return None
+    compact = re.sub(r'[\s\u00a0\u202f]', '', str(value))
+    match = PRICE_NUMBER_RE.search(compact)
+    if not match:
+        return None
+    number = match.group()
+    if match.group(1):
+        number = number.replace(match.group(1), '')
+    try:
+        amount = Decimal(number.replace(',', '.'))
+    except InvalidOperation:
+        return None
+    if amount >= Decimal('1e12'):
+        return None
+    return amount.quantize(Decimal('0.01'))
+
+
+def parse_currency(value):
+    """
+    Валюта по пометке в строковой цене ("100$" -> USD, "150 000 сум" -> UZS) или None, если пометки нет.
+    """
+    if value is None:
+        return None
+    for currency, marker in PRICE_CURRENCY_MARKERS:
+        if marker.search(str(value)):
+            return currency
+    return None
+
+
+class VersionedModel(models.Model):
+    """
+    Номер версии строки, который растёт при каждом save(). По паре (pk, row_version) кэшируются
+    сериализованные представления объектов, см. users.fragments.
+    """
+    row_version = models.PositiveIntegerField(default=0, editable=False)
+
+    def save(self, *args, **kwargs):
+        self.row_version += 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'row_version'}
+        super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
+
+
+class CustomUserQuerySet(models.QuerySet):
+    """
+    Запросы по ролям через операторы массивов @> и &&, их обслуживает GIN-индекс по roles.
+    """
+
+    def with_roles(self, *roles):
+        return self.filter(roles__contains=list(roles))
+
+    def with_any_role(self, *roles):
+        return self.filter(roles__overlap=list(roles))
 
 
-class CustomUserManager(BaseUserManager):
+class CustomUserManager(BaseUserManager.from_queryset(CustomUserQuerySet)):
     def create_user(self, user_id, password=None, roles=None, **extra_fields):
         if not user_id:
             raise ValueError('The User_id field must be set')
@@ -28,7 +138,7 @@ class CustomUserManager(BaseUserManager):
         return self.create_user(user_id, password, **extra_fields)
     
 
-class CustomUser(AbstractBaseUser, PermissionsMixin):
+class CustomUser(VersionedModel, AbstractBaseUser, PermissionsMixin):
     user_id = models.BigIntegerField(unique=True)
     first_name = models.CharField(max_length=30, blank=True)
     last_name = models.CharField(max_length=30, blank=True)
@@ -50,6 +160,24 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
+
+    @cached_property
+    def role_mask(self):
+        return role_mask(self.roles)
+
+    def has_role(self, *roles):
+        """
+        True, если у пользователя есть хотя бы одна из перечисленных ролей.
+        """
+        return bool(self.role_mask & role_mask(roles))
+
+    def save(self, *args, **kwargs):
+        self.__dict__.pop('role_mask', None)
+        super().save(*args, **kwargs)
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.__dict__.pop('role_mask', None)
     
     @property
     def cv(self):
@@ -65,6 +193,12 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
             models.Index(fields=['language']),
             models.Index(fields=['tg_username']),
             models.Index(fields=['date_created']),
+            GinIndex(fields=['roles'], name='user_roles_gin_idx'),
+            # Триграммные индексы по UPPER(...): их используют и icontains, и поиск по похожести (users.search).
+            GinIndex(OpClass(Upper('first_name'), name='gin_trgm_ops'), name='user_first_name_trgm_idx'),
+            GinIndex(OpClass(Upper('last_name'), name='gin_trgm_ops'), name='user_last_name_trgm_idx'),
+            GinIndex(OpClass(Upper('phone_number'), name='gin_trgm_ops'), name='user_phone_number_trgm_idx'),
+            GinIndex(OpClass(Upper('tg_username'), name='gin_trgm_ops'), name='user_tg_username_trgm_idx'),
         ]
 
 
@@ -116,41 +250,66 @@ class BankCard(models.Model):
         ]
 
 
-class Cv(models.Model):
+class Cv(VersionedModel):
     owner = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
     image = models.ImageField(upload_to='cv_images/', blank=True, null=True) 
     bio = models.TextField()
     rating = models.CharField(max_length=2, choices=RatingChoices.choices, default=RatingChoices.ONE)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_avg = models.DecimalField(max_digits=5, decimal_places=4, default=Decimal('0'))
     word_experience = models.IntegerField(default=0) 
+    # Число жалоб на владельца CV, ведётся сигналами Appeal (отзывы считает rating_count).
+    appeal_count = models.PositiveIntegerField(default=0, editable=False)
 
     @property
     def reviews(self):
         return Review.objects.filter(whom=self)
 
+    def apply_rating_change(self, sum_delta, count_delta):
+        """
+        Сдвигает сумму и количество оценок одним UPDATE через F(), без пересчёта всех отзывов.
+        Вызывается в той же транзакции, что и запись отзыва.
+        """
+        new_sum = Cast(F('rating_sum') + sum_delta, RATING_SUM_FIELD)
+        new_count = F('rating_count') + count_delta
+        no_reviews_left = Q(rating_count__lte=-count_delta)
+        Cv.objects.filter(pk=self.pk).update(
+            rating_sum=F('rating_sum') + sum_delta,
+            rating_count=new_count,
+            rating_avg=Case(
+                When(no_reviews_left, then=Value(Decimal('0'))),
+                default=new_sum / new_count,
+                output_field=RATING_AVG_FIELD,
+            ),
+            rating=Case(
+                When(no_reviews_left, then=Value(RatingChoices.ONE.value)),
+                default=Cast(Round(new_sum / new_count), models.CharField(max_length=2)),
+                output_field=models.CharField(max_length=2),
+            ),
+            **change_markers(Cv),
+        )
+        bump_versions(Cv)
+
     def update_rating(self):
-        reviews = self.reviews
-        if reviews.exists():
-            average_rating = reviews.aggregate(
-                avg_rating=Avg(
-                    Case(
-                        When(rating='1', then=1),
-                        When(rating='2', then=2),
-                        When(rating='3', then=3),
-                        When(rating='4', then=4),
-                        When(rating='5', then=5),
-                        output_field=IntegerField(),
-                    )
-                )
-            )['avg_rating']
-            rounded_rating = self.get_closest_rating(average_rating)
-            self.rating = rounded_rating
+        totals = Review.objects.filter(whom=self).aggregate(rating_sum=Sum('rating'), rating_count=Count('id'))
+        self.set_rating_totals(totals['rating_sum'] or 0, totals['rating_count'])
+        self.save(update_fields=['rating_sum', 'rating_count', 'rating_avg', 'rating'])
+
+    def set_rating_totals(self, rating_sum, rating_count):
+        self.rating_sum = rating_sum
+        self.rating_count = rating_count
+        if rating_count:
+            self.rating_avg = (Decimal(rating_sum) / rating_count).quantize(RATING_AVG_QUANT)
+            self.rating = self.get_closest_rating(self.rating_avg)
         else:
+            self.rating_avg = Decimal('0')
             self.rating = RatingChoices.ONE
-        self.save()
 
     def get_closest_rating(self, avg_rating):
+        rounded = int(Decimal(avg_rating).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
         choices = [int(choice.value) for choice in RatingChoices]
-        closest_rating = min(choices, key=lambda x: abs(x - avg_rating))
+        closest_rating = min(choices, key=lambda x: abs(x - rounded))
         return str(closest_rating)
 
     def appeals(self):
@@ -163,10 +322,39 @@ class Cv(models.Model):
         indexes = [
             models.Index(fields=['owner']),
             models.Index(fields=['rating']),
+            GinIndex(OpClass(Upper('bio'), name='gin_trgm_ops'), name='cv_bio_trgm_idx'),
         ]
 
 
-class Category(models.Model):
+# Отправляется после каждого записанного перехода статуса Job (в том числе через Job.transition,
+# который обходит post_save) внутри транзакции перехода. Аргументы: job, from_status, to_status.
+job_status_changed = Signal()
+# Отметка об оплате от одной из сторон (Job.set_payment_status), тоже внутри транзакции.
+# Аргументы: job, side, payment_status.
+job_payment_changed = Signal()
+
+
+class PricedModel(models.Model):
+    """
+    Хранит числовую сумму рядом со строковым полем `price`, чтобы фильтрация по цене шла по индексу.
+    """
+    price_amount = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    price_currency = models.CharField(max_length=3, choices=CurrencyChoices.choices, default=CurrencyChoices.UZS)
+
+    def save(self, *args, **kwargs):
+        self.price_amount = parse_price(self.price)
+        # Валюта, указанная в самой строке, важнее значения по умолчанию.
+        self.price_currency = parse_currency(self.price) or self.price_currency
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'price' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'price_amount', 'price_currency'}
+        super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
+
+
+class Category(VersionedModel):
     name = models.CharField(max_length=100)
 
     def __str__(self):
@@ -178,7 +366,7 @@ class Category(models.Model):
         ]
 
 
-class Order(models.Model):
+class Order(PricedModel):
     owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     description = models.TextField()
@@ -187,16 +375,68 @@ class Order(models.Model):
     price = models.CharField(max_length=50)
     status = models.CharField(max_length=10, choices=OrderStatusChoices.choices, default=OrderStatusChoices.OPEN)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Меняется и при записи откликов, фото и видео заказа (см. signals.touch_order).
+    updated_at = models.DateTimeField(auto_now=True)
+    first_proposal_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Заполняется триггером в БД из description и location (см. миграцию 0032).
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Координаты, разобранные из location_link, и их geohash для поиска по радиусу.
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
+    geohash = models.CharField(max_length=12, null=True, blank=True, editable=False)
+    # Число откликов без отозванных, ведётся сигналами Proposal.
+    proposal_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Категория на момент загрузки из БД: при смене категории окно ленты нужно обновить и у старой.
+    _loaded_category_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_category_id = self.__dict__.get('category_id')
+
+    def set_coordinates(self):
+        coordinates = parse_location_link(self.location_link)
+        self.latitude, self.longitude = coordinates or (None, None)
+        self.geohash = encode_geohash(*coordinates) if coordinates else None
+
+    def save(self, *args, **kwargs):
+        self.set_coordinates()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'location_link' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'latitude', 'longitude', 'geohash'}
+        # post_save-обработчики (и запись в outbox) - в одной транзакции с заказом.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Order #{self.id} - {self.description}"
 
+    def mark_first_proposal(self, proposal_created_at):
+        """
+        Запоминает время первого отклика. Возвращает True только для первого отклика на заказ.
+        """
+        return bool(Order.objects.filter(pk=self.pk, first_proposal_at__isnull=True).update(first_proposal_at=proposal_created_at))
+
     class Meta:
         indexes = [
             models.Index(fields=['owner']),
             models.Index(fields=['category']),
             models.Index(fields=['status']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['price_amount']),
+            models.Index(fields=['first_proposal_at']),
+            # Лента открытых заказов: частичные индексы только по status=open в порядке выдачи.
+            models.Index(fields=['-created_at', '-id'], name='order_open_feed_idx', condition=Q(status=OrderStatusChoices.OPEN)),
+            models.Index(fields=['category', '-created_at', '-id'], name='order_open_category_feed_idx', condition=Q(status=OrderStatusChoices.OPEN)),
+            GinIndex(fields=['search_vector'], name='order_search_vector_idx'),
+            # varchar_pattern_ops, чтобы LIKE 'префикс%' шёл по B-tree индексу.
+            models.Index(fields=['geohash'], name='order_geohash_idx', opclasses=['varchar_pattern_ops']),
         ]
 
 
@@ -215,27 +455,55 @@ class Video(models.Model):
         return f"Video for Order #{self.order.id} - {self.video_file.name}"
     
 
-class Proposal(models.Model):
+class Proposal(PricedModel):
     owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='proposals', default='')
     message = models.TextField()
     price = models.CharField(max_length=50)
     status = models.CharField(max_length=10, choices=ProposalStatusChoices.choices, default=ProposalStatusChoices.WAITING)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Отклики, которые входят в Order.proposal_count: отозванный работником не считается.
+    COUNTED_STATUSES = (ProposalStatusChoices.WAITING, ProposalStatusChoices.APPROVED, ProposalStatusChoices.REJECTED)
+
+    _loaded_status = None
 
     def __str__(self):
         return f"Proposal #{self.id} - {self.owner.user_id} on Order #{self.order.id}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_status = self.__dict__.get('status')
+
+    def save(self, *args, **kwargs):
+        # post_save внутри super().save() ещё видит прежний статус в _loaded_status. Создание работы
+        # при одобрении и запись в outbox идут в одной транзакции с откликом.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self._loaded_status = self.status
+
+    @property
+    def counted(self):
+        return self.status in self.COUNTED_STATUSES
+
     class Meta:
         indexes = [
             models.Index(fields=['owner']),
             models.Index(fields=['order']),
             models.Index(fields=['status']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['price_amount']),
         ]
 
 
-class Job(models.Model):
+class Job(PricedModel):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     proposal = models.ForeignKey(Proposal, on_delete=models.CASCADE)
     price = models.CharField(max_length=50)
@@ -243,8 +511,6 @@ class Job(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     assignee = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='assigned_jobs')
-    status_history = models.TextField(null=True, blank=True)
-
 
     payment_confirmed_by_customer = models.CharField(max_length=15, choices=PaymentStatusChoices.choices, default=PaymentStatusChoices.DEFAULT)
     payment_confirmed_by_worker = models.CharField(max_length=15, choices=PaymentStatusChoices.choices, default=PaymentStatusChoices.DEFAULT)
@@ -255,13 +521,113 @@ class Job(models.Model):
     def __str__(self):
         return f"Job for Order {self.order.id} - Status: {self.status}"
 
+    _loaded_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_status = self.__dict__.get('status')
+
     def save(self, *args, **kwargs):
-        if self.pk:
-            old_instance = Job.objects.get(pk=self.pk)
-            if old_instance.status != self.status:
-                # Ensure timezone is imported from django.utils
-                self.status_history = f"{timezone.now()}: {self.get_status_display()} -> {self.status}\n" + (self.status_history or "")
-        super().save(*args, **kwargs)
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        status_written = update_fields is None or 'status' in update_fields
+        previous_status = self._loaded_status
+
+        if not (adding or (status_written and previous_status != self.status)):
+            super().save(*args, **kwargs)
+            return
+
+        # post_save-обработчики должны видеть новый статус уже записанным.
+        self._loaded_status = self.status
+        try:
+            with transaction.atomic():
+                if adding:
+                    super().save(*args, **kwargs)
+                    JobStatusEvent.objects.create(job=self, to_status=self.status)
+                else:
+                    JobStatusEvent.objects.create(job=self, from_status=previous_status, to_status=self.status)
+                    super().save(*args, **kwargs)
+                job_status_changed.send(sender=Job, job=self, from_status=None if adding else previous_status, to_status=self.status)
+        except Exception:
+            self._loaded_status = previous_status
+            raise
+
+    def transition(self, to_status, when=None, attempts=2):
+        """
+        Compare-and-swap перехода по JOB_STATUS_TRANSITIONS: UPDATE ... WHERE status = <текущий>.
+        Возвращает True, если переход выполнил именно этот вызов. При проигрыше гонки статус
+        перечитывается и попытка повторяется, пока переход ещё допустим.
+        """
+        for _ in range(attempts):
+            from_status = self.status
+            if to_status not in JOB_STATUS_TRANSITIONS.get(from_status, ()):
+                return False
+
+            now = timezone.now()
+            queryset = Job.objects.filter(pk=self.pk, status=from_status)
+            if when is not None:
+                queryset = queryset.filter(when)
+            with transaction.atomic():
+                won = queryset.update(status=to_status, updated_at=now)
+                if won:
+                    JobStatusEvent.objects.create(job_id=self.pk, from_status=from_status, to_status=to_status, created_at=now)
+                    self.status = self._loaded_status = to_status
+                    self.updated_at = now
+                    job_status_changed.send(sender=Job, job=self, from_status=from_status, to_status=to_status)
+            if won:
+                bump_versions(Job)
+                return True
+
+            current_status = Job.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+            if current_status is None or current_status == from_status:
+                return False
+            self.status = self._loaded_status = current_status
+        return False
+
+    def set_payment_status(self, side, payment_status):
+        """
+        Отметка об оплате от заказчика ('customer') или работника ('worker').
+        Когда обе стороны подтвердили оплату, Job переходит в REVIEW, при проблеме из PAYMENT в WARNING.
+        """
+        field = f'payment_confirmed_by_{side}'
+        now = timezone.now()
+        with transaction.atomic():
+            Job.objects.filter(pk=self.pk).update(**{field: payment_status, 'updated_at': now})
+            setattr(self, field, payment_status)
+            self.updated_at = now
+            job_payment_changed.send(sender=Job, job=self, side=side, payment_status=payment_status)
+        bump_versions(Job)
+
+        if payment_status == PaymentStatusChoices.APPROVED:
+            return self.transition(JobStatusChoices.REVIEW, when=Q(
+                payment_confirmed_by_customer=PaymentStatusChoices.APPROVED,
+                payment_confirmed_by_worker=PaymentStatusChoices.APPROVED,
+            ))
+        if payment_status == PaymentStatusChoices.PROBLEM and self.status == JobStatusChoices.PAYMENT:
+            return self.transition(JobStatusChoices.WARNING)
+        return False
+
+    def mark_review_written(self, side):
+        """
+        Ставит флаг review_written_by_<side>, только если он ещё не стоял. Возвращает False, если отзыв уже был.
+        """
+        field = f'review_written_by_{side}'
+        now = timezone.now()
+        if not Job.objects.filter(pk=self.pk, **{field: False}).update(**{field: True, 'updated_at': now}):
+            return False
+        setattr(self, field, True)
+        self.updated_at = now
+        bump_versions(Job)
+        return True
+
+    def complete_if_reviewed(self):
+        return self.transition(JobStatusChoices.COMPLETED, when=Q(review_written_by_customer=True, review_written_by_worker=True))
 
     class Meta:
         indexes = [
@@ -270,9 +636,25 @@ class Job(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['created_at']),
             models.Index(fields=['assignee']),
+            models.Index(fields=['price_amount']),
+        ]
+
+class JobStatusEvent(models.Model):
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='status_events')
+    from_status = models.CharField(max_length=15, choices=JobStatusChoices.choices, null=True, blank=True)
+    to_status = models.CharField(max_length=15, choices=JobStatusChoices.choices)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Job {self.job_id}: {self.from_status} -> {self.to_status}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['job', 'created_at']),
         ]
 
-class Review(models.Model):
+
+class Review(VersionedModel):
     job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='reviews')
     owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     whom = models.ForeignKey(Cv, on_delete=models.CASCADE, related_name='reviews')
@@ -298,6 +680,12 @@ class Appeal(models.Model):
     problem = models.TextField(null=True)
     to = models.CharField(max_length=20, choices=AppealTypeChoices.choices)
 
+    def save(self, *args, **kwargs):
+        # Сдвиг Cv.appeal_count в post_save - в одной транзакции с жалобой, иначе reconcile_counters
+        # мог бы посчитать жалобу до сдвига и получить её дважды.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Appeal for Job {self.job_id.id} - To: {self.to}"
 
@@ -308,3 +696,57 @@ class Appeal(models.Model):
             models.Index(fields=['whom']),
             models.Index(fields=['to']),
         ]
+
+
+class ChangeLog(models.Model):
+    """
+    Журнал изменений для /sync/ (users.sync). Строку на каждую вставку, изменение и удаление
+    заказа, отклика, работы, отзыва и жалобы пишет триггер в БД (миграция 0039), поэтому в журнал
+    попадают и записи мимо save(): update() через F(), переходы Job, bulk_update команд.
+
+    audience - пользователи, которые видят объект в своих списках (админ видит всё),
+    txid - номер транзакции записи: по нему /sync/ отдаёт только завершённые транзакции.
+    """
+    entity = models.CharField(max_length=20, editable=False)
+    object_id = models.BigIntegerField(editable=False)
+    deleted = models.BooleanField(default=False, editable=False)
+    audience = ArrayField(models.BigIntegerField(), default=list, editable=False)
+    txid = models.BigIntegerField(editable=False)
+    created_at = models.DateTimeField(editable=False)
+
+    def __str__(self):
+        return f"{self.entity} #{self.object_id} ({'deleted' if self.deleted else 'changed'})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['txid', 'id']),
+            models.Index(fields=['created_at']),
+            GinIndex(fields=['audience'], name='changelog_audience_idx'),
+        ]
+
+
+class OutboxEvent(models.Model):
+    """
+    Доменное событие (transactional outbox, users.outbox). Строка пишется в той же транзакции,
+    что и изменение заказа, отклика или работы, поэтому событие есть тогда и только тогда, когда
+    изменение зафиксировано. Задача relay_outbox разбирает события и удаляет обработанные.
+
+    Порядок событий одного агрегата (aggregate_type, aggregate_id) - порядок id. attempts и
+    last_error - неудачные попытки обработки: такое событие остаётся в таблице и задерживает
+    следующие события своего агрегата.
+    """
+    aggregate_type = models.CharField(max_length=20, editable=False)
+    aggregate_id = models.BigIntegerField(editable=False)
+    event_type = models.CharField(max_length=50, editable=False)
+    payload = models.JSONField(default=dict, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0, editable=False)
+    last_error = models.TextField(blank=True, editable=False)
+
+    def __str__(self):
+        return f"{self.event_type} for {self.aggregate_type} #{self.aggregate_id}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['aggregate_type', 'aggregate_id', 'id']),
+        ]
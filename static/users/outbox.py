@@ -0,0 +1,108 @@
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+
+from .models import OutboxEvent
+
+
+logger = logging.getLogger(__name__)
+
+# Тип события -> обработчики. Регистрируются декоратором outbox_handler при импорте модулей
+# signals (users, stats), то есть при загрузке приложений.
+HANDLERS = defaultdict(list)
+# Сколько событий забирает одна транзакция relay.
+RELAY_BATCH_SIZE = 100
+
+
+def outbox_handler(event_type):
+    """
+    Регистрирует обработчик события: handler(event), где event - OutboxEvent.
+
+    Доставка не реже одного раза: если обработчик (или любой другой обработчик того же события)
+    упал, или процесс упал до коммита, событие придёт ещё раз. Побочные эффекты вне БД (Redis)
+    делаются сразу, а не после коммита, иначе падение между коммитом и ними потеряло бы событие.
+    """
+    def register(handler):
+        HANDLERS[event_type].append(handler)
+        return handler
+    return register
+
+
+def record_event(aggregate_type, aggregate_id, event_type, **payload):
+    """
+    Пишет событие в outbox. Вызывается только внутри транзакции, которая меняет агрегат:
+    событие фиксируется вместе с изменением или пропадает вместе с ним.
+    """
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError(f'Outbox event {event_type} must be recorded inside the transaction that changes the aggregate.')
+    return OutboxEvent.objects.create(aggregate_type=aggregate_type, aggregate_id=aggregate_id, event_type=event_type, payload=payload)
+
+
+def same_aggregates(keys):
+    condition = Q(pk__in=[])
+    for aggregate_type, aggregate_id in keys:
+        condition |= Q(aggregate_type=aggregate_type, aggregate_id=aggregate_id)
+    return condition
+
+
+def claim_batch(batch_size=RELAY_BATCH_SIZE, skip=()):
+    """
+    Блокирует и возвращает до batch_size событий в порядке id. Вызывается внутри транзакции.
+
+    Сначала берутся головы агрегатов - события без более ранних необработанных - через
+    FOR UPDATE SKIP LOCKED, то есть только агрегаты, которые не разбирает другой relay. Пока
+    голова заблокирована и не удалена, следующие события её агрегата не бывают головами ни для
+    кого, поэтому их можно забрать следом, и агрегат целиком обрабатывает один relay по порядку.
+    skip - агрегаты, которые в этом запуске уже не обработались.
+    """
+    earlier = OutboxEvent.objects.filter(
+        aggregate_type=OuterRef('aggregate_type'), aggregate_id=OuterRef('aggregate_id'), pk__lt=OuterRef('pk'),
+    )
+    heads = OutboxEvent.objects.filter(~Exists(earlier))
+    if skip:
+        heads = heads.exclude(same_aggregates(skip))
+    keys = list(heads.order_by('pk').select_for_update(skip_locked=True).values_list('aggregate_type', 'aggregate_id')[:batch_size])
+    if not keys:
+        return []
+    return list(OutboxEvent.objects.filter(same_aggregates(keys)).order_by('pk').select_for_update()[:batch_size])
+
+
+def dispatch(event):
+    for handler in HANDLERS.get(event.event_type, ()):
+        handler(event)
+
+
+def relay(batch_size=RELAY_BATCH_SIZE):
+    """
+    Разбирает outbox пачками, пока в нём есть доступные события. Возвращает число обработанных.
+
+    Каждая пачка - одна транзакция: обработанные события удаляются в ней же. Событие
+    обрабатывается в своей точке сохранения; если обработчик упал, его изменения в БД
+    откатываются, у события растёт attempts, а остальные события этого агрегата ждут
+    следующего запуска, чтобы не нарушить порядок.
+    """
+    processed = 0
+    failed = set()
+    while True:
+        with transaction.atomic():
+            events = claim_batch(batch_size, skip=failed)
+            if not events:
+                return processed
+            done = []
+            for event in events:
+                key = (event.aggregate_type, event.aggregate_id)
+                if key in failed:
+                    continue
+                try:
+                    with transaction.atomic():
+                        dispatch(event)
+                except Exception as exc:
+                    logger.exception('Outbox event %s (%s) failed', event.pk, event.event_type)
+                    failed.add(key)
+                    OutboxEvent.objects.filter(pk=event.pk).update(attempts=F('attempts') + 1, last_error=repr(exc))
+                else:
+                    done.append(event.pk)
+            OutboxEvent.objects.filter(pk__in=done).delete()
+        processed += len(done)
@@ -1,7 +1,134 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.db import connections
+from rest_framework.pagination import BasePagination, PageNumberPagination, CursorPagination
+from rest_framework.response import Response
 
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 15
     page_size_query_param = 'page_size'
-    max_page_size = 100
\ No newline at end of file
+    max_page_size = 100
+
+
+def estimate_count(queryset):
+    """
+    Оценка количества строк по плану запроса Postgres (EXPLAIN), без COUNT(*).
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация по (created_at, id): без COUNT(*) и без OFFSET-сканирования.
+
+    Порядок берётся из `cursor_ordering` у view, так что модели без `created_at`
+    могут листаться по `-id`. Общее количество добавляется только по запросу:
+    `?count=exact` или `?count=estimate`.
+    """
+    page_size = 15
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        count_mode = request.query_params.get(self.count_query_param)
+        if count_mode == 'exact':
+            self.count = queryset.count()
+        elif count_mode == 'estimate':
+            self.count = estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_window_response(self, items, next_item, request, view=None):
+        """
+        Ответ для первой страницы, собранной не из queryset (например, из кэша).
+        `next_item` - первый элемент следующей страницы, по нему строится ссылка next.
+        """
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, None, view)
+        self.cursor = None
+        self.page = items
+        self.has_next = next_item is not None
+        self.has_previous = False
+        if self.has_next:
+            self.next_position = self._get_position_from_instance(next_item, self.ordering)
+        self.count = None
+        return self.get_paginated_response(items)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering:
+            return tuple(ordering)
+        return super().get_ordering(request, queryset, view)
+
+    def get_paginated_response(self, data):
+        payload = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            payload = {'count': self.count, **payload}
+        return Response(payload)
+
+
+class SwitchablePagination(BasePagination):
+    """
+    Выбирает режим пагинации для каждого запроса.
+
+    По умолчанию используется `pagination_mode` у view ('page' или 'cursor'),
+    клиент может переопределить его параметром `?pagination=`. Наличие `cursor`
+    в запросе всегда означает keyset-режим, чтобы ссылки next/previous работали.
+    """
+    mode_query_param = 'pagination'
+    page_class = StandardResultsSetPagination
+    cursor_class = CreatedAtCursorPagination
+
+    def __init__(self):
+        self.delegate = self.page_class()
+
+    def get_mode(self, request, view):
+        if request.query_params.get(self.cursor_class.cursor_query_param):
+            return 'cursor'
+        mode = request.query_params.get(self.mode_query_param)
+        if mode in ('page', 'cursor'):
+            return mode
+        return getattr(view, 'pagination_mode', 'page')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.get_mode(request, view) == 'cursor':
+            self.delegate = self.cursor_class()
+        else:
+            self.delegate = self.page_class()
+        return self.delegate.paginate_queryset(queryset, request, view)
+
+    @property
+    def display_page_controls(self):
+        return self.delegate.display_page_controls
+
+    def get_paginated_response(self, data):
+        return self.delegate.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.delegate.get_paginated_response_schema(schema)
+
+    def to_html(self):
+        return self.delegate.to_html()
+
+    def get_results(self, data):
+        return self.delegate.get_results(data)
+
+    def get_schema_fields(self, view):
+        return self.delegate.get_schema_fields(view)
+
+    def get_schema_operation_parameters(self, view):
+        return self.delegate.get_schema_operation_parameters(view)
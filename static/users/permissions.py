@@ -6,7 +6,7 @@ class IsAdmin(permissions.BasePermission):
     """
 
     def has_permission(self, request, view):
-        if 'Admin' in request.user.roles:
+        if request.user.has_role('Admin'):
             return True
         return False
     
@@ -0,0 +1,231 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
+from rest_framework import serializers
+
+from .fieldsets import SparseFieldsMixin, parse_field_tree, restrict_fields
+from .fragments import FragmentCacheMixin
+
+
+# Сколько элементов вложенной коллекции (отклики заказа, отзывы CV) отдаётся в ответе,
+# остальное - через собственный эндпоинт коллекции с фильтром по родителю.
+NESTED_LIMIT = 20
+
+
+class QueryPlan:
+    """
+    Что нужно загрузить для сериализатора: пути select_related, вложенные планы для
+    prefetch_related и колонки для only(). Строится один раз на класс сериализатора.
+    """
+
+    def __init__(self, model, limit=None, partition_by=None):
+        self.model = model
+        self.limit = limit
+        self.partition_by = partition_by
+        self.select_related = set()
+        self.prefetches = {}
+        self.only = {model._meta.pk.name}
+
+    def add_columns(self, model, prefix=''):
+        """
+        Все колонки модели: для полей, которые читают неизвестно что (свойства, source='*').
+        """
+        for field in model._meta.concrete_fields:
+            self.only.add(prefix + field.name)
+
+    def queryset(self):
+        pk = self.model._meta.pk.name
+        queryset = self.apply(self.model._default_manager.order_by(pk))
+        if self.limit:
+            # Не больше limit строк на родителя. Срез queryset[:limit] внутри Prefetch Django 5.0
+            # не даёт положить в кэш менеджера связи, поэтому номер строки считается явно.
+            row_number = Window(RowNumber(), partition_by=F(self.partition_by), order_by=F(pk).asc())
+            queryset = queryset.annotate(nested_row=row_number).filter(nested_row__lte=self.limit)
+        return queryset
+
+    def apply(self, queryset, extra_columns=()):
+        """
+        Заменяет select_related/prefetch_related у queryset на план; фильтры, аннотации
+        и сортировка сохраняются.
+        """
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        if self.prefetches:
+            queryset = queryset.prefetch_related(*[
+                plan if isinstance(plan, str) else Prefetch(path, queryset=plan.queryset())
+                for path, plan in sorted(self.prefetches.items())
+            ])
+        return queryset.only(*sorted(self.only | set(extra_columns)))
+
+
+def get_relation(model, name):
+    """
+    (поле, связанная модель, many) для имени атрибута модели или None, если это не поле.
+    """
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    if not field.is_relation:
+        return field, None, False
+    return field, field.related_model, field.one_to_many or field.many_to_many
+
+
+def add_hint(plan, model, path, prefix=''):
+    """
+    Подсказка `related_hints`: путь, который читает SerializerMethodField, - до колонки
+    ('whom__owner__user_id', 'order__owner_id') или до связи, тогда связанная модель грузится целиком.
+    Цепочка FK/OneToOne уходит в select_related, начиная с первой many-связи - в
+    prefetch_related строкой.
+    """
+    names = path.split('__')
+    for index, name in enumerate(names):
+        relation = get_relation(model, name)
+        if relation is None or (relation[1] is None and index < len(names) - 1):
+            raise ValueError(f"{model.__name__}.{name} from hint '{path}' is not a relation")
+        field, related_model, many = relation
+        # 'owner_id' - только колонка с ключом, без join.
+        if related_model is None or name == getattr(field, 'attname', None) != field.name:
+            plan.only.add(prefix + field.name)
+            return
+        if many:
+            plan.prefetches.setdefault(prefix + '__'.join(names[index:]), prefix + '__'.join(names[index:]))
+            return
+        if field.concrete:
+            plan.only.add(prefix + name)
+        prefix = prefix + name
+        plan.select_related.add(prefix)
+        plan.only.add(f'{prefix}__{related_model._meta.pk.name}')
+        if index == len(names) - 1:
+            plan.add_columns(related_model, prefix + '__')
+        prefix += '__'
+        model = related_model
+
+
+def walk(serializer, model, plan, prefix=''):
+    hints = getattr(serializer, 'related_hints', {})
+    if isinstance(serializer, FragmentCacheMixin):
+        # Ключ фрагмента (users.fragments) строится по row_version.
+        plan.only.add(prefix + 'row_version')
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.SerializerMethodField):
+            if name in hints:
+                for path in hints[name]:
+                    add_hint(plan, model, path, prefix)
+            else:
+                # Без подсказки неизвестно, что читает метод: грузим модель целиком.
+                plan.add_columns(model, prefix)
+            continue
+        if field.source == '*':
+            plan.add_columns(model, prefix)
+            continue
+        walk_source(field, field.source_attrs, model, plan, prefix)
+
+
+def walk_source(field, attrs, model, plan, prefix):
+    for index, name in enumerate(attrs):
+        last = index == len(attrs) - 1
+        relation = get_relation(model, name)
+        if relation is None:
+            # Свойство или метод модели.
+            plan.add_columns(model, prefix)
+            return
+        model_field, related_model, many = relation
+        if related_model is None:
+            plan.only.add(prefix + name)
+            return
+
+        if many:
+            if not last or not isinstance(field, (serializers.ListSerializer, serializers.ManyRelatedField)):
+                plan.add_columns(model, prefix)
+                plan.prefetches.setdefault(prefix + name, prefix + name)
+                return
+            if model_field.one_to_many:
+                nested = QueryPlan(related_model, limit=NESTED_LIMIT, partition_by=model_field.field.name)
+                # Без внешнего ключа prefetch не разложит строки по родителям.
+                nested.only.add(model_field.field.name)
+            else:
+                nested = QueryPlan(related_model)
+            if isinstance(field, serializers.ListSerializer):
+                walk(field.child, related_model, nested)
+            plan.prefetches[prefix + name] = nested
+            return
+
+        if model_field.concrete:
+            plan.only.add(prefix + name)
+            # Для PrimaryKeyRelatedField достаточно колонки с ключом.
+            if last and isinstance(field, serializers.RelatedField):
+                return
+        path = prefix + name
+        plan.select_related.add(path)
+        plan.only.add(f'{path}__{related_model._meta.pk.name}')
+        if not model_field.concrete:
+            # Обратная OneToOne: Django сопоставляет объект по его ключу на родителя.
+            plan.only.add(f'{path}__{model_field.field.name}')
+        if last:
+            if isinstance(field, serializers.BaseSerializer):
+                walk(field, related_model, plan, path + '__')
+            else:
+                plan.add_columns(related_model, path + '__')
+            return
+        model = related_model
+        prefix = path + '__'
+
+
+@lru_cache(maxsize=512)
+def plan_for(serializer_class, related_hints=(), fields='', expand=''):
+    """
+    План загрузки для ModelSerializer: обходит дерево полей и собирает select_related для
+    FK/OneToOne, Prefetch с собственным планом для вложенных many-сериализаторов и only()
+    по колонкам, которые поля действительно читают.
+
+    SerializerMethodField и свойства модели изнутри не видны: связи, которые они читают,
+    сериализатор перечисляет в `related_hints = {'whom': ('whom__owner__user_id',)}`, а колонки
+    модели со свойством грузятся целиком. `related_hints` здесь - то же самое для кода самого view.
+
+    `fields` и `expand` - параметры ?fields=/?expand= (см. users.fieldsets): план строится по уже
+    урезанному сериализатору, и невостребованные связи не загружаются вовсе.
+    """
+    serializer = serializer_class()
+    restrict_fields(serializer, parse_field_tree(fields), parse_field_tree(expand))
+    plan = QueryPlan(serializer.Meta.model)
+    walk(serializer, plan.model, plan)
+    for path in related_hints:
+        add_hint(plan, plan.model, path)
+    return plan
+
+
+class PrefetchPlanMixin(SparseFieldsMixin):
+    """
+    Подставляет план из plan_for(serializer_class) в queryset действий `plan_actions`
+    вместо написанных вручную select_related/prefetch_related. Связи, которые читает
+    сам view (например, проверка владельца в retrieve), перечисляются в `plan_related`.
+    """
+    plan_actions = ('list', 'retrieve')
+    plan_related = ()
+
+    def get_cursor_columns(self, model):
+        # Поля сортировки курсора тоже нужны, иначе ссылка next догружает их по одному.
+        ordering = [name.lstrip('-') for name in getattr(self, 'cursor_ordering', None) or ()]
+        return [name for name in ordering if get_relation(model, name) is not None]
+
+    def plan_queryset(self, queryset):
+        fields, expand = self.get_field_selection()
+        plan = plan_for(self.get_serializer_class(), tuple(self.plan_related), fields, expand)
+        return plan.apply(queryset, self.get_cursor_columns(queryset.model))
+
+    def paginate_queryset(self, queryset):
+        if self.action in self.plan_actions:
+            queryset = self.plan_queryset(queryset)
+        return super().paginate_queryset(queryset)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.detail and self.action in self.plan_actions:
+            queryset = self.plan_queryset(queryset)
+        return queryset
@@ -0,0 +1,101 @@
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.db import connections
+
+
+# Запрос, повторившийся (с точностью до параметров) столько раз за один HTTP-запрос, считается N+1.
+N_PLUS_ONE_THRESHOLD = 3
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+# К бюджету view не относятся: запросы silk к своим таблицам, EXPLAIN, который silk делает
+# для каждого профилируемого запроса (наш estimate_count использует EXPLAIN (FORMAT JSON)),
+# и служебные команды точек сохранения транзакций.
+IGNORED_SQL_RE = re.compile(r'^(?:EXPLAIN (?!\()|SAVEPOINT |RELEASE SAVEPOINT |ROLLBACK TO SAVEPOINT )|"silk_')
+
+
+def query_shape(sql):
+    """
+    Форма запроса без параметров: списки IN (%s, %s, ...) любой длины сводятся к IN (...).
+    """
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+class QueryRecorder:
+    """
+    Записывает все SQL-запросы внутри блока with через connection.execute_wrapper.
+
+        with QueryRecorder() as recorder:
+            client.get(url)
+        recorder.count, recorder.repeated_shapes()
+    """
+
+    def __init__(self, using=None):
+        self.using = [using] if using else list(connections)
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if not IGNORED_SQL_RE.search(sql):
+                self.queries.append((sql, time.monotonic() - started))
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in self.using:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    def repeated_shapes(self, threshold=N_PLUS_ONE_THRESHOLD):
+        shapes = Counter(query_shape(sql) for sql, _ in self.queries)
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+
+def get_query_budget(view_class, action):
+    """
+    Бюджет запросов view: `query_budget = 5` или `{'list': 6, 'retrieve': 4, 'default': 8}`.
+    None - бюджет не объявлен.
+    """
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        return budget.get(action, budget.get('default'))
+    return budget
+
+
+def resolve_view(view_func, method):
+    """
+    Класс view и действие по функции из URLConf: для ViewSet - имя action, для APIView - HTTP-метод.
+    """
+    view_class = getattr(view_func, 'cls', None)
+    actions = getattr(view_func, 'actions', None)
+    if actions:
+        return view_class, actions.get(method.lower())
+    return view_class, method.lower()
+
+
+def check_queries(recorder, view_class, action):
+    """
+    Список нарушений: превышение бюджета и повторяющиеся формы запросов.
+    """
+    problems = []
+    budget = get_query_budget(view_class, action)
+    if budget is not None and recorder.count > budget:
+        problems.append(f"{view_class.__name__}.{action}: {recorder.count} queries, budget {budget}")
+    for shape, count in recorder.repeated_shapes():
+        problems.append(f"{view_class.__name__}.{action}: possible N+1, {count}x {shape[:200]}")
+    return problems
@@ -0,0 +1,22 @@
+from rest_framework.response import Response
+
+
+class RawJSON(bytes):
+    """
+    Уже готовый JSON (например, собранный в Postgres), который не нужно рендерить заново.
+    """
+
+
+class RawJSONResponse(Response):
+    """
+    Response, тело которого - RawJSON как есть. Проходит обычный путь DRF (заголовки,
+    finalize_response), но без JSONRenderer.
+    """
+
+    def __init__(self, data, **kwargs):
+        super().__init__(RawJSON(data), **kwargs)
+
+    @property
+    def rendered_content(self):
+        self['Content-Type'] = self.content_type or self.accepted_renderer.media_type
+        return bytes(self.data)
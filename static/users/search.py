@@ -0,0 +1,91 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity, TrigramWordSimilarity
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Coalesce, Concat, Extract, Greatest, Ln, Upper
+from .models import Cv
+
+
+# Вес свежести: заказ, созданный на RECENCY_SCALE секунд позже, получает прибавку,
+# равную e-кратному росту релевантности. Оценка не зависит от текущего времени,
+# поэтому порядок стабилен между запросами и годится для курсорной пагинации.
+RECENCY_SCALE = 7 * 24 * 60 * 60
+SEARCH_CONFIGS = ('russian', 'simple')
+
+
+def search_query(text):
+    query = None
+    for config in SEARCH_CONFIGS:
+        part = SearchQuery(text, config=config, search_type='websearch')
+        query = part if query is None else query | part
+    return query
+
+
+def search_orders(queryset, text):
+    """
+    Фильтрует заказы по полнотекстовому запросу и добавляет `search_score`:
+    ln(ts_rank) + created_at / RECENCY_SCALE, т.е. ранг, затухающий со временем.
+    """
+    query = search_query(text)
+    rank = SearchRank(F('search_vector'), query)
+    recency = Cast(Extract('created_at', 'epoch'), FloatField()) / Value(float(RECENCY_SCALE))
+    score = Ln(Cast(rank, FloatField()) + Value(1e-6)) + recency
+    return queryset.filter(search_vector=query).annotate(search_score=score)
+
+
+# Описание в CV длинное и совпадения в нём менее точные, поэтому его вклад в оценку уменьшен.
+BIO_WEIGHT = 0.5
+MIN_PHONE_DIGITS = 4
+
+
+def phone_digits(text):
+    return re.sub(r'\D', '', text)
+
+
+def search_users(text):
+    """
+    Поиск пользователей для поддержки: по имени, фамилии, телефону, Telegram и описанию CV.
+
+    Кандидаты отбираются по триграммным индексам на UPPER(...): короткие поля через similarity (%),
+    описание CV через word_similarity (%>), телефон через LIKE. Затем они сортируются по
+    `search_score` - лучшей похожести среди полей.
+    """
+    User = get_user_model()
+
+    text = text.strip()
+    username = text.lstrip('@')
+    digits = phone_digits(text)
+    candidates = [
+        User.objects.annotate(value=Upper('first_name')).filter(value__trigram_similar=text).values('id'),
+        User.objects.annotate(value=Upper('last_name')).filter(value__trigram_similar=text).values('id'),
+        User.objects.annotate(value=Upper('tg_username')).filter(value__trigram_similar=username).values('id'),
+        Cv.objects.annotate(value=Upper('bio')).filter(value__trigram_word_similar=text).values('owner_id'),
+    ]
+    # Несколько слов ("Али Валиев") ищем и пословно по имени и фамилии.
+    words = text.split()
+    if len(words) > 1:
+        name_match = Q()
+        for word in words:
+            name_match &= Q(first_name__icontains=word) | Q(last_name__icontains=word)
+        candidates.append(User.objects.filter(name_match).values('id'))
+    if len(digits) >= MIN_PHONE_DIGITS:
+        candidates.append(User.objects.filter(phone_number__icontains=digits).values('id'))
+
+    scores = [
+        TrigramSimilarity(Upper('first_name'), Value(text)),
+        TrigramSimilarity(Upper('last_name'), Value(text)),
+        TrigramWordSimilarity(Value(text), Upper(Concat('first_name', Value(' '), 'last_name'))),
+        Coalesce(TrigramSimilarity(Upper('tg_username'), Value(username)), Value(0.0)),
+        Coalesce(TrigramWordSimilarity(Value(text), Upper('cv__bio')), Value(0.0)) * Value(BIO_WEIGHT),
+    ]
+    if len(digits) >= MIN_PHONE_DIGITS:
+        scores.append(Case(When(phone_number__contains=digits, then=Value(1.0)), default=Value(0.0), output_field=FloatField()))
+
+    return (
+        User.objects
+        .filter(id__in=candidates[0].union(*candidates[1:]))
+        .select_related('cv')
+        .annotate(search_score=Greatest(*scores))
+        .order_by('-search_score', 'id')
+    )
@@ -1,8 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import CustomUser, Passport, BankCard, Cv, Category, Order, Proposal, Job, Appeal, Review, Image, Video
+from .models import CustomUser, Passport, BankCard, Cv, Category, Order, Proposal, Job, JobStatusEvent, Appeal, Review, Image, Video
 from .status import RatingChoices
+from .fragments import FragmentCacheMixin, FragmentListSerializer
 from django.contrib.auth.hashers import make_password
+from django.db import transaction
 
 User = get_user_model()
 
@@ -21,14 +23,19 @@ class BankCardSerializer(serializers.ModelSerializer):
         return representation
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(FragmentCacheMixin, serializers.ModelSerializer):
     rating = serializers.ChoiceField(choices=RatingChoices.choices, required=False)
     job = serializers.PrimaryKeyRelatedField(queryset=Job.objects.all())
     whom = serializers.SerializerMethodField()
+    # Связи, которые читают методы get_*, для плана загрузки (users.prefetch).
+    related_hints = {'whom': ('whom__owner__user_id',)}
+    # Колонка, которую возвращает get_whom, для сборки JSON в БД (users.dbjson).
+    json_sources = {'whom': 'whom__owner__user_id'}
 
     class Meta:
         model = Review
         fields = ['id', 'owner', 'whom', 'comment', 'rating', 'job']
+        list_serializer_class = FragmentListSerializer
         extra_kwargs = {
             'owner': {'read_only': True},
             'whom': {'read_only': True}
@@ -42,9 +49,9 @@ class ReviewSerializer(serializers.ModelSerializer):
         user = request.user
         job = validated_data.get('job')
 
-        if 'Customer' in user.roles:
+        if user.has_role('Customer'):
             recipient_user = job.proposal.owner
-        elif 'Worker' in user.roles:
+        elif user.has_role('Worker'):
             recipient_user = job.order.owner
         else:
             raise serializers.ValidationError("User must be either a Customer or a Worker to create a review.")
@@ -56,8 +63,18 @@ class ReviewSerializer(serializers.ModelSerializer):
         validated_data['owner'] = user
         validated_data['whom'] = whom
 
-        review = Review.objects.create(**validated_data)
-        whom.update_rating()
+        with transaction.atomic():
+            review = Review.objects.create(**validated_data)
+            whom.apply_rating_change(int(review.rating), 1)
+        return review
+
+    def update(self, instance, validated_data):
+        old_rating = int(instance.rating)
+        with transaction.atomic():
+            review = super().update(instance, validated_data)
+            rating_delta = int(review.rating) - old_rating
+            if rating_delta:
+                review.whom.apply_rating_change(rating_delta, 0)
         return review
 
     def to_representation(self, instance):
@@ -67,22 +84,24 @@ class ReviewSerializer(serializers.ModelSerializer):
         return representation
 
 
-class CvSerializer(serializers.ModelSerializer):
+class CvSerializer(FragmentCacheMixin, serializers.ModelSerializer):
     reviews = ReviewSerializer(many=True, read_only=True)
-    appeals = serializers.SerializerMethodField()
+    # Счётчики из колонок CV, без запросов к таблицам жалоб и отзывов: appeals - колонка
+    # appeal_count под прежним ключом ответа, review_count - колонка rating_count.
+    appeals = serializers.IntegerField(source='appeal_count', read_only=True)
+    review_count = serializers.IntegerField(source='rating_count', read_only=True)
 
     class Meta:
         model = Cv
-        fields = ['owner', 'image', 'bio', 'rating', 'word_experience', 'appeals', 'reviews']
+        fields = ['owner', 'image', 'bio', 'rating', 'rating_avg', 'word_experience', 'appeals', 'review_count',
+                  'reviews']
+        list_serializer_class = FragmentListSerializer
         extra_kwargs = {
             'owner': {'read_only': True},
-            'reviews': {'read_only': True},
-            'appeals': {'read_only': True}
+            'rating': {'read_only': True},
+            'rating_avg': {'read_only': True},
         }
 
-    def get_appeals(self, obj):
-        return obj.appeals.count()
-
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         if self.context.get('hide_owner'):
@@ -90,7 +109,7 @@ class CvSerializer(serializers.ModelSerializer):
         return representation
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(FragmentCacheMixin, serializers.ModelSerializer):
     bank_card = BankCardSerializer(read_only=True)
     cv = CvSerializer(read_only=True)
 
@@ -100,6 +119,7 @@ class UserSerializer(serializers.ModelSerializer):
             'id', 'user_id', 'first_name', 'last_name', 'full_name', 'password',
             'phone_number', 'birth_date', 'date_created', 'language', 'roles', 'bank_card', 'cv'
         )
+        list_serializer_class = FragmentListSerializer
         extra_kwargs = {
             'password': {'write_only': True, 'required': True},
             'user_id': {'required': True}
@@ -124,6 +144,16 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
+class UserSearchSerializer(serializers.ModelSerializer):
+    cv_bio = serializers.CharField(source='cv.bio', read_only=True, default=None)
+    search_score = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = CustomUser
+        fields = ('id', 'user_id', 'full_name', 'phone_number', 'tg_username', 'roles', 'cv_bio', 'search_score')
+        read_only_fields = fields
+
+
 class PassportSerializer(serializers.ModelSerializer):
     class Meta:
         model = Passport
@@ -139,19 +169,21 @@ class PassportSerializer(serializers.ModelSerializer):
         return representation
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(FragmentCacheMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = '__all__'
+        exclude = ['row_version']
+        list_serializer_class = FragmentListSerializer
 
 
 class ProposalSerializer(serializers.ModelSerializer):
     class Meta:
         model = Proposal
-        fields = ['id', 'order', 'message', 'price', 'status', 'created_at', 'owner']
+        fields = ['id', 'order', 'message', 'price', 'price_amount', 'price_currency', 'status', 'created_at', 'owner']
         extra_kwargs = {
             'order': {'required': True},
-            'owner': {'read_only': True}
+            'owner': {'read_only': True},
+            'price_amount': {'read_only': True}
         }
 
     def to_representation(self, instance):
@@ -179,25 +211,30 @@ class OrderSerializer(serializers.ModelSerializer):
     image_files = serializers.ListField(child=serializers.ImageField(), write_only=True, required=False)
     video_files = serializers.ListField(child=serializers.FileField(), write_only=True, required=False)
     proposals = ProposalSerializer(many=True, read_only=True)
+    # ?expand=category (users.fieldsets)
+    expandable_fields = {'category': CategorySerializer}
 
     class Meta:
         model = Order
-        fields = ['id', 'description', 'location', 'location_link', 'price', 'status', 'created_at', 'owner', 'category', 'images', 'videos', 'image_files', 'video_files', 'proposals']
+        fields = ['id', 'description', 'location', 'location_link', 'price', 'price_amount', 'price_currency', 'status', 'created_at', 'owner', 'category', 'images', 'videos', 'image_files', 'video_files', 'proposals', 'proposal_count']
         extra_kwargs = {
-            'owner': {'read_only': True}
+            'owner': {'read_only': True},
+            'price_amount': {'read_only': True}
         }
 
     def create(self, validated_data):
         image_files = validated_data.pop('image_files', [])
         video_files = validated_data.pop('video_files', [])
         
-        order = super().create(validated_data)
+        # Заказ и его файлы - одной транзакцией: окна ленты сбрасываются один раз после коммита.
+        with transaction.atomic():
+            order = super().create(validated_data)
+
+            for image in image_files:
+                Image.objects.create(order=order, image_file=image)
+            for video in video_files:
+                Video.objects.create(order=order, video_file=video)
 
-        for image in image_files:
-            Image.objects.create(order=order, image_file=image)
-        for video in video_files:
-            Video.objects.create(order=order, video_file=video)
-        
         return order
     
     def to_representation(self, instance):
@@ -207,8 +244,22 @@ class OrderSerializer(serializers.ModelSerializer):
         return representation
 
 
+class OrderFeedSerializer(serializers.ModelSerializer):
+    """
+    Облегчённое представление заказа для ленты работников: без откликов и владельца.
+    """
+    images = ImageSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'description', 'location', 'location_link', 'price', 'price_amount', 'price_currency', 'created_at', 'category', 'images']
+        read_only_fields = fields
+
+
 class AppealSerializer(serializers.ModelSerializer):
     whom = serializers.SerializerMethodField()
+    related_hints = {'whom': ('whom__owner__user_id',)}
+    json_sources = {'whom': 'whom__owner__user_id'}
 
     class Meta:
         model = Appeal
@@ -226,9 +277,9 @@ class AppealSerializer(serializers.ModelSerializer):
         user = request.user
         job = validated_data.get('job')
 
-        if 'Customer' in user.roles:
+        if user.has_role('Customer'):
             recipient_user = job.proposal.owner
-        elif 'Worker' in user.roles:
+        elif user.has_role('Worker'):
             recipient_user = job.order.owner
         else:
             raise serializers.ValidationError("User must be either a Customer or a Worker to create an appeal.")
@@ -252,9 +303,16 @@ class AppealSerializer(serializers.ModelSerializer):
 class JobSerializer(serializers.ModelSerializer):
     appeals = AppealSerializer(many=True, required=False, allow_null=True)
     reviews = ReviewSerializer(many=True, required=False, allow_null=True)
-    
+    expandable_fields = {'order': OrderFeedSerializer, 'proposal': ProposalSerializer}
+
     class Meta:
         model = Job
-        fields = ['id', 'order', 'proposal', 'price', 'status', 'created_at', 'assignee',\
-                  'status_history', 'appeals', 'reviews', 'payment_confirmed_by_customer',\
+        fields = ['id', 'order', 'proposal', 'price', 'price_amount', 'price_currency', 'status', 'created_at', 'assignee',\
+                  'appeals', 'reviews', 'payment_confirmed_by_customer',\
                   'payment_confirmed_by_worker', 'review_written_by_worker', 'review_written_by_customer']
+
+
+class JobStatusEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = JobStatusEvent
+        fields = ['id', 'from_status', 'to_status', 'created_at']
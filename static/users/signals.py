@@ -1,8 +1,13 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 
-from .models import Proposal, Job
+from .models import Order, Image, Video, Proposal, Job, Review, Appeal, Cv, OutboxEvent, shift_counter, change_markers, \
+                    job_status_changed, job_payment_changed
+from .cache import bump_versions
+from .events import publish
+from .outbox import record_event, outbox_handler
+from .feed import invalidate_windows_on_commit
 from .status import  ProposalStatusChoices, JobStatusChoices, PaymentStatusChoices
 
 
@@ -16,30 +21,124 @@ def create_job_on_proposal_approval(sender, instance, **kwargs):
             order=instance.order,
             proposal=instance,
             price=instance.price,
+            price_currency=instance.price_currency,
             status=JobStatusChoices.INPROGRESS,
             assignee=instance.owner,
-            status_history=None,
         )
 
 
-@receiver(post_save, sender=Job)
-def update_status_based_on_payment(sender, instance, **kwargs):
-    if instance.payment_confirmed_by_customer == PaymentStatusChoices.APPROVED and instance.payment_confirmed_by_worker == PaymentStatusChoices.APPROVED:
-        if instance.status == JobStatusChoices.PAYMENT:
-            instance.status = JobStatusChoices.REVIEW
-        if instance.status == JobStatusChoices.WARNING:
-            instance.status = JobStatusChoices.REVIEW  
+@receiver(post_save, sender=Proposal)
+def update_order_proposal_count(sender, instance, created, **kwargs):
+    was_counted = not created and instance._loaded_status in Proposal.COUNTED_STATUSES
+    delta = int(instance.counted) - int(was_counted)
+    if delta:
+        shift_counter(Order, instance.order_id, 'proposal_count', delta)
+
+
+@receiver(post_delete, sender=Proposal)
+def decrement_order_proposal_count(sender, instance, **kwargs):
+    if instance.counted:
+        shift_counter(Order, instance.order_id, 'proposal_count', -1)
+
+
+@receiver(post_save, sender=Appeal)
+def increment_cv_appeal_count(sender, instance, created, **kwargs):
+    if created:
+        shift_counter(Cv, instance.whom_id, 'appeal_count', 1)
+
+
+@receiver(post_delete, sender=Appeal)
+def decrement_cv_appeal_count(sender, instance, **kwargs):
+    shift_counter(Cv, instance.whom_id, 'appeal_count', -1)
+
+
+@receiver([post_save, post_delete], sender=Proposal)
+@receiver([post_save, post_delete], sender=Image)
+@receiver([post_save, post_delete], sender=Video)
+def touch_order(sender, instance, **kwargs):
+    # Отклики, фото и видео входят в ответ заказа: его updated_at (и ETag) должен меняться вместе с ними.
+    Order.objects.filter(pk=instance.order_id).update(**change_markers(Order))
+
+
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete], sender=Appeal)
+def touch_job(sender, instance, **kwargs):
+    Job.objects.filter(pk=instance.job_id).update(**change_markers(Job))
+
+
+@receiver([post_save, post_delete])
+def bump_cached_responses(sender, **kwargs):
+    if sender._meta.app_label == 'users' and sender is not OutboxEvent:
+        bump_versions(sender)
+
+
+@receiver([post_save, post_delete], sender=Order)
+def invalidate_order_feed(sender, instance, **kwargs):
+    invalidate_windows_on_commit(instance.category_id, instance._loaded_category_id)
+
+
+@receiver([post_save, post_delete], sender=Image)
+def invalidate_order_feed_on_image_change(sender, instance, **kwargs):
+    if Image.order.is_cached(instance):
+        category_id = instance.order.category_id
+    else:
+        category_id = Order.objects.filter(pk=instance.order_id).values_list('category_id', flat=True).first()
+    invalidate_windows_on_commit(category_id)
 
-    elif instance.payment_confirmed_by_customer == PaymentStatusChoices.PROBLEM or instance.payment_confirmed_by_worker == PaymentStatusChoices.PROBLEM:
-        if instance.status == JobStatusChoices.PAYMENT:
-            instance.status = JobStatusChoices.WARNING
-        
-    if instance.pk and instance.status != Job.objects.get(pk=instance.pk).status:
-        instance.save(update_fields=['status', 'status_history'])
+
+# События outbox пишутся в транзакции изменения (Order/Proposal.save, Job.save, Job.transition и
+# Job.set_payment_status атомарны), а их обработчики ниже и в stats.signals выполняет relay_outbox.
+
+@receiver(post_save, sender=Order)
+def record_order_created(sender, instance, created, **kwargs):
+    if created:
+        record_event('order', instance.pk, 'order.created', category=instance.category_id)
+
+
+@receiver(post_save, sender=Proposal)
+def record_proposal_created(sender, instance, created, **kwargs):
+    if created:
+        record_event(
+            'proposal', instance.pk, 'proposal.created',
+            order=instance.order_id,
+            order_owner=instance.order.owner_id,
+            category=instance.order.category_id,
+            created_at=instance.created_at.isoformat(),
+        )
 
 
 @receiver(post_save, sender=Job)
-def update_job_status_to_completed(sender, instance, **kwargs):
-    if instance.review_written_by_customer and instance.review_written_by_worker:
-        instance.status = JobStatusChoices.COMPLETED
-        instance.save(update_fields=['status', 'status_history'])
\ No newline at end of file
+def record_job_created(sender, instance, created, **kwargs):
+    if created:
+        record_event('job', instance.pk, 'job.created', order=instance.order_id, proposal=instance.proposal_id)
+
+
+@receiver(job_status_changed, sender=Job)
+def record_job_status_changed(sender, job, from_status, to_status, **kwargs):
+    record_event('job', job.pk, 'job.status_changed', from_status=from_status, to_status=to_status)
+
+
+@receiver(job_payment_changed, sender=Job)
+def record_job_payment_changed(sender, job, side, payment_status, **kwargs):
+    record_event('job', job.pk, 'job.payment_changed', side=side, payment_status=payment_status)
+
+
+def job_participants(job_id):
+    return Job.objects.filter(pk=job_id).values_list('order__owner_id', 'proposal__owner_id').first() or ()
+
+
+@outbox_handler('proposal.created')
+def push_new_proposal(event):
+    publish([event.payload['order_owner']], 'proposal.created', {'order': event.payload['order'], 'proposal': event.aggregate_id})
+
+
+@outbox_handler('job.status_changed')
+def push_job_status(event):
+    data = {'job': event.aggregate_id, 'from_status': event.payload['from_status'], 'to_status': event.payload['to_status']}
+    publish(job_participants(event.aggregate_id), 'job.status_changed', data)
+
+
+@outbox_handler('job.payment_changed')
+def push_payment_confirmed(event):
+    if event.payload['payment_status'] == PaymentStatusChoices.APPROVED:
+        publish(job_participants(event.aggregate_id), 'job.payment_confirmed', {'job': event.aggregate_id, 'side': event.payload['side']})
@@ -7,6 +7,17 @@ class RoleChoices(models.TextChoices):
     WORKER = 'Worker', 'Работник'
 
 
+# Бит роли в маске CustomUser.role_mask. Новые роли добавлять только в конец RoleChoices.
+ROLE_FLAGS = {role: 1 << index for index, role in enumerate(RoleChoices.values)}
+
+
+def role_mask(roles):
+    mask = 0
+    for role in roles or ():
+        mask |= ROLE_FLAGS.get(role, 0)
+    return mask
+
+
 class LanguageChoices(models.TextChoices):
     RUSSIAN = 'Russian', 'Русский'
     UZBEK = 'Uzbek', 'Uzbek'
@@ -41,6 +52,15 @@ class JobStatusChoices(models.TextChoices):
     COMPLETED = "completed", "Completed"
 
 
+JOB_STATUS_TRANSITIONS = {
+    JobStatusChoices.INPROGRESS: (JobStatusChoices.PAYMENT, JobStatusChoices.WARNING),
+    JobStatusChoices.PAYMENT: (JobStatusChoices.REVIEW, JobStatusChoices.WARNING),
+    JobStatusChoices.WARNING: (JobStatusChoices.REVIEW,),
+    JobStatusChoices.REVIEW: (JobStatusChoices.COMPLETED,),
+    JobStatusChoices.COMPLETED: (),
+}
+
+
 class AppealTypeChoices(models.TextChoices):
     PAYMENT = 'Payment', 'Оплата'
     JOB = 'Job', 'Работа'
@@ -49,4 +69,9 @@ class AppealTypeChoices(models.TextChoices):
 class PaymentStatusChoices(models.TextChoices):
     APPROVED = "Approved", "approved"
     PROBLEM = "Problem", "problem"
-    DEFAULT = "Default", "default"
\ No newline at end of file
+    DEFAULT = "Default", "default"
+
+
+class CurrencyChoices(models.TextChoices):
+    UZS = "UZS", "Сум"
+    USD = "USD", "Доллар"
\ No newline at end of file
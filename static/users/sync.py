@@ -0,0 +1,103 @@
+import time
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from .models import ChangeLog, Order, Proposal, Job, Review, Appeal
+from .prefetch import plan_for
+from .serializers import OrderSerializer, ProposalSerializer, JobSerializer, ReviewSerializer, AppealSerializer
+
+
+# Имя сущности в журнале (его пишет триггер из миграции 0039) -> модель и сериализатор её списка.
+SYNC_ENTITIES = {
+    'orders': (Order, OrderSerializer),
+    'proposals': (Proposal, ProposalSerializer),
+    'jobs': (Job, JobSerializer),
+    'reviews': (Review, ReviewSerializer),
+    'appeals': (Appeal, AppealSerializer),
+}
+# Сколько строк журнала разбирается за один запрос, остальное - следующим (has_more).
+SYNC_LIMIT = 500
+# Сколько хранится журнал (команда prune_changelog). С более старым токеном клиент
+# получает 410 и загружает списки заново.
+CHANGELOG_RETENTION = timedelta(days=7)
+
+
+def make_token(txid, last_id, issued):
+    return f'{txid}.{last_id}.{issued}'
+
+
+def parse_token(token):
+    try:
+        txid, last_id, issued = (int(part) for part in token.split('.'))
+    except ValueError:
+        raise ValidationError({'since': ['Invalid sync token.']})
+    return txid, last_id, issued
+
+
+def token_expired(issued):
+    return issued < time.time() - CHANGELOG_RETENTION.total_seconds()
+
+
+def visible_horizon():
+    """
+    Номер самой старой ещё не завершённой транзакции: все записи журнала с меньшим txid
+    уже зафиксированы или откачены, и новые с таким txid не появятся.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint')
+        return cursor.fetchone()[0]
+
+
+def current_token():
+    return make_token(visible_horizon(), 0, int(time.time()))
+
+
+def sync_changes(request, token):
+    """
+    Изменения, видимые пользователю, после токена: {'token', 'has_more', 'changes'}, где changes -
+    {'orders': {'updated': [...], 'deleted': [id, ...]}, ...}. Объект, изменённый несколько раз,
+    отдаётся один раз в текущем виде.
+
+    Читаются только строки журнала завершённых транзакций (txid ниже горизонта), а позиция в
+    журнале - пара (txid, id). Поэтому транзакция, которая зафиксируется позже, не окажется
+    позади уже выданного токена, даже если номер её строки меньше. Пока в БД открыта долгая
+    транзакция, горизонт стоит, и изменения просто приходят позже.
+    """
+    txid, last_id, issued = parse_token(token)
+    horizon = visible_horizon()
+
+    entries = ChangeLog.objects.filter(txid__lt=horizon).filter(Q(txid__gt=txid) | Q(txid=txid, id__gt=last_id))
+    user = request.user
+    if not user.has_role('Admin'):
+        entries = entries.filter(audience__contains=[user.pk])
+    entries = list(entries.order_by('txid', 'id').values_list('id', 'txid', 'entity', 'object_id', 'deleted')[:SYNC_LIMIT + 1])
+
+    has_more = len(entries) > SYNC_LIMIT
+    entries = entries[:SYNC_LIMIT]
+    if has_more:
+        next_token = make_token(entries[-1][1], entries[-1][0], issued)
+    else:
+        next_token = make_token(horizon, 0, int(time.time()))
+
+    latest = {}
+    for _, _, entity, object_id, deleted in entries:
+        latest[entity, object_id] = deleted
+
+    changes = {}
+    for entity, (model, serializer_class) in SYNC_ENTITIES.items():
+        updated_ids = [object_id for (name, object_id), deleted in latest.items() if name == entity and not deleted]
+        deleted_ids = [object_id for (name, object_id), deleted in latest.items() if name == entity and deleted]
+        updated = []
+        if updated_ids:
+            queryset = plan_for(serializer_class).apply(model.objects.filter(pk__in=updated_ids).order_by('pk'))
+            objects = list(queryset)
+            updated = serializer_class(objects, many=True, context={'request': request}).data
+            # Удалён уже после горизонта: его строка журнала придёт следующим запросом, но объекта уже нет.
+            found = {obj.pk for obj in objects}
+            deleted_ids += [object_id for object_id in updated_ids if object_id not in found]
+        changes[entity] = {'updated': updated, 'deleted': sorted(deleted_ids)}
+
+    return {'token': next_token, 'has_more': has_more, 'changes': changes}
@@ -0,0 +1,16 @@
+from celery import shared_task
+from django.core.management import call_command
+
+@shared_task
+def reconcile_counters():
+    call_command('reconcile_counters')
+
+
+@shared_task
+def prune_changelog():
+    call_command('prune_changelog')
+
+
+@shared_task
+def relay_outbox():
+    call_command('relay_outbox')
@@ -1,7 +1,33 @@
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
 from rest_framework import status
-from django.urls import reverse
+from django.urls import reverse, resolve
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.cache import cache
+from .models import Category, Order, Proposal, Job, Cv, Review, Appeal, Image, Video, ChangeLog, OutboxEvent, shift_counter
+from .responses import RawJSON
+from .views import CategoryViewSet
+from .queries import QueryRecorder, check_queries, resolve_view, get_query_budget
+from .prefetch import plan_for, NESTED_LIMIT
+from .serializers import JobSerializer, UserSerializer, OrderSerializer, ReviewSerializer
+from .fragments import FragmentCacheMixin
+from .status import JobStatusChoices, ProposalStatusChoices, PaymentStatusChoices, AppealTypeChoices, CurrencyChoices
+from decimal import Decimal
+from datetime import timedelta
+from django.utils import timezone
+from io import StringIO
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from django.db import connection, transaction
+from . import sync
+from .events import EventHub, EventStreamApp, publish, user_channel
+from . import outbox
+from .outbox import relay
+from rest_framework_simplejwt.tokens import AccessToken
+from django.conf import settings
+from django_redis import get_redis_connection
+import asyncio
+import threading
 
 User = get_user_model()
 
@@ -87,3 +113,1128 @@ class APITestCases(APITestCase):
         self.client.force_authenticate(user=self.user)
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class CursorPaginationTestCases(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            user_id='2233445',
+            password='testpassword',
+            roles=['Admin', 'Customer']
+        )
+        self.client.force_authenticate(user=self.user)
+        category = Category.objects.create(name='Сантехника')
+        for i in range(5):
+            Order.objects.create(owner=self.user, category=category, description=f'Order {i}', location='Ташкент', price='100')
+
+    def test_order_list_cursor_pages(self):
+        url = reverse('order-list')
+        response = self.client.get(url, {'pagination': 'cursor', 'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertEqual([o['description'] for o in response.data['results']], ['Order 4', 'Order 3'])
+
+        seen = [o['id'] for o in response.data['results']]
+        next_url = response.data['next']
+        while next_url:
+            response = self.client.get(next_url)
+            seen.extend(o['id'] for o in response.data['results'])
+            next_url = response.data['next']
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_order_list_cursor_with_count(self):
+        url = reverse('order-list')
+        response = self.client.get(url, {'pagination': 'cursor', 'count': 'exact'})
+        self.assertEqual(response.data['count'], 5)
+        response = self.client.get(url, {'pagination': 'cursor', 'count': 'estimate'})
+        self.assertIsInstance(response.data['count'], int)
+
+    def test_order_list_page_mode_by_default(self):
+        url = reverse('order-list')
+        response = self.client.get(url)
+        self.assertEqual(response.data['count'], 5)
+
+
+class PriceFilterTestCases(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            user_id='3344556',
+            password='testpassword',
+            roles=['Admin', 'Customer']
+        )
+        self.client.force_authenticate(user=self.user)
+        category = Category.objects.create(name='Электрика')
+        for price in ['50 000', '150000 сум', '300000', 'договорная']:
+            Order.objects.create(owner=self.user, category=category, description=price, location='Ташкент', price=price)
+
+    def test_price_amount_parsed_on_save(self):
+        amounts = dict(Order.objects.values_list('description', 'price_amount'))
+        self.assertEqual(amounts['50 000'], Decimal('50000'))
+        self.assertEqual(amounts['150000 сум'], Decimal('150000'))
+        self.assertIsNone(amounts['договорная'])
+
+    def test_thousands_separators_and_currency(self):
+        category = Category.objects.first()
+        for price in ['150,000', '1.500.000', '1,500,000.50', '100$']:
+            Order.objects.create(owner=self.user, category=category, description=price, location='Ташкент', price=price)
+        parsed = {description: (amount, currency) for description, amount, currency in Order.objects.values_list('description', 'price_amount', 'price_currency')}
+        self.assertEqual(parsed['150,000'], (Decimal('150000'), CurrencyChoices.UZS))
+        self.assertEqual(parsed['1.500.000'], (Decimal('1500000'), CurrencyChoices.UZS))
+        self.assertEqual(parsed['1,500,000.50'], (Decimal('1500000.50'), CurrencyChoices.UZS))
+        self.assertEqual(parsed['100$'], (Decimal('100'), CurrencyChoices.USD))
+
+    def test_order_list_price_range(self):
+        url = reverse('order-list')
+        response = self.client.get(url, {'min_price': 100000, 'max_price': 200000})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([o['description'] for o in response.data['results']], ['150000 сум'])
+
+
+
+class MarketplaceTestCase(APITestCase):
+    """
+    Заказчик, работник с CV, заказ и одобренный отклик (с созданным Job).
+    """
+
+    def setUp(self):
+        # Фрагменты (users.fragments) ключуются по pk, а последовательности в новой тестовой БД начинаются заново.
+        cache.clear()
+        self.customer = User.objects.create_user(user_id='5000001', password='testpassword', roles=['Customer'])
+        self.worker = User.objects.create_user(user_id='5000002', password='testpassword', roles=['Worker'])
+        self.customer_cv = Cv.objects.create(owner=self.customer, bio='Заказчик')
+        self.worker_cv = Cv.objects.create(owner=self.worker, bio='Сантехник')
+        self.category = Category.objects.create(name='Сантехника')
+        self.order = Order.objects.create(owner=self.customer, category=self.category, description='Починить кран', location='Чиланзар', price='200000')
+        self.proposal = Proposal.objects.create(owner=self.worker, order=self.order, message='Сделаю', price='200000')
+        self.proposal.status = ProposalStatusChoices.APPROVED
+        self.proposal.save()
+        self.job = Job.objects.get(proposal=self.proposal)
+
+
+class CvRatingTestCases(MarketplaceTestCase):
+
+    def test_review_updates_rating_counters(self):
+        Job.objects.filter(pk=self.job.pk).update(status=JobStatusChoices.REVIEW)
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.post(reverse('job-review', args=[self.job.pk]), {'rating': '4', 'comment': 'Хорошо'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.worker_cv.refresh_from_db()
+        self.assertEqual(self.worker_cv.rating_sum, 4)
+        self.assertEqual(self.worker_cv.rating_count, 1)
+        self.assertEqual(self.worker_cv.rating_avg, Decimal('4'))
+        self.assertEqual(self.worker_cv.rating, '4')
+
+        self.worker_cv.apply_rating_change(5, 1)
+        self.worker_cv.refresh_from_db()
+        self.assertEqual(self.worker_cv.rating_avg, Decimal('4.5'))
+        self.assertEqual(self.worker_cv.rating, '5')
+
+    def test_reconcile_fixes_drift(self):
+        Review.objects.create(job=self.job, owner=self.customer, whom=self.worker_cv, rating=3)
+        Review.objects.create(job=self.job, owner=self.customer, whom=self.worker_cv, rating=4)
+        call_command('reconcile_cv_ratings', stdout=StringIO())
+
+        self.worker_cv.refresh_from_db()
+        self.assertEqual((self.worker_cv.rating_sum, self.worker_cv.rating_count), (7, 2))
+        self.assertEqual(self.worker_cv.rating_avg, Decimal('3.5'))
+        self.assertEqual(self.worker_cv.rating, '4')
+
+
+class JobTimelineTestCases(MarketplaceTestCase):
+
+    def test_status_changes_are_logged(self):
+        self.client.force_authenticate(user=self.worker)
+        response = self.client.post(reverse('job-work-done', args=[self.job.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('status_history', response.data)
+
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.get(reverse('job-timeline', args=[self.job.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(e['from_status'], e['to_status']) for e in response.data['results']],
+            [(JobStatusChoices.INPROGRESS, JobStatusChoices.PAYMENT), (None, JobStatusChoices.INPROGRESS)]
+        )
+
+    def test_save_without_status_change_writes_no_event(self):
+        job = Job.objects.get(pk=self.job.pk)
+        job.review_written_by_worker = True
+        job.save()
+        self.assertEqual(job.status_events.count(), 1)
+
+
+class JobStateMachineTestCases(MarketplaceTestCase):
+
+    def test_both_payment_confirmations_move_job_to_review(self):
+        Job.objects.filter(pk=self.job.pk).update(status=JobStatusChoices.PAYMENT)
+        customer_view = Job.objects.get(pk=self.job.pk)
+        worker_view = Job.objects.get(pk=self.job.pk)
+
+        self.assertFalse(customer_view.set_payment_status('customer', PaymentStatusChoices.APPROVED))
+        self.assertTrue(worker_view.set_payment_status('worker', PaymentStatusChoices.APPROVED))
+        self.assertFalse(customer_view.transition(JobStatusChoices.REVIEW))
+
+        job = Job.objects.get(pk=self.job.pk)
+        self.assertEqual(job.status, JobStatusChoices.REVIEW)
+        self.assertEqual(job.status_events.filter(to_status=JobStatusChoices.REVIEW).count(), 1)
+
+    def test_payment_problem_moves_job_to_warning(self):
+        self.client.force_authenticate(user=self.worker)
+        self.client.post(reverse('job-work-done', args=[self.job.pk]))
+        response = self.client.post(reverse('job-problem-payment-worker', args=[self.job.pk]))
+        self.assertEqual(response.data['status'], JobStatusChoices.WARNING)
+
+    def test_invalid_transition_is_rejected(self):
+        self.client.force_authenticate(user=self.worker)
+        self.assertEqual(self.client.post(reverse('job-work-done', args=[self.job.pk])).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.post(reverse('job-work-done', args=[self.job.pk])).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reviews_from_both_sides_complete_job(self):
+        Job.objects.filter(pk=self.job.pk).update(status=JobStatusChoices.REVIEW)
+        for user in (self.customer, self.worker):
+            self.client.force_authenticate(user=user)
+            response = self.client.post(reverse('job-review', args=[self.job.pk]), {'rating': '5', 'comment': 'Отлично'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse('job-review', args=[self.job.pk]), {'rating': '5', 'comment': 'Отлично'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Job.objects.get(pk=self.job.pk).status, JobStatusChoices.COMPLETED)
+
+    def appeal(self, to=AppealTypeChoices.JOB):
+        self.client.force_authenticate(user=self.customer)
+        return self.client.post(reverse('job-appeal', args=[self.job.pk]), {'appeals': [{'to': to, 'problem': 'Опоздал'}]}, format='json')
+
+    def test_appeal_moves_job_to_warning(self):
+        self.assertEqual(self.appeal().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Job.objects.get(pk=self.job.pk).status, JobStatusChoices.WARNING)
+        self.assertEqual(Appeal.objects.filter(job=self.job).count(), 1)
+
+    def test_appeal_is_rejected_when_job_cannot_enter_warning(self):
+        Job.objects.filter(pk=self.job.pk).update(status=JobStatusChoices.COMPLETED)
+        self.assertEqual(self.appeal().status_code, status.HTTP_400_BAD_REQUEST)
+        Job.objects.filter(pk=self.job.pk).update(status=JobStatusChoices.INPROGRESS)
+        self.assertEqual(self.appeal(to='Unknown').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Job.objects.get(pk=self.job.pk).status, JobStatusChoices.INPROGRESS)
+        self.assertFalse(Appeal.objects.filter(job=self.job).exists())
+
+
+class ResponseCacheTestCases(MarketplaceTestCase):
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.client.force_authenticate(user=self.worker)
+
+    def test_detail_is_served_from_cache_until_write(self):
+        url = reverse('cv-detail', args=[self.worker_cv.pk])
+        self.assertEqual(self.client.get(url).data['bio'], 'Сантехник')
+
+        Cv.objects.filter(pk=self.worker_cv.pk).update(bio='Электрик')
+        self.assertEqual(self.client.get(url).data['bio'], 'Сантехник')
+
+        self.worker_cv.bio = 'Электрик'
+        self.worker_cv.save()
+        self.assertEqual(self.client.get(url).data['bio'], 'Электрик')
+
+    def test_related_write_invalidates_list(self):
+        url = reverse('cv-list')
+        self.assertEqual(self.client.get(url).data['results'][0]['review_count'], 0)
+        Review.objects.create(job=self.job, whom=self.worker_cv, owner=self.customer, rating=5, comment='Отлично')
+        self.worker_cv.apply_rating_change(5, 1)
+        self.assertEqual(self.client.get(url).data['results'][0]['review_count'], 1)
+
+    def test_cache_is_per_user(self):
+        url = reverse('cv-list')
+        self.client.get(url)
+        self.client.force_authenticate(user=self.customer)
+        results = self.client.get(url).data['results']
+        self.assertEqual([cv['bio'] for cv in results], ['Заказчик'])
+
+
+class OrderFeedTestCases(MarketplaceTestCase):
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.other_category = Category.objects.create(name='Электрика')
+        self.electric_order = Order.objects.create(owner=self.customer, category=self.other_category, description='Заменить розетку', location='Юнусабад', price='100000')
+        self.client.force_authenticate(user=self.worker)
+
+    def feed(self, **params):
+        return self.client.get(reverse('order-feed'), params)
+
+    def test_feed_lists_open_orders_newest_first(self):
+        response = self.feed()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([order['id'] for order in response.data['results']], [self.electric_order.pk, self.order.pk])
+        self.assertNotIn('proposals', response.data['results'][0])
+
+    def test_feed_is_for_workers(self):
+        self.client.force_authenticate(user=self.customer)
+        self.assertEqual(self.feed().status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_category_filter(self):
+        response = self.feed(category=f'{self.category.pk}')
+        self.assertEqual([order['id'] for order in response.data['results']], [self.order.pk])
+        response = self.feed(category=f'{self.category.pk},{self.other_category.pk}')
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_price_filter_reads_database(self):
+        response = self.feed(max_price='150000')
+        self.assertEqual([order['id'] for order in response.data['results']], [self.electric_order.pk])
+
+    def test_next_link_continues_after_cached_page(self):
+        response = self.feed(page_size=1)
+        self.assertEqual(response.data['results'][0]['id'], self.electric_order.pk)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([order['id'] for order in response.data['results']], [self.order.pk])
+        self.assertIsNone(response.data['next'])
+
+    def test_window_is_refreshed_on_commit(self):
+        self.feed()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_authenticate(user=self.customer)
+            self.client.post(reverse('order-deactivate-order', args=[self.electric_order.pk]))
+        self.client.force_authenticate(user=self.worker)
+        self.assertEqual([order['id'] for order in self.feed().data['results']], [self.order.pk])
+
+    def test_one_invalidation_per_transaction(self):
+        self.feed()
+        with mock.patch('users.feed.build_window') as build_window, mock.patch('users.feed.cache') as feed_cache:
+            with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+                order = Order.objects.create(owner=self.customer, category=self.category, description='С фото', location='Чиланзар', price='100')
+                for index in range(3):
+                    Image.objects.create(order=order, image_file=f'orders/{index}.jpg')
+        build_window.assert_not_called()
+        feed_cache.delete_many.assert_called_once()
+        self.assertLessEqual({'orders:feed:all', f'orders:feed:{self.category.pk}'}, set(feed_cache.delete_many.call_args.args[0]))
+
+    def test_search_matches_word_forms(self):
+        response = self.feed(search='кран')
+        self.assertEqual([order['id'] for order in response.data['results']], [self.order.pk])
+        response = self.feed(search='розетки юнусабад')
+        self.assertEqual([order['id'] for order in response.data['results']], [self.electric_order.pk])
+        self.assertEqual(self.feed(search='кран юнусабад').data['results'], [])
+
+    def test_search_vector_follows_edits(self):
+        self.order.description = 'Покрасить забор'
+        self.order.save()
+        self.assertEqual(self.feed(search='кран').data['results'], [])
+        self.assertEqual(len(self.feed(search='забор').data['results']), 1)
+
+    def test_search_prefers_relevance_then_recency(self):
+        newer = Order.objects.create(owner=self.customer, category=self.category, description='Кран течёт, кран старый, заменить кран', location='Чиланзар', price='50000')
+        response = self.feed(search='кран', page_size=1)
+        self.assertEqual(response.data['results'][0]['id'], newer.pk)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([order['id'] for order in response.data['results']], [self.order.pk])
+
+
+class OrderGeoTestCases(MarketplaceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Чиланзар и Юнусабад в Ташкенте - около 10 км друг от друга
+        self.order.location_link = 'https://www.google.com/maps/place/Chilanzar/@41.2856,69.2034,15z'
+        self.order.save()
+        self.far_order = Order.objects.create(owner=self.customer, category=self.category, description='Повесить полку', location='Юнусабад',
+                                              location_link='https://yandex.uz/maps/10335/tashkent/?ll=69.2847%2C41.3650&z=16', price='80000')
+        self.client.force_authenticate(user=self.worker)
+
+    def test_location_link_is_parsed(self):
+        from .geo import parse_location_link, encode_geohash
+        self.assertEqual(parse_location_link('41.3111, 69.2797'), (41.3111, 69.2797))
+        self.assertEqual(parse_location_link('https://maps.google.com/?q=41.3111,69.2797'), (41.3111, 69.2797))
+        self.assertIsNone(parse_location_link('https://t.me/some_channel'))
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+
+        self.far_order.refresh_from_db()
+        self.assertAlmostEqual(self.far_order.latitude, 41.3650)
+        self.assertAlmostEqual(self.far_order.longitude, 69.2847)
+        self.assertTrue(self.far_order.geohash.startswith('tx37'))
+
+    def test_near_filter_uses_radius(self):
+        response = self.client.get(reverse('order-feed'), {'near': '41.2900,69.2100', 'radius_km': '3'})
+        self.assertEqual([order['id'] for order in response.data['results']], [self.order.pk])
+        response = self.client.get(reverse('order-feed'), {'near': '41.2900,69.2100', 'radius_km': '20'})
+        self.assertEqual({order['id'] for order in response.data['results']}, {self.order.pk, self.far_order.pk})
+
+    def test_near_filter_validates_input(self):
+        response = self.client.get(reverse('order-feed'), {'near': 'Ташкент'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('order-feed'), {'near': '41.29,69.21', 'radius_km': '500'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_backfill_command(self):
+        Order.objects.update(latitude=None, longitude=None, geohash=None)
+        call_command('backfill_order_coordinates', stdout=StringIO())
+        self.assertEqual(Order.objects.filter(geohash__isnull=False).count(), 2)
+
+
+class UserSearchTestCases(APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(user_id='6000001', password='testpassword', roles=['Admin'])
+        self.plumber = User.objects.create_user(user_id='6000002', password='testpassword', roles=['Worker'], first_name='Алишер', last_name='Валиев',
+                                                phone_number='+998901234567', tg_username='alisher_v')
+        self.electrician = User.objects.create_user(user_id='6000003', password='testpassword', roles=['Worker'], first_name='Бобур', last_name='Каримов',
+                                                    phone_number='+998907654321')
+        Cv.objects.create(owner=self.electrician, bio='Электрик, монтаж проводки и щитков')
+        self.client.force_authenticate(user=self.admin)
+
+    def search(self, q):
+        return self.client.get(reverse('user-search'), {'q': q})
+
+    def test_search_tolerates_typos(self):
+        response = self.search('Валеев')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['id'], self.plumber.pk)
+
+    def test_search_by_phone_username_and_bio(self):
+        self.assertEqual(self.search('90 765 43 21').data[0]['id'], self.electrician.pk)
+        self.assertEqual(self.search('@alisher_v').data[0]['id'], self.plumber.pk)
+        self.assertEqual(self.search('электрик').data[0]['id'], self.electrician.pk)
+
+    def test_search_is_admin_only(self):
+        self.client.force_authenticate(user=self.plumber)
+        self.assertEqual(self.search('Валиев').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_list_filters_by_full_name_and_phone(self):
+        response = self.client.get(reverse('user-list'), {'full_name': 'бобур карим'})
+        self.assertEqual([user['id'] for user in response.data['results']], [self.electrician.pk])
+        response = self.client.get(reverse('user-list'), {'phone_number': '90-123'})
+        self.assertEqual([user['id'] for user in response.data['results']], [self.plumber.pk])
+
+
+class UserRoleTestCases(APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(user_id='7000001', password='testpassword', roles=['Admin'])
+        self.worker = User.objects.create_user(user_id='7000002', password='testpassword', roles=['Worker'])
+        self.both = User.objects.create_user(user_id='7000003', password='testpassword', roles=['Worker', 'Customer'])
+
+    def test_has_role_uses_cached_mask(self):
+        self.assertTrue(self.both.has_role('Customer'))
+        self.assertTrue(self.worker.has_role('Admin', 'Worker'))
+        self.assertFalse(self.worker.has_role('Customer'))
+
+        self.worker.roles.append('Customer')
+        self.worker.save()
+        self.assertTrue(self.worker.has_role('Customer'))
+
+    def test_queryset_helpers(self):
+        self.assertEqual(set(User.objects.with_roles('Worker', 'Customer')), {self.both})
+        self.assertEqual(set(User.objects.with_any_role('Admin', 'Customer')), {self.admin, self.both})
+
+    def test_role_filters(self):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(reverse('user-list'), {'roles': 'Worker'})
+        self.assertEqual({user['id'] for user in response.data['results']}, {self.worker.pk, self.both.pk})
+        response = self.client.get(reverse('user-list'), {'roles_any': 'Admin,Customer'})
+        self.assertEqual({user['id'] for user in response.data['results']}, {self.admin.pk, self.both.pk})
+        response = self.client.get(reverse('user-list'), {'roles': 'Work'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class QueryBudgetTestCases(MarketplaceTestCase):
+    """
+    Каждый эндпоинт укладывается в объявленный query_budget и не делает повторяющихся запросов,
+    даже когда в выдаче несколько строк.
+    """
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.admin = User.objects.create_user(user_id='8000001', password='testpassword', roles=['Admin'])
+        for index in range(3):
+            worker = User.objects.create_user(user_id=f'800001{index}', password='testpassword', roles=['Worker'])
+            cv = Cv.objects.create(owner=worker, bio=f'Мастер {index}')
+            order = Order.objects.create(owner=self.customer, category=self.category, description=f'Заказ {index}', location='Чиланзар', price='100000')
+            proposal = Proposal.objects.create(owner=worker, order=order, message='Сделаю', price='100000')
+            proposal.status = ProposalStatusChoices.APPROVED
+            proposal.save()
+            job = Job.objects.get(proposal=proposal)
+            Review.objects.create(job=job, owner=self.customer, whom=cv, rating=5, comment='Отлично')
+            Review.objects.create(job=job, owner=worker, whom=self.customer_cv, rating=4, comment='Хорошо')
+            Appeal.objects.create(job=job, owner=self.customer, whom=cv, problem='Опоздал', to=AppealTypeChoices.JOB)
+        self.client.force_authenticate(user=self.admin)
+
+    def assertWithinBudget(self, url, params=None):
+        match = resolve(url)
+        view_class, action = resolve_view(match.func, 'GET')
+        with QueryRecorder() as recorder:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+        self.assertIsNotNone(get_query_budget(view_class, action), f'{view_class.__name__}.{action}')
+        self.assertEqual(check_queries(recorder, view_class, action), [])
+        return recorder
+
+    def test_list_endpoints(self):
+        for name in ('user-list', 'passport-list', 'bank-card-list', 'cv-list', 'category-list', 'order-list',
+                     'proposal-list', 'job-list', 'appeal-list', 'review-list'):
+            with self.subTest(name):
+                self.assertWithinBudget(reverse(name))
+                self.assertWithinBudget(reverse(name), {'pagination': 'cursor'})
+
+    def test_detail_endpoints(self):
+        for name, pk in (('user-detail', self.worker.pk), ('cv-detail', self.customer_cv.pk), ('order-detail', self.order.pk),
+                         ('proposal-detail', self.proposal.pk), ('job-detail', self.job.pk), ('job-timeline', self.job.pk)):
+            with self.subTest(name):
+                self.assertWithinBudget(reverse(name, args=[pk]))
+
+    def test_feed(self):
+        self.client.force_authenticate(user=self.worker)
+        self.assertWithinBudget(reverse('order-feed'))
+        self.assertWithinBudget(reverse('order-feed'), {'search': 'заказ'})
+
+    @override_settings(QUERY_BUDGET_ENABLED=True)
+    def test_middleware_logs_budget_overrun(self):
+        with mock.patch.object(CategoryViewSet, 'query_budget', 0), self.assertLogs('users.queries', 'WARNING') as logs:
+            response = self.client.get(reverse('category-list'))
+        self.assertIn('X-Query-Count', response)
+        self.assertIn('CategoryViewSet.list', logs.output[0])
+
+    def test_report_lists_budgets(self):
+        out = StringIO()
+        call_command('query_budget_report', '--app', 'users', '--app', 'stats', '--strict', stdout=out)
+        self.assertIn('^orders/feed/$', out.getvalue())
+
+
+class PrefetchPlanTestCases(MarketplaceTestCase):
+    """
+    План загрузки из дерева сериализатора: число запросов списка не зависит от числа строк,
+    а данные те же, что и без плана.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(user_id='8100001', password='testpassword', roles=['Admin'])
+        self.add_jobs(2)
+        self.client.force_authenticate(user=self.admin)
+
+    def add_jobs(self, count):
+        for index in range(count):
+            worker = User.objects.create_user(user_id=f'82{User.objects.count():05d}', password='testpassword', roles=['Worker'])
+            cv = Cv.objects.create(owner=worker, bio='Мастер')
+            order = Order.objects.create(owner=self.customer, category=self.category, description='Заказ', location='Чиланзар', price='100000')
+            proposal = Proposal.objects.create(owner=worker, order=order, message='Сделаю', price='100000')
+            proposal.status = ProposalStatusChoices.APPROVED
+            proposal.save()
+            job = Job.objects.get(proposal=proposal)
+            Review.objects.create(job=job, owner=self.customer, whom=cv, rating=5, comment='Отлично')
+            Appeal.objects.create(job=job, owner=worker, whom=self.customer_cv, problem='Не отвечает', to=AppealTypeChoices.JOB)
+
+    def test_plan_follows_serializer(self):
+        plan = plan_for(JobSerializer)
+        self.assertEqual(set(plan.prefetches), {'appeals', 'reviews'})
+        self.assertEqual(plan.prefetches['reviews'].select_related, {'whom', 'whom__owner'})
+        self.assertIn('whom__owner__user_id', plan.prefetches['reviews'].only)
+        self.assertNotIn('whom__owner__password', plan.prefetches['reviews'].only)
+        self.assertEqual(plan_for(UserSerializer).select_related, {'bank_card', 'cv'})
+        self.assertNotIn('search_vector', plan_for(OrderSerializer).only)
+
+    def test_list_queries_do_not_grow(self):
+        for name in ('job-list', 'order-list', 'user-list', 'cv-list', 'review-list', 'appeal-list'):
+            with self.subTest(name):
+                with QueryRecorder() as before:
+                    self.client.get(reverse(name))
+                self.add_jobs(3)
+                with QueryRecorder() as after:
+                    response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(after.count, before.count)
+
+    def test_same_data_as_unplanned_queryset(self):
+        jobs = Job.objects.order_by('id')
+        self.assertEqual(
+            JobSerializer(plan_for(JobSerializer).apply(jobs), many=True).data,
+            JobSerializer(jobs, many=True).data,
+        )
+        users = User.objects.order_by('id')
+        self.assertEqual(
+            UserSerializer(plan_for(UserSerializer).apply(users), many=True).data,
+            UserSerializer(users, many=True).data,
+        )
+
+
+class FieldSelectionTestCases(MarketplaceTestCase):
+    """
+    ?fields= и ?expand= урезают ответ до загрузки данных, вложенные коллекции ограничены.
+    """
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.client.force_authenticate(user=self.customer)
+
+    def test_sparse_fields_skip_relations(self):
+        url = reverse('order-detail', args=[self.order.pk])
+        with QueryRecorder() as full:
+            self.client.get(url)
+        cache.clear()
+        with QueryRecorder() as sparse:
+            response = self.client.get(url, {'fields': 'id,description'})
+        self.assertEqual(response.data, {'id': self.order.pk, 'description': 'Починить кран'})
+        self.assertLess(sparse.count, full.count)
+        self.assertFalse(any('users_proposal' in sql for sql, _ in sparse.queries))
+
+    def test_nested_fields(self):
+        response = self.client.get(reverse('user-detail', args=[self.customer.pk]), {'fields': 'id,cv.bio'})
+        self.assertEqual(response.data, {'id': self.customer.pk, 'cv': {'bio': 'Заказчик'}})
+
+    def test_expand(self):
+        response = self.client.get(reverse('order-detail', args=[self.order.pk]), {'fields': 'id,category', 'expand': 'category'})
+        self.assertEqual(response.data['category'], {'id': self.category.pk, 'name': 'Сантехника'})
+        response = self.client.get(reverse('job-detail', args=[self.job.pk]), {'fields': 'id,order.description', 'expand': 'order'})
+        self.assertEqual(response.data, {'id': self.job.pk, 'order': {'description': 'Починить кран'}})
+
+    def test_unknown_fields_rejected(self):
+        url = reverse('order-list')
+        self.assertEqual(self.client.get(url, {'fields': 'id,secret'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'expand': 'owner'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'fields': 'id.pk'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_nested_collections_capped(self):
+        for index in range(NESTED_LIMIT + 5):
+            Proposal.objects.create(owner=self.worker, order=self.order, message=f'Отклик {index}', price='150000')
+        response = self.client.get(reverse('order-detail', args=[self.order.pk]))
+        self.assertEqual(len(response.data['proposals']), NESTED_LIMIT)
+        self.assertEqual(response.data['proposals'][0]['id'], self.proposal.pk)
+
+
+class DenormalizedCounterTestCases(MarketplaceTestCase):
+    """
+    Order.proposal_count и Cv.appeal_count меняются вместе с откликами и жалобами.
+    """
+
+    def test_proposal_count_follows_status(self):
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.proposal_count, 1)
+
+        self.client.force_authenticate(user=self.worker)
+        proposal = Proposal.objects.create(owner=self.worker, order=self.order, message='Ещё', price='150000')
+        self.client.patch(reverse('proposal-cancel-proposal', args=[proposal.pk]))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.proposal_count, 1)
+
+        self.client.patch(reverse('proposal-restore-proposal', args=[proposal.pk]))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.proposal_count, 2)
+
+        proposal.delete()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.proposal_count, 1)
+
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.get(reverse('order-detail', args=[self.order.pk]), {'fields': 'id,proposal_count'})
+        self.assertEqual(response.data, {'id': self.order.pk, 'proposal_count': 1})
+
+    def test_appeal_and_review_counts(self):
+        appeal = Appeal.objects.create(job=self.job, owner=self.customer, whom=self.worker_cv, problem='Опоздал', to=AppealTypeChoices.JOB)
+        Review.objects.create(job=self.job, owner=self.customer, whom=self.worker_cv, rating=5)
+        self.worker_cv.apply_rating_change(5, 1)
+
+        self.client.force_authenticate(user=self.worker)
+        with QueryRecorder() as recorder:
+            response = self.client.get(reverse('cv-detail', args=[self.worker_cv.pk]), {'fields': 'appeals,review_count'})
+        self.assertEqual(response.data, {'appeals': 1, 'review_count': 1})
+        self.assertFalse(any('users_appeal' in sql or 'users_review' in sql for sql, _ in recorder.queries))
+
+        appeal.delete()
+        self.worker_cv.refresh_from_db()
+        self.assertEqual(self.worker_cv.appeal_count, 0)
+
+    def test_reconcile_fixes_drift(self):
+        Order.objects.filter(pk=self.order.pk).update(proposal_count=7)
+        Appeal.objects.bulk_create([Appeal(job=self.job, owner=self.customer, whom=self.worker_cv, to=AppealTypeChoices.JOB)])
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+
+        self.order.refresh_from_db()
+        self.worker_cv.refresh_from_db()
+        self.assertEqual(self.order.proposal_count, 1)
+        self.assertEqual(self.worker_cv.appeal_count, 1)
+        self.assertIn('Order.proposal_count: 1 checked, 1 drifted', out.getvalue())
+
+
+@override_settings(TIME_ZONE='Asia/Tashkent')
+class DatabaseJSONParityTestCases(MarketplaceTestCase):
+    """
+    Страницы, собранные в Postgres (DB_JSON_RENDERING), совпадают с ответом сериализаторов байт в байт.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(user_id='8300001', password='testpassword', roles=['Admin'])
+        tricky = 'Кран "течёт" \\ C:\\путь\n\tтаб \x01 \u2028 \u2029 😀 </script> 50%'
+        order = Order.objects.create(owner=self.customer, category=self.category, description=tricky, location="Юнусабад 'А'",
+                                     location_link='https://maps.google.com/?q=41.3,69.2', price='1 500 000,50 сум')
+        Order.objects.filter(pk=order.pk).update(created_at=order.created_at.replace(microsecond=0))
+        Image.objects.create(order=order, image_file='order_images/фото 1 (копия).jpg')
+        Image.objects.create(order=order, image_file="order_images/a b+c%'~.png")
+        Image.objects.create(order=self.order, image_file='')
+        Video.objects.create(order=order, video_file='order_videos/clip.mp4')
+        Proposal.objects.create(owner=self.worker, order=order, message=tricky, price='договорная')
+        Review.objects.create(job=self.job, owner=self.customer, whom=self.worker_cv, rating=5, comment=None)
+        Appeal.objects.create(job=self.job, owner=self.customer, whom=self.worker_cv, problem=tricky, to=AppealTypeChoices.JOB)
+
+    def assertParity(self, url, params=None, user=None):
+        self.client.force_authenticate(user=user or self.admin)
+        cache.clear()
+        with override_settings(DB_JSON_RENDERING=False):
+            expected = self.client.get(url, params or {})
+        cache.clear()
+        with override_settings(DB_JSON_RENDERING=True):
+            actual = self.client.get(url, params or {})
+        self.assertEqual(actual.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(actual.data, RawJSON)
+        self.assertEqual(actual.content.decode(), expected.content.decode())
+        return actual
+
+    def test_lists_match_serializers(self):
+        for name in ('order-list', 'proposal-list', 'job-list'):
+            with self.subTest(name):
+                self.assertParity(reverse(name))
+                self.assertParity(reverse(name), {'pagination': 'cursor', 'page_size': 1})
+                self.assertParity(reverse(name), user=self.customer)
+
+    def test_sparse_and_expanded_fields(self):
+        self.assertParity(reverse('order-list'), {'fields': 'id,images,proposal_count', 'expand': 'category'})
+        self.assertParity(reverse('job-list'), {'fields': 'id,reviews.whom,appeals', 'expand': 'order'})
+
+    def test_empty_page(self):
+        response = self.assertParity(reverse('order-list'), {'min_price': '999999999999'})
+        self.assertEqual(response.json()['results'], [])
+
+    def test_cached_page_served_raw(self):
+        self.client.force_authenticate(user=self.admin)
+        cache.clear()
+        with override_settings(DB_JSON_RENDERING=True):
+            first = self.client.get(reverse('order-list'))
+            with QueryRecorder() as recorder:
+                second = self.client.get(reverse('order-list'))
+        self.assertEqual(second.content, first.content)
+        # Только агрегат для ETag (users.conditional), страница берётся из кэша.
+        order_queries = [sql for sql, _ in recorder.queries if 'users_order' in sql]
+        self.assertEqual(len(order_queries), 1)
+        self.assertIn('MAX(', order_queries[0])
+
+    def test_falls_back_to_serializer(self):
+        self.client.force_authenticate(user=self.admin)
+        with override_settings(DB_JSON_RENDERING=True):
+            response = self.client.get(reverse('order-list'), HTTP_ACCEPT='application/json; indent=2')
+            self.assertNotIsInstance(response.data, RawJSON)
+            response = self.client.get(reverse('user-list'))
+            self.assertNotIsInstance(response.data, RawJSON)
+
+
+class FragmentCacheTestCases(MarketplaceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(user_id='8400001', password='testpassword', roles=['Admin'])
+        for rating in (3, 4, 5):
+            Review.objects.create(job=self.job, owner=self.customer, whom=self.worker_cv, rating=rating, comment=f'Отзыв {rating}')
+        self.client.force_authenticate(user=self.admin)
+
+    def test_list_reads_fragments_in_one_batch(self):
+        reviews = list(Review.objects.order_by('pk'))
+        build = mock.patch.object(FragmentCacheMixin, 'build_fragment', autospec=True, side_effect=FragmentCacheMixin.build_fragment)
+        with build as built, mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            first = ReviewSerializer(reviews, many=True).data
+            second = ReviewSerializer(reviews, many=True).data
+        self.assertEqual(second, first)
+        self.assertEqual(built.call_count, len(reviews))
+        self.assertEqual(get_many.call_count, 2)
+        self.assertEqual([item['comment'] for item in second], ['Отзыв 3', 'Отзыв 4', 'Отзыв 5'])
+
+    def test_fragments_follow_row_version(self):
+        url = reverse('user-detail', args=[self.worker.pk])
+        self.assertEqual(self.client.get(url).json()['cv']['review_count'], 0)
+
+        self.worker_cv.apply_rating_change(5, 1)
+        shift_counter(Cv, self.worker_cv.pk, 'appeal_count', 2)
+        self.worker.first_name = 'Акмаль'
+        self.worker.save(update_fields=['first_name'])
+        review = Review.objects.order_by('pk').first()
+        review.comment = 'Исправлено'
+        review.save()
+
+        data = self.client.get(url).json()
+        self.assertEqual(data['first_name'], 'Акмаль')
+        self.assertEqual(data['cv']['review_count'], 1)
+        self.assertEqual(data['cv']['appeals'], 2)
+        self.assertIn('Исправлено', [item['comment'] for item in data['cv']['reviews']])
+
+    def test_fields_read_through_relations_are_not_cached(self):
+        url = reverse('review-list')
+        self.assertEqual({str(item['whom']) for item in self.client.get(url).json()['results']}, {self.worker.user_id})
+        self.worker.user_id = '5000099'
+        self.worker.save(update_fields=['user_id'])
+        self.assertEqual({str(item['whom']) for item in self.client.get(url).json()['results']}, {'5000099'})
+
+    def test_expanded_category_is_refreshed(self):
+        url = reverse('order-list')
+        self.client.get(url, {'expand': 'category'})
+        self.category.name = 'Электрика'
+        self.category.save()
+        results = self.client.get(url, {'expand': 'category'}).json()['results']
+        self.assertEqual({item['category']['name'] for item in results}, {'Электрика'})
+        self.assertNotIn('row_version', results[0]['category'])
+
+
+class ConditionalGetTestCases(MarketplaceTestCase):
+
+    def get(self, url, user=None, **headers):
+        self.client.force_authenticate(user=user or self.customer)
+        return self.client.get(url, **headers)
+
+    def test_not_modified_before_serialization(self):
+        url = reverse('job-list')
+        response = self.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+
+        with QueryRecorder() as recorder, mock.patch.object(JobSerializer, 'to_representation') as to_representation:
+            response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(recorder.count, 1)
+        to_representation.assert_not_called()
+
+    def test_nested_changes_update_etag(self):
+        order_url = reverse('order-detail', args=[self.order.pk])
+        job_url = reverse('job-detail', args=[self.job.pk])
+        order_etag = self.get(order_url)['ETag']
+        job_etag = self.get(job_url)['ETag']
+
+        Image.objects.create(order=self.order, image_file='order_images/new.jpg')
+        Review.objects.create(job=self.job, owner=self.customer, whom=self.worker_cv, rating=5)
+
+        response = self.get(order_url, HTTP_IF_NONE_MATCH=order_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['images']), 1)
+        self.assertNotEqual(response['ETag'], order_etag)
+        response = self.get(job_url, HTTP_IF_NONE_MATCH=job_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], job_etag)
+
+    def test_expanded_relation_without_updated_at_changes_etag(self):
+        url = reverse('order-list')
+        self.client.force_authenticate(user=self.customer)
+        etag = self.client.get(url, {'expand': 'category'})['ETag']
+        self.category.name = 'Электрика'
+        self.category.save()
+        response = self.client.get(url, {'expand': 'category'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'][0]['category']['name'], 'Электрика')
+
+    def test_deletion_changes_list_etag(self):
+        Proposal.objects.create(owner=self.worker, order=Order.objects.create(
+            owner=self.customer, category=self.category, description='Ещё', location='Чиланзар', price='100'), message='Тоже', price='100')
+        url = reverse('proposal-list')
+        etag = self.get(url, user=self.worker)['ETag']
+        Proposal.objects.filter(message='Тоже').delete()
+        response = self.get(url, user=self.worker, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], 1)
+
+    def test_last_modified_only_on_detail(self):
+        response = self.get(reverse('order-detail', args=[self.order.pk]))
+        self.assertIn('Last-Modified', response)
+        self.assertNotIn('Last-Modified', self.get(reverse('order-list')))
+
+        response = self.get(reverse('order-detail', args=[self.order.pk]), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_depends_on_user_and_params(self):
+        url = reverse('job-list')
+        etag = self.get(url)['ETag']
+        self.assertNotEqual(self.get(url, user=self.worker)['ETag'], etag)
+        response = self.client.get(url, {'fields': 'id'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_missing_object_is_not_found(self):
+        self.assertEqual(self.get(reverse('order-detail', args=[999999])).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.get('/orders/abc/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SyncTestCases(APITransactionTestCase):
+    """
+    /sync/ видит только завершённые транзакции, поэтому тесты идут без обёртки TestCase в транзакцию.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create_user(user_id='8500001', password='testpassword', roles=['Customer'])
+        self.worker = User.objects.create_user(user_id='8500002', password='testpassword', roles=['Worker'])
+        self.outsider = User.objects.create_user(user_id='8500003', password='testpassword', roles=['Customer'])
+        self.admin = User.objects.create_user(user_id='8500004', password='testpassword', roles=['Admin'])
+        self.worker_cv = Cv.objects.create(owner=self.worker, bio='Сантехник')
+        Cv.objects.create(owner=self.customer, bio='Заказчик')
+        self.category = Category.objects.create(name='Сантехника')
+        self.order = Order.objects.create(owner=self.customer, category=self.category, description='Починить кран', location='Чиланзар', price='200000')
+
+    def sync(self, user, token=None):
+        self.client.force_authenticate(user=user)
+        response = self.client.get(reverse('sync'), {'since': token} if token else {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def updated_ids(self, data, entity):
+        return [item['id'] for item in data['changes'][entity]['updated']]
+
+    def test_changes_are_filtered_by_audience(self):
+        tokens = {user.pk: self.sync(user)['token'] for user in (self.customer, self.worker, self.outsider, self.admin)}
+        proposal = Proposal.objects.create(owner=self.worker, order=self.order, message='Сделаю', price='200000')
+        proposal.status = ProposalStatusChoices.APPROVED
+        proposal.save()
+        job = Job.objects.get(proposal=proposal)
+
+        customer = self.sync(self.customer, tokens[self.customer.pk])
+        self.assertEqual(self.updated_ids(customer, 'orders'), [self.order.pk])
+        self.assertEqual(customer['changes']['orders']['updated'][0]['proposal_count'], 1)
+        self.assertEqual(self.updated_ids(customer, 'proposals'), [])
+        self.assertEqual(self.updated_ids(customer, 'jobs'), [job.pk])
+
+        worker = self.sync(self.worker, tokens[self.worker.pk])
+        self.assertEqual(self.updated_ids(worker, 'orders'), [])
+        self.assertEqual(self.updated_ids(worker, 'proposals'), [proposal.pk])
+        self.assertEqual(self.updated_ids(worker, 'jobs'), [job.pk])
+
+        self.assertEqual(self.sync(self.outsider, tokens[self.outsider.pk])['changes']['orders']['updated'], [])
+        self.assertEqual(self.updated_ids(self.sync(self.admin, tokens[self.admin.pk]), 'proposals'), [proposal.pk])
+
+        # Новый токен не повторяет уже выданное.
+        again = self.sync(self.worker, worker['token'])
+        self.assertEqual(again['changes']['proposals'], {'updated': [], 'deleted': []})
+
+    def test_deletes_and_updates_without_save(self):
+        proposal = Proposal.objects.create(owner=self.worker, order=self.order, message='Сделаю', price='200000')
+        proposal.status = ProposalStatusChoices.APPROVED
+        proposal.save()
+        job = Job.objects.get(proposal=proposal)
+        token = self.sync(self.worker)['token']
+
+        self.assertTrue(job.transition(JobStatusChoices.PAYMENT))
+        data = self.sync(self.worker, token)
+        self.assertEqual(data['changes']['jobs']['updated'][0]['status'], JobStatusChoices.PAYMENT)
+
+        Review.objects.create(job=job, owner=self.worker, whom=self.worker_cv, rating=5)
+        review_id = Review.objects.get().pk
+        Review.objects.all().delete()
+        data = self.sync(self.worker, data['token'])
+        self.assertEqual(data['changes']['reviews'], {'updated': [], 'deleted': [review_id]})
+
+    def test_uncommitted_changes_wait_for_commit(self):
+        token = self.sync(self.customer)['token']
+        with transaction.atomic():
+            Order.objects.filter(pk=self.order.pk).update(description='Новое описание')
+            self.assertEqual(self.sync(self.customer, token)['changes']['orders']['updated'], [])
+        data = self.sync(self.customer, token)
+        self.assertEqual(data['changes']['orders']['updated'][0]['description'], 'Новое описание')
+
+    def test_pages_through_large_backlog(self):
+        token = self.sync(self.customer)['token']
+        for index in range(3):
+            Order.objects.filter(pk=self.order.pk).update(location=f'Адрес {index}')
+        with mock.patch.object(sync, 'SYNC_LIMIT', 2):
+            first = self.sync(self.customer, token)
+            second = self.sync(self.customer, first['token'])
+        self.assertTrue(first['has_more'])
+        self.assertFalse(second['has_more'])
+        self.assertEqual(second['changes']['orders']['updated'][0]['location'], 'Адрес 2')
+
+    def test_invalid_and_expired_tokens(self):
+        self.client.force_authenticate(user=self.customer)
+        self.assertEqual(self.client.get(reverse('sync'), {'since': 'abc'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('sync'), {'since': '1.0.1000'}).status_code, status.HTTP_410_GONE)
+
+    def test_prune_changelog(self):
+        ChangeLog.objects.update(created_at=timezone.now() - sync.CHANGELOG_RETENTION - timedelta(days=1))
+        Order.objects.filter(pk=self.order.pk).update(location='Юнусабад')
+        call_command('prune_changelog', stdout=StringIO())
+        self.assertEqual(list(ChangeLog.objects.values_list('entity', 'object_id')), [('orders', self.order.pk)])
+
+
+class EventPublishTestCases(MarketplaceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        OutboxEvent.objects.all().delete()
+
+    def test_events_are_published_by_relay(self):
+        other_order = Order.objects.create(owner=self.customer, category=self.category, description='Ещё', location='Чиланзар', price='100')
+        with mock.patch('users.signals.publish') as published:
+            proposal = Proposal.objects.create(owner=self.worker, order=other_order, message='Сделаю', price='100')
+            published.assert_not_called()
+            relay()
+        published.assert_called_once_with([self.customer.pk], 'proposal.created', {'order': other_order.pk, 'proposal': proposal.pk})
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_job_events_reach_both_participants(self):
+        job = Job.objects.get(pk=self.job.pk)
+        job.transition(JobStatusChoices.PAYMENT)
+        job.set_payment_status('customer', PaymentStatusChoices.APPROVED)
+        with mock.patch('users.signals.publish') as published:
+            relay()
+        events = [(sorted(call.args[0]), call.args[1]) for call in published.call_args_list]
+        participants = sorted([self.customer.pk, self.worker.pk])
+        self.assertEqual(events, [(participants, 'job.status_changed'), (participants, 'job.payment_confirmed')])
+        self.assertEqual(published.call_args_list[0].args[2]['to_status'], JobStatusChoices.PAYMENT)
+
+
+class OutboxRelayTestCases(MarketplaceTestCase):
+
+    def test_events_are_recorded_with_the_change(self):
+        events = list(OutboxEvent.objects.order_by('pk').values_list('aggregate_type', 'aggregate_id', 'event_type'))
+        self.assertEqual(events, [
+            ('order', self.order.pk, 'order.created'),
+            ('proposal', self.proposal.pk, 'proposal.created'),
+            ('job', self.job.pk, 'job.created'),
+            ('job', self.job.pk, 'job.status_changed'),
+        ])
+        with self.assertRaises(ValueError), transaction.atomic():
+            Order.objects.create(owner=self.customer, category=self.category, description='Откат', location='Чиланзар', price='100')
+            raise ValueError
+        self.assertEqual(OutboxEvent.objects.count(), 4)
+
+    def test_failed_event_holds_back_only_its_aggregate(self):
+        calls = []
+
+        def handler(event):
+            calls.append((event.event_type, event.aggregate_id))
+            if event.event_type == 'job.created' and len([call for call in calls if call[0] == 'job.created']) == 1:
+                raise RuntimeError('broker is down')
+
+        with mock.patch.dict(outbox.HANDLERS, clear=True):
+            for event_type in ('order.created', 'proposal.created', 'job.created', 'job.status_changed'):
+                outbox.HANDLERS[event_type] = [handler]
+            with self.assertLogs('users.outbox', 'ERROR'):
+                self.assertEqual(relay(batch_size=2), 2)
+            self.assertEqual(calls, [('order.created', self.order.pk), ('proposal.created', self.proposal.pk), ('job.created', self.job.pk)])
+            failed = OutboxEvent.objects.get(event_type='job.created')
+            self.assertEqual(failed.attempts, 1)
+            self.assertIn('broker is down', failed.last_error)
+
+            self.assertEqual(relay(), 2)
+            self.assertEqual(calls[3:], [('job.created', self.job.pk), ('job.status_changed', self.job.pk)])
+        self.assertFalse(OutboxEvent.objects.exists())
+
+
+class OutboxConcurrencyTestCases(APITransactionTestCase):
+    """
+    Два relay на разных соединениях: блокировки видны только между настоящими транзакциями.
+    """
+
+    def setUp(self):
+        cache.clear()
+        customer = User.objects.create_user(user_id='8600001', password='testpassword', roles=['Customer'])
+        self.category = Category.objects.create(name='Сантехника')
+        self.orders = [
+            Order.objects.create(owner=customer, category=self.category, description=f'Заказ {index}', location='Чиланзар', price='100')
+            for index in range(2)
+        ]
+        with transaction.atomic():
+            outbox.record_event('order', self.orders[0].pk, 'order.closed')
+
+    def test_locked_aggregate_is_skipped(self):
+        claimed, release = threading.Event(), threading.Event()
+
+        def hold():
+            try:
+                with transaction.atomic():
+                    outbox.claim_batch(batch_size=1)
+                    claimed.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        try:
+            self.assertTrue(claimed.wait(10))
+            with mock.patch.dict(outbox.HANDLERS, clear=True):
+                self.assertEqual(relay(), 1)
+            remaining = OutboxEvent.objects.values_list('aggregate_id', 'event_type')
+            self.assertEqual(sorted(remaining), [(self.orders[0].pk, 'order.closed'), (self.orders[0].pk, 'order.created')])
+        finally:
+            release.set()
+            holder.join()
+
+        with mock.patch.dict(outbox.HANDLERS, clear=True):
+            self.assertEqual(relay(), 2)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+class EventStreamTestCases(SimpleTestCase):
+
+    def setUp(self):
+        self.django_app = mock.AsyncMock()
+        self.app = EventStreamApp(self.django_app, redis_url=settings.CACHE_URL)
+        token = AccessToken()
+        token['user_id'] = 990001
+        self.token = str(token)
+
+    def scope(self, query=b''):
+        return {'type': 'http', 'method': 'GET', 'path': '/events/', 'query_string': query, 'headers': []}
+
+    def run_stream(self, scenario, query):
+        async def main():
+            sent = asyncio.Queue()
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            task = asyncio.ensure_future(self.app(self.scope(query), receive, sent.put))
+            try:
+                return await scenario(sent)
+            finally:
+                disconnect.set()
+                await asyncio.wait_for(task, 5)
+        return asyncio.run(main())
+
+    def test_streams_published_events(self):
+        async def scenario(sent):
+            start = await asyncio.wait_for(sent.get(), 5)
+            self.assertEqual(start['status'], 200)
+            self.assertEqual((await sent.get())['body'], b'retry: 5000\n\n')
+            connection = get_redis_connection('default')
+            for _ in range(50):
+                if dict(connection.pubsub_numsub(user_channel(990001)))[user_channel(990001).encode()]:
+                    break
+                await asyncio.sleep(0.05)
+            publish([990001, 990002], 'job.status_changed', {'job': 1, 'to_status': 'payment'})
+            return (await asyncio.wait_for(sent.get(), 5))['body']
+
+        body = self.run_stream(scenario, f'token={self.token}'.encode())
+        self.assertEqual(body, 'event: job.status_changed\ndata: {"job": 1, "to_status": "payment"}\n\n'.encode())
+        self.assertEqual(self.app.hub.listeners, {})
+
+    def test_rejects_invalid_token(self):
+        async def scenario(sent):
+            return (await asyncio.wait_for(sent.get(), 5))['status']
+
+        self.assertEqual(self.run_stream(scenario, b''), 401)
+        self.assertEqual(self.run_stream(scenario, b'token=broken'), 401)
+
+    def test_other_paths_go_to_django(self):
+        scope = {**self.scope(), 'path': '/orders/'}
+        asyncio.run(self.app(scope, None, None))
+        self.django_app.assert_awaited_once_with(scope, None, None)
+
+    def test_slow_client_gets_reset(self):
+        async def main():
+            hub = EventHub(settings.CACHE_URL)
+            queue = asyncio.Queue(maxsize=2)
+            hub.listeners[7] = {queue}
+            for index in range(3):
+                hub.dispatch({'channel': user_channel(7).encode(), 'data': b'frame'})
+            return [queue.get_nowait() for _ in range(queue.qsize())]
+
+        self.assertEqual(asyncio.run(main()), [None])
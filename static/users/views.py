@@ -1,17 +1,27 @@
 from rest_framework import generics, viewsets, mixins, status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.contrib.auth import get_user_model
-from .models import Passport, BankCard, Cv, Category, Order, Proposal, Job, Appeal, Review
-from .serializers import UserSerializer, PassportSerializer, BankCardSerializer, CvSerializer, CategorySerializer, \
-                        OrderSerializer, ProposalSerializer, JobSerializer, AppealSerializer, ReviewSerializer
+from .models import Passport, BankCard, Cv, Category, Order, Proposal, Job, Appeal, Review, Image, Video
+from .serializers import UserSerializer, UserSearchSerializer, PassportSerializer, BankCardSerializer, CvSerializer, CategorySerializer, \
+                        OrderSerializer, OrderFeedSerializer, ProposalSerializer, JobSerializer, JobStatusEventSerializer, AppealSerializer, ReviewSerializer
 from .permissions import IsAdmin
+from .cache import CachedResponseMixin
+from .prefetch import PrefetchPlanMixin
+from .dbjson import DatabaseJSONMixin
+from .conditional import ConditionalGetMixin
+from .feed import open_orders, first_page, with_absolute_urls
+from .search import search_users
+from .sync import sync_changes, current_token, parse_token, token_expired
 from rest_framework.response import Response
 from django.db.models import Q
-from .pagination import StandardResultsSetPagination
+from django.db import transaction
+from .pagination import SwitchablePagination, CreatedAtCursorPagination
 from django_filters.rest_framework import DjangoFilterBackend
-from .filters import CustomUserFilter, PassportFilter, OrderFilter, ProposalFilter, JobFilter, ReviewFilter, AppealFilter
+from .filters import CustomUserFilter, PassportFilter, OrderFilter, OrderFeedFilter, ProposalFilter, JobFilter, ReviewFilter, AppealFilter
 from .status import *
 from rest_framework.decorators import action
+from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
 
 User = get_user_model()
@@ -21,26 +31,50 @@ class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = (AllowAny,)
+    query_budget = 6
 
 
-class UserViewSet(mixins.RetrieveModelMixin,
+class SyncView(APIView):
+    """
+    GET /sync/ - токен текущего момента: его берут перед первой загрузкой списков.
+    GET /sync/?since=<token> - заказы, отклики, работы, отзывы и жалобы пользователя, созданные,
+    изменённые или удалённые после токена, и новый токен. Пока has_more, запрос повторяется сразу.
+    Токен старше срока хранения журнала - 410, списки нужно загрузить заново.
+    """
+    permission_classes = [IsAuthenticated]
+    query_budget = 14
+
+    def get(self, request, *args, **kwargs):
+        since = request.query_params.get('since')
+        if not since:
+            return Response({'token': current_token(), 'has_more': False, 'changes': {}})
+        if token_expired(parse_token(since)[2]):
+            return Response({"detail": "Sync token has expired, reload the lists."}, status=status.HTTP_410_GONE)
+        return Response(sync_changes(request, since))
+
+
+class UserViewSet(PrefetchPlanMixin,
+                  mixins.RetrieveModelMixin,
                   mixins.UpdateModelMixin,
                   mixins.DestroyModelMixin,
                   mixins.ListModelMixin,
                   viewsets.GenericViewSet):
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    query_budget = {'list': 5, 'retrieve': 6, 'search': 3, 'default': 8}
+    pagination_class = SwitchablePagination
+    cursor_ordering = ('-date_created', '-id')
     filter_backends = (DjangoFilterBackend,)
     filterset_class = CustomUserFilter
     queryset = User.objects.all()  
 
     def list(self, request, *args, **kwargs):
         user = request.user
-        if 'Admin' in user.roles:
-            queryset = User.objects.select_related('bank_card', 'cv').prefetch_related('cv__reviews', 'cv__appeals').order_by('id')
+        if user.has_role('Admin'):
+            queryset = User.objects.order_by('id')
         else:
-            queryset = User.objects.select_related('bank_card', 'cv').prefetch_related('cv__reviews', 'cv__appeals').filter(id=user.id)
+            queryset = User.objects.filter(id=user.id)
+        queryset = self.filter_queryset(queryset)
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -51,7 +85,7 @@ class UserViewSet(mixins.RetrieveModelMixin,
     def retrieve(self, request, *args, **kwargs):
         user = request.user
         instance = self.get_object()
-        if 'Admin' in user.roles or instance.id == user.id:
+        if user.has_role('Admin') or instance.id == user.id:
             serializer = self.get_serializer(instance)
             return Response(serializer.data)
         else:
@@ -61,27 +95,44 @@ class UserViewSet(mixins.RetrieveModelMixin,
     def add_role(self, request, pk=None):
         user = self.get_object()
 
-        if 'Worker' in user.roles and 'Customer' not in user.roles:
+        if user.has_role('Worker') and not user.has_role('Customer'):
             user.roles.append('Customer')
-        elif 'Customer' in user.roles and 'Worker' not in user.roles:
+        elif user.has_role('Customer') and not user.has_role('Worker'):
             user.roles.append('Worker')
         else:
             return Response({"detail": "У этого пользователя уже есть аккаунт с таким ролем"}, status=status.HTTP_400_BAD_REQUEST)
 
         user.save()
         return Response({"detail": "Role added successfully."}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsAdmin])
+    def search(self, request):
+        """
+        Поиск пользователей для поддержки: ?q=имя, телефон, @username или слова из CV; ?limit= до 50.
+        """
+        text = request.query_params.get('q', '').strip()
+        if len(text) < 3:
+            return Response({"detail": "Запрос должен содержать не менее 3 символов."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 50)
+        except ValueError:
+            limit = 20
+        serializer = UserSearchSerializer(search_users(text)[:limit], many=True)
+        return Response(serializer.data)
         
 
-class PassportViewSet(viewsets.ModelViewSet):
+class PassportViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     serializer_class = PassportSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    query_budget = {'list': 3, 'retrieve': 3, 'default': 6}
+    pagination_class = SwitchablePagination
+    cursor_ordering = ('-id',)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = PassportFilter
 
     def list(self, request, *args, **kwargs):
         user = request.user
-        if 'Admin' in user.roles:
+        if user.has_role('Admin'):
             queryset = Passport.objects.all()
         else:
             queryset = Passport.objects.filter(owner=user)
@@ -95,7 +146,7 @@ class PassportViewSet(viewsets.ModelViewSet):
     def retrieve(self, request, *args, **kwargs):
         user = request.user
         instance = self.get_object()
-        if 'Admin' in user.roles or instance.owner == user:
+        if user.has_role('Admin') or instance.owner_id == user.id:
             serializer = self.get_serializer(instance)
             return Response(serializer.data)
         else:
@@ -105,14 +156,16 @@ class PassportViewSet(viewsets.ModelViewSet):
         serializer.save(owner=self.request.user)
 
 
-class BankCardViewSet(viewsets.ModelViewSet):
+class BankCardViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     serializer_class = BankCardSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    query_budget = {'list': 3, 'retrieve': 3, 'default': 6}
+    pagination_class = SwitchablePagination
+    cursor_ordering = ('-id',)
 
     def list(self, request, *args, **kwargs):
         user = request.user
-        if 'Admin' in user.roles:
+        if user.has_role('Admin'):
             queryset = BankCard.objects.all()
         else:
             queryset = BankCard.objects.filter(owner=user)
@@ -126,14 +179,14 @@ class BankCardViewSet(viewsets.ModelViewSet):
     def retrieve(self, request, *args, **kwargs):
         user = request.user
         instance = self.get_object()
-        if 'Admin' in user.roles or instance.owner == user:
+        if user.has_role('Admin') or instance.owner_id == user.id:
             serializer = self.get_serializer(instance)
             return Response(serializer.data)
         else:
             return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
 
     def create(self, request, *args, **kwargs):
-        if 'Worker' not in request.user.roles:
+        if not request.user.has_role('Worker'):
             return Response({"detail": "Банк карту может создать только человек с ролью Worker."}, status=status.HTTP_403_FORBIDDEN)
         return super().create(request, *args, **kwargs)
 
@@ -141,18 +194,21 @@ class BankCardViewSet(viewsets.ModelViewSet):
         serializer.save(owner=self.request.user)
 
 
-class CvViewSet(viewsets.ModelViewSet):
+class CvViewSet(CachedResponseMixin, PrefetchPlanMixin, viewsets.ModelViewSet):
     serializer_class = CvSerializer
+    cache_models = (Cv, Review, Appeal)
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    query_budget = {'list': 5, 'retrieve': 5, 'default': 8}
+    pagination_class = SwitchablePagination
+    cursor_ordering = ('-id',)
     queryset = Cv.objects.all()  
 
     def list(self, request, *args, **kwargs):
         user = request.user
-        if 'Admin' in user.roles:
-            queryset = Cv.objects.select_related('owner').prefetch_related('reviews', 'appeals')
+        if user.has_role('Admin'):
+            queryset = Cv.objects.all()
         else:
-            queryset = Cv.objects.select_related('owner').prefetch_related('reviews', 'appeals').filter(owner=user)
+            queryset = Cv.objects.filter(owner=user)
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -163,7 +219,7 @@ class CvViewSet(viewsets.ModelViewSet):
     def retrieve(self, request, *args, **kwargs):
         user = request.user
         instance = self.get_object()
-        if 'Admin' in user.roles or instance.owner == user:
+        if user.has_role('Admin') or instance.owner_id == user.id:
             serializer = self.get_serializer(instance)
             return Response(serializer.data)
         else:
@@ -173,7 +229,7 @@ class CvViewSet(viewsets.ModelViewSet):
         user = request.user
         if Cv.objects.filter(owner=user).exists():
             return Response({"detail": "У пользователя уже существует CV."}, status=status.HTTP_400_BAD_REQUEST)
-        if 'Worker' not in user.roles and 'Customer' not in user.roles:
+        if not user.has_role('Worker', 'Customer'):
             return Response({"detail": "Резюме может создать только человек с ролью Worker или Customer."}, status=status.HTTP_403_FORBIDDEN)
         return super().create(request, *args, **kwargs)
 
@@ -181,23 +237,31 @@ class CvViewSet(viewsets.ModelViewSet):
         serializer.save(owner=self.request.user)
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(CachedResponseMixin, ConditionalGetMixin, DatabaseJSONMixin, viewsets.ModelViewSet):
     serializer_class = OrderSerializer
+    cache_models = (Order, Proposal, Image, Video, Category)
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    query_budget = {'list': 6, 'retrieve': 5, 'feed': 3, 'default': 12}
+    pagination_class = SwitchablePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = OrderFilter
 
     def get_queryset(self):
         user = self.request.user
-        if 'Admin' in user.roles:
-            queryset = Order.objects.all().select_related('owner', 'category').prefetch_related('proposals')
+        if user.has_role('Admin'):
+            queryset = Order.objects.all()
         else:
-            queryset = Order.objects.filter(owner=user).select_related('owner', 'category').prefetch_related('proposals')
+            queryset = Order.objects.filter(owner=user)
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        response = self.database_json_response(self.filter_queryset(self.get_queryset()))
+        if response is not None:
+            return response
+        return super().list(request, *args, **kwargs)
+
     def create(self, request, *args, **kwargs):
-        if 'Customer' not in request.user.roles:
+        if not request.user.has_role('Customer'):
             return Response({"detail": "Заказать может только человек с ролью Customer."}, status=status.HTTP_403_FORBIDDEN)
 
         if not Cv.objects.filter(owner=request.user).exists():
@@ -208,12 +272,38 @@ class OrderViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    @action(detail=False, methods=['get'], url_path='feed', pagination_class=CreatedAtCursorPagination)
+    def feed(self, request, *args, **kwargs):
+        """
+        Лента открытых заказов для работников: ?category=1,2, min_price/max_price, currency, search, near/radius_km.
+        Первая страница без фильтров по цене берётся из окон в Redis, остальные - из БД по частичному индексу.
+        С `search` выдача сортируется по релевантности с поправкой на свежесть.
+        """
+        if not request.user.has_role('Worker', 'Admin'):
+            return Response({"detail": "Лента заказов доступна только пользователям с ролью Worker."}, status=status.HTTP_403_FORBIDDEN)
+
+        filterset = OrderFeedFilter(request.query_params, queryset=open_orders(), request=request)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+
+        paginator = self.paginator
+        if filterset.form.cleaned_data.get('search'):
+            self.cursor_ordering = ('-search_score', '-id')
+        if set(request.query_params) <= {'category', 'page_size'}:
+            category_ids = [int(category_id) for category_id in filterset.form.cleaned_data.get('category') or []]
+            items, next_item = first_page(category_ids, paginator.get_page_size(request))
+            return paginator.get_window_response(with_absolute_urls(items, request), next_item, request, self)
+
+        page = paginator.paginate_queryset(filterset.qs, request, view=self)
+        serializer = OrderFeedSerializer(page, many=True)
+        return paginator.get_paginated_response(with_absolute_urls(serializer.data, request))
+
     @action(detail=True, methods=['post'], url_path='cancel')
     def deactivate_order(self, request, *args, **kwargs):
         order = self.get_object()
-        if request.user == order.owner or 'Admin' in request.user.roles:
+        if request.user == order.owner or request.user.has_role('Admin'):
             if order.status == OrderStatusChoices.OPEN:
-                order.status = OrderStatusChoices.CLOSED
+                order.status = OrderStatusChoices.Closed
                 order.save()
                 serializer = self.get_serializer(order)
                 return Response(serializer.data)
@@ -225,8 +315,8 @@ class OrderViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], url_path='restore')
     def activate_order(self, request, *args, **kwargs):
         order = self.get_object()
-        if request.user == order.owner or 'Admin' in request.user.roles:
-            if order.status == OrderStatusChoices.CLOSED:
+        if request.user == order.owner or request.user.has_role('Admin'):
+            if order.status == OrderStatusChoices.Closed:
                 order.status = OrderStatusChoices.OPEN
                 order.save()
                 serializer = self.get_serializer(order)
@@ -237,22 +327,26 @@ class OrderViewSet(viewsets.ModelViewSet):
             return Response({"detail": "You do not have permission to perform this action."}, status=status.HTTP_403_FORBIDDEN)
 
 
-class ProposalViewSet(viewsets.ModelViewSet):
+class ProposalViewSet(ConditionalGetMixin, DatabaseJSONMixin, viewsets.ModelViewSet):
     serializer_class = ProposalSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    query_budget = {'list': 3, 'retrieve': 3, 'default': 12}
+    pagination_class = SwitchablePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = ProposalFilter
 
     def get_queryset(self):
         user = self.request.user
-        if 'Admin' in user.roles:
+        if user.has_role('Admin'):
             return Proposal.objects.select_related('order').all()
         return Proposal.objects.select_related('order').filter(owner=user)
 
     def list(self, request, *args, **kwargs):
         user = request.user
-        queryset = self.get_queryset()
+        queryset = self.filter_queryset(self.get_queryset())
+        response = self.database_json_response(queryset)
+        if response is not None:
+            return response
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -263,7 +357,7 @@ class ProposalViewSet(viewsets.ModelViewSet):
     def retrieve(self, request, *args, **kwargs):
         user = request.user
         instance = self.get_object()
-        if 'Admin' in user.roles or instance.owner == user:
+        if user.has_role('Admin') or instance.owner_id == user.id:
             serializer = self.get_serializer(instance)
             return Response(serializer.data)
         return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
@@ -274,7 +368,7 @@ class ProposalViewSet(viewsets.ModelViewSet):
         if not Cv.objects.filter(owner=user).exists():
             return Response({"detail": "Для создания отклика у пользователя должен быть создан CV."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if 'Worker' not in user.roles:
+        if not user.has_role('Worker'):
             return Response({"detail": "Откликнуться может только человек с ролью Worker."}, status=status.HTTP_403_FORBIDDEN)
 
         order_id = request.data.get('order')
@@ -328,22 +422,41 @@ class ProposalViewSet(viewsets.ModelViewSet):
         return Response({"detail": "Proposal status updated to WAITING."}, status=status.HTTP_200_OK)
         
 
-class JobViewSet(viewsets.ReadOnlyModelViewSet):
+class JobViewSet(ConditionalGetMixin, DatabaseJSONMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = JobSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    query_budget = {'list': 5, 'retrieve': 4, 'timeline': 3, 'default': 12}
+    pagination_class = SwitchablePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = JobFilter
-    queryset = Job.objects.all() 
+    queryset = Job.objects.all()
 
-    def list(self, request, *args, **kwargs):
-        user = request.user
-        if 'Admin' in user.roles:
-            queryset = Job.objects.all().select_related('order', 'proposal', 'assignee').prefetch_related('appeals')
+    # retrieve и timeline проверяют, что пользователь - участник работы.
+    plan_related = ('order__owner_id', 'proposal__owner_id')
+
+    def get_queryset(self):
+        return Job.objects.select_related('order', 'proposal')
+
+    def get_list_queryset(self):
+        user = self.request.user
+        if user.has_role('Admin'):
+            queryset = Job.objects.all()
         else:
             queryset = Job.objects.filter(
                 Q(proposal__owner=user) | Q(order__owner=user)
-            ).select_related('order', 'proposal', 'assignee').prefetch_related('appeals')
+            )
+        return self.filter_queryset(queryset)
+
+    def get_conditional_queryset(self):
+        if self.detail:
+            return super().get_conditional_queryset()
+        return self.get_list_queryset()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_list_queryset()
+        response = self.database_json_response(queryset)
+        if response is not None:
+            return response
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -354,18 +467,30 @@ class JobViewSet(viewsets.ReadOnlyModelViewSet):
     def retrieve(self, request, *args, **kwargs):
         user = request.user
         instance = self.get_object()
-        if 'Admin' in user.roles or instance.proposal.owner == user or instance.order.owner == user:
+        if user.has_role('Admin') or instance.proposal.owner_id == user.id or instance.order.owner_id == user.id:
             serializer = self.get_serializer(instance)
             return Response(serializer.data)
         else:
             return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=True, methods=['get'], url_path='timeline')
+    def timeline(self, request, *args, **kwargs):
+        user = request.user
+        job = self.get_object()
+        if not (user.has_role('Admin') or job.proposal.owner_id == user.id or job.order.owner_id == user.id):
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        paginator = CreatedAtCursorPagination()
+        page = paginator.paginate_queryset(job.status_events.all(), request, view=self)
+        serializer = JobStatusEventSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=True, methods=['post'], url_path='work-done')
     def work_done(self, request, *args, **kwargs):
         job = self.get_object()
 
-        job.status = JobStatusChoices.PAYMENT
-        job.save()
+        if not job.transition(JobStatusChoices.PAYMENT):
+            return Response({"detail": "Job is not in progress."}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer = self.get_serializer(job)
         return Response(serializer.data)
@@ -376,8 +501,7 @@ class JobViewSet(viewsets.ReadOnlyModelViewSet):
         if request.user != job.order.owner:
             return Response({"detail": "Only the customer can confirm payment."}, status=status.HTTP_403_FORBIDDEN)
         
-        job.payment_confirmed_by_customer = PaymentStatusChoices.APPROVED
-        job.save()
+        job.set_payment_status('customer', PaymentStatusChoices.APPROVED)
         
         serializer = self.get_serializer(job)
         return Response(serializer.data)
@@ -388,8 +512,7 @@ class JobViewSet(viewsets.ReadOnlyModelViewSet):
         if request.user != job.assignee:
             return Response({"detail": "Only the worker can confirm payment."}, status=status.HTTP_403_FORBIDDEN)
         
-        job.payment_confirmed_by_worker = PaymentStatusChoices.APPROVED
-        job.save()
+        job.set_payment_status('worker', PaymentStatusChoices.APPROVED)
         
         serializer = self.get_serializer(job)
         return Response(serializer.data)
@@ -400,8 +523,7 @@ class JobViewSet(viewsets.ReadOnlyModelViewSet):
         if request.user != job.order.owner:
             return Response({"detail": "Only the customer can confirm payment."}, status=status.HTTP_403_FORBIDDEN)
         
-        job.payment_confirmed_by_customer = PaymentStatusChoices.PROBLEM
-        job.save()
+        job.set_payment_status('customer', PaymentStatusChoices.PROBLEM)
         
         serializer = self.get_serializer(job)
         return Response(serializer.data)
@@ -412,8 +534,7 @@ class JobViewSet(viewsets.ReadOnlyModelViewSet):
         if request.user != job.assignee:
             return Response({"detail": "Only the worker can confirm payment."}, status=status.HTTP_403_FORBIDDEN)
         
-        job.payment_confirmed_by_worker = PaymentStatusChoices.PROBLEM
-        job.save()
+        job.set_payment_status('worker', PaymentStatusChoices.PROBLEM)
         
         serializer = self.get_serializer(job)
         return Response(serializer.data)
@@ -433,10 +554,6 @@ class JobViewSet(viewsets.ReadOnlyModelViewSet):
         if job.status == job_status_choice.REVIEW:
             return Response({"detail": "Вы уже почти закончили работу, так как вы уже подтвердили что оплата закончена. Осталось только написать отзывы и окончить работу."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if job.status != job_status_choice.WARNING:
-            job.status = job_status_choice.WARNING
-            job.save()
-
         if appeal_type not in appeal_status_choice.values:
             return Response({"detail": "Invalid appeal type."}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -449,10 +566,15 @@ class JobViewSet(viewsets.ReadOnlyModelViewSet):
         }
 
         serializer = AppealSerializer(data=appeal_data, context={'request': request})
-        if serializer.is_valid():
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Переход в WARNING и жалоба - одной транзакцией: без перехода жалоба не создаётся.
+        with transaction.atomic():
+            if job.status != job_status_choice.WARNING and not job.transition(job_status_choice.WARNING):
+                return Response({"detail": f"Жалобу нельзя подать на работу в статусе {job.status}."}, status=status.HTTP_400_BAD_REQUEST)
             serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['post'], url_path='review')
     def review(self, request, *args, **kwargs):
@@ -462,49 +584,53 @@ class JobViewSet(viewsets.ReadOnlyModelViewSet):
         if job.status != JobStatusChoices.REVIEW:
             return Response({"detail": "Для создание отзыва, Job должен быть на статусе REVIEW."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if 'Customer' in user.roles:
-            if job.review_written_by_customer:
-                return Response({"detail": "Вы уже до этого писали отзыв."}, status=status.HTTP_400_BAD_REQUEST)
-            job.review_written_by_customer = True
-        elif 'Worker' in user.roles:
-            if job.review_written_by_worker:
-                return Response({"detail": "Вы уже до этого писали отзыв."}, status=status.HTTP_400_BAD_REQUEST)
-            job.review_written_by_worker = True
+        if user.has_role('Customer'):
+            side = 'customer'
+        elif user.has_role('Worker'):
+            side = 'worker'
         else:
             return Response({"detail": "Пользователь который пишет отзыв должен быть Работадателем или Работником"}, status=status.HTTP_403_FORBIDDEN)
 
         review_data = {
             'job': job.id,
-            'whom': job.proposal.owner.id if 'Customer' in user.roles else job.order.owner.id,
+            'whom': job.proposal.owner.id if user.has_role('Customer') else job.order.owner.id,
             'rating': request.data.get('rating'),
             'comment': request.data.get('comment', '')
         }
 
         serializer = ReviewSerializer(data=review_data, context={'request': request})
-        if serializer.is_valid():
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            if not job.mark_review_written(side):
+                return Response({"detail": "Вы уже до этого писали отзыв."}, status=status.HTTP_400_BAD_REQUEST)
             serializer.save()
-            job.save()  
-            return Response({"detail": "Review submitted successfully."}, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        job.complete_if_reviewed()
+        return Response({"detail": "Review submitted successfully."}, status=status.HTTP_200_OK)
         
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CachedResponseMixin, PrefetchPlanMixin, viewsets.ModelViewSet):
     serializer_class = CategorySerializer
+    cache_models = (Category,)
     permission_classes = [IsAuthenticated, IsAdmin]
+    query_budget = {'list': 3, 'retrieve': 3, 'default': 6}
     queryset = Category.objects.all()  
 
 
-class AppealViewSet(viewsets.ModelViewSet):
+class AppealViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     serializer_class = AppealSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    query_budget = {'list': 3, 'retrieve': 3, 'default': 8}
+    pagination_class = SwitchablePagination
+    cursor_ordering = ('-id',)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = AppealFilter
     queryset = Appeal.objects.all()  
 
     def list(self, request, *args, **kwargs):
         user = request.user
-        if 'Admin' in user.roles:
+        if user.has_role('Admin'):
             queryset = Appeal.objects.all()
         else:
             queryset = Appeal.objects.filter(owner=user)
@@ -518,24 +644,26 @@ class AppealViewSet(viewsets.ModelViewSet):
     def retrieve(self, request, *args, **kwargs):
         user = request.user
         instance = self.get_object()
-        if 'Admin' in user.roles or instance.owner == user:
+        if user.has_role('Admin') or instance.owner_id == user.id:
             serializer = self.get_serializer(instance)
             return Response(serializer.data)
         else:
             return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(PrefetchPlanMixin, viewsets.ModelViewSet):
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    query_budget = {'list': 3, 'retrieve': 3, 'default': 10}
+    pagination_class = SwitchablePagination
+    cursor_ordering = ('-id',)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = ReviewFilter
     queryset = Review.objects.all()
 
     def list(self, request, *args, **kwargs):
         user = request.user
-        if 'Admin' in user.roles:
+        if user.has_role('Admin'):
             queryset = Review.objects.all()
         else:
             queryset = Review.objects.filter(owner=user)
@@ -549,8 +677,13 @@ class ReviewViewSet(viewsets.ModelViewSet):
     def retrieve(self, request, *args, **kwargs):
         user = request.user
         instance = self.get_object()
-        if 'Admin' in user.roles or instance.owner == user:
+        if user.has_role('Admin') or instance.owner_id == user.id:
             serializer = self.get_serializer(instance)
             return Response(serializer.data)
         else:
-            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            instance.whom.apply_rating_change(-int(instance.rating), -1)